@@ -4,7 +4,8 @@ from django.contrib.auth.models import Group
 from django.utils.html import format_html
 from django.db.models import Q
 
-from .models import Employee, Job, Departament, Client, Project, Task
+from .models import Employee, Job, Departament, Client, Project, Task, OutgoingEmail
+from .pagination import EstimatedCountPaginator
 
 
 # Inline forms
@@ -57,8 +58,9 @@ class TeamInline(admin.TabularInline):
 class EmployeeAdmin(UserAdmin):
     list_display = ('full_name', 'email', 'manager', 'department', 'group', 'admin', 'is_active')
     list_display_links = ('full_name', 'email',)
+    list_select_related = ('manager', 'department', 'job', )
     list_filter = ('is_active', 'job', )
-    search_fields = ('email', 'full_name',)
+    search_fields = ('email', 'first_name', 'last_name',)
     ordering = ('first_name',)
     readonly_fields = []
     empty_value_display = 'Nenhum'
@@ -132,7 +134,7 @@ class EmployeeAdmin(UserAdmin):
         return user.get_full_name()
     full_name.short_description = 'Nome completo'
 
-    # Display user's groups
+    # Display user's groups (prefetched by get_queryset)
     def group(self, user):
         groups = []
         for group in user.groups.all():
@@ -152,10 +154,11 @@ class EmployeeAdmin(UserAdmin):
     staff.boolean = True
 
     # Display different list_display
-    def changelist_view(self, request, extra_content=None):
+    # (per request: assigning self.list_display would also change it for the superusers' next requests)
+    def get_list_display(self, request):
         if not request.user.is_superuser:
-            self.list_display = ('full_name', 'email', 'date_joined', 'is_active',)
-        return super(EmployeeAdmin, self).changelist_view(request, extra_content)
+            return ('full_name', 'email', 'date_joined', 'is_active',)
+        return super(EmployeeAdmin, self).get_list_display(request)
 
     # Display attributes of ForeignKey fields in list_display
     def job_max_salary(self, obj):
@@ -245,7 +248,8 @@ class EmployeeAdmin(UserAdmin):
 
     # Filter employees by manager
     def get_queryset(self, request):
-        employees = super(EmployeeAdmin, self).get_queryset(request)
+        # groups are read by the 'group' column of every changelist row
+        employees = super(EmployeeAdmin, self).get_queryset(request).prefetch_related('groups')
         if not request.user.is_superuser:
             if request.user.category == 'Admin':
                 return employees.filter(department=request.user.department)
@@ -311,6 +315,9 @@ class ProjectAdmin(admin.ModelAdmin):
     list_filter = ('status',)
     search_fields = ('title', 'client__name', )
     inlines = [TaskInline, ]
+    # Large tables: estimated instead of exact COUNT(*) (see EstimatedCountPaginator)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     # exclude = ('team',)
 
     def title_colored(self, obj):
@@ -378,10 +385,13 @@ admin.site.register(Project, ProjectAdmin)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('title_colored', 'project', 'priority', 'employee', 'due_date', 'status', 'working_hours',)
     actions = []
-    list_filter = ('project__title', 'priority', 'status', )
+    list_filter = ('project__title', 'priority', 'status', 'overdue', )
     search_fields = ('title', 'employee__first_name', 'employee__last_name', )
     # ordering = ('priority',)
     readonly_fields = ['created_at']
+    # Large tables: estimated instead of exact COUNT(*) (see EstimatedCountPaginator)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_project(self, obj):
         return obj.project
@@ -444,6 +454,16 @@ class JobAdmin(admin.ModelAdmin):
 admin.site.register(Job, JobAdmin)
 
 
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at',)
+    list_filter = ('status', )
+    search_fields = ('subject', 'recipients', )
+    readonly_fields = ['created_at', 'sent_at', 'last_error', ]
+
+
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
+
+
 admin.site.site_header = 'Empresa top 10'
 admin.site.site_title = 'Top 10'
 admin.site.index_title = 'Admin'
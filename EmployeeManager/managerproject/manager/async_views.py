@@ -0,0 +1,106 @@
+"""
+Async read paths of the hot list endpoints, for the ASGI application (managerproject.asgi). Requires
+asgiref 3.3+.
+
+Django 2.2 has neither an ASGI handler nor async views or ORM, so the async variants of TaskViewSet.list,
+ProjectViewSet.list and EmployeeListView.get (ASYNC_READ_VIEWS, by URL name) are coroutines around the
+sync views: the request is read and the response sent on the server's event loop, and the middleware and
+the view (queries, serialization, rendering) run behind one sync_to_async boundary, on a thread of the
+event loop's default executor, with its own database connection. Not thread sensitive, so the requests
+run in parallel as on a threaded WSGI server. The other requests (writes, uploads, streamed files) go to
+the WSGI application through asgiref's WsgiToAsgi, which runs them one at a time on a single thread.
+"""
+import io
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from django.core import signals
+from django.core.handlers import base
+from django.core.handlers.wsgi import WSGIRequest, get_script_name
+from django.urls import Resolver404, resolve, set_script_prefix
+
+ASYNC_READ_VIEWS = ('task-list', 'project-list', 'user-list')
+ASYNC_READ_METHODS = ('GET', 'HEAD')
+
+
+def wsgi_environ(scope):
+    """
+    The WSGI environ of an ASGI HTTP request without body.
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    path_info = path[len(root_path):] if root_path and path.startswith(root_path) else path
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path_info.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0], 'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': scope.get('scheme', 'http'), 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.BytesIO(), 'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_LENGTH', 'CONTENT_TYPE') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsyncReadHandler(base.BaseHandler):
+    """
+    ASGI application serving the GET and HEAD requests of ASYNC_READ_VIEWS with their async variant, and
+    the other requests with `wsgi_application`.
+    """
+    request_class = WSGIRequest
+
+    def __init__(self, wsgi_application):
+        super().__init__()
+        self.load_middleware()
+        self.fallback = WsgiToAsgi(wsgi_application)
+
+    def is_async_read(self, scope):
+        if scope['type'] != 'http' or scope['method'] not in ASYNC_READ_METHODS:
+            return False
+        try:
+            return resolve(wsgi_environ(scope)['PATH_INFO']).url_name in ASYNC_READ_VIEWS
+        except Resolver404:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if not self.is_async_read(scope):
+            return await self.fallback(scope, receive, send)
+        # A GET or HEAD body is ignored, as by the WSGI servers
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            if not message.get('more_body', False):
+                break
+
+        status, headers, content = await sync_to_async(self.get_read_response, thread_sensitive=False)(scope)
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': content if scope['method'] != 'HEAD' else b''})
+
+    def get_read_response(self, scope):
+        """
+        The sync part, on a thread of the pool: (status, headers, body) of the request, through the
+        middleware and the view, as WSGIHandler.
+        """
+        environ = wsgi_environ(scope)
+        set_script_prefix(get_script_name(environ))
+        # As WSGIHandler: request_started, and request_finished when the response is closed, close the
+        # database connection of the thread when it's too old (CONN_MAX_AGE)
+        signals.request_started.send(sender=self.__class__, environ=environ)
+        response = self.get_response(self.request_class(environ))
+        try:
+            content = b''.join(response) if response.streaming else response.content
+            headers = list(response.items()) + [('Set-Cookie', cookie.output(header=''))
+                                                for cookie in response.cookies.values()]
+        finally:
+            response.close()
+        return response.status_code, headers, content
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache(object):
+    """
+    Two level token -> user cache: a bounded in-process LRU with TTL in front of the shared Django cache.
+
+    Entries are stored as plain field values and rebuilt into new instances on every hit,
+    so requests never share (and mutate) the same user object.
+    Invalidation removes the entry from the shared cache and from this process' LRU; other processes
+    keep their local copy for at most `local_timeout` seconds.
+    """
+    key_prefix = 'manager:token:v2:'
+
+    def __init__(self, max_size=1024, local_timeout=10, timeout=300):
+        self.max_size = max_size
+        self.local_timeout = local_timeout
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.local_hits += 1
+                    return value
+                del self._entries[key]
+
+        value = cache.get(self.key_prefix + key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.shared_hits += 1
+                self._set_local(key, value, now)
+        return value
+
+    def set(self, key, value):
+        cache.set(self.key_prefix + key, value, self.timeout)
+        with self._lock:
+            self._set_local(key, value, time.monotonic())
+
+    def invalidate(self, *keys):
+        cache.delete_many([self.key_prefix + key for key in keys])
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self.local_hits = self.shared_hits = self.misses = 0
+        cache.delete_many([self.key_prefix + key for key in keys])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'hits': self.local_hits + self.shared_hits,
+                'misses': self.misses,
+            }
+
+    def _set_local(self, key, value, now):
+        self._entries[key] = (now + self.local_timeout, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_CACHE_MAX_SIZE', 1024),
+    local_timeout=getattr(settings, 'TOKEN_CACHE_LOCAL_TIMEOUT', 10),
+    timeout=getattr(settings, 'TOKEN_CACHE_TIMEOUT', 300),
+)
+
+
+# What the authentication and the permission checks read. The other fields (password hash, salary...) stay
+# out of the shared cache: they are deferred on the cached users and loaded if a view reads them.
+CACHED_USER_FIELDS = ('id', 'email', 'is_active', 'is_staff', 'is_superuser', 'category', 'manager', 'department')
+
+
+def cached_user_attnames():
+    # In the model's field order, which from_db expects
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.name in CACHED_USER_FIELDS]
+
+
+def dump_user(user):
+    return tuple(getattr(user, attname) for attname in cached_user_attnames())
+
+
+def load_user(values):
+    return get_user_model().from_db(None, cached_user_attnames(), values)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that resolves the token through `token_cache`,
+    so the Token/Employee query only runs on a cache miss.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            token_cache.set(key, (token.created, dump_user(user)))
+        else:
+            created, values = cached
+            user = load_user(values)
+            token = Token(key=key, user=user, created=created)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, token)
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .replicas import primary
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def version_key(model):
+    return 'manager:version:{0}'.format(model._meta.label_lower)
+
+
+def bump_version(model):
+    """
+    Gives the model a new version stamp, so every cached payload of it becomes stale.
+    Called by the model's save/delete signals and after bulk writes that skip them.
+    """
+    cache.set(version_key(model), uuid.uuid4().hex, None)
+
+
+class VersionedCacheMixin(object):
+    """
+    Caches the serialized 'list' and 'retrieve' payloads of a read-only viewset under its model's version stamp,
+    and answers them with a strong ETag (304 when it matches If-None-Match).
+    A hit costs one cache round-trip: the version stamp and the payload are fetched together.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.versioned_response(request, super(VersionedCacheMixin, self).list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.versioned_response(request, super(VersionedCacheMixin, self).retrieve, *args, **kwargs)
+
+    def versioned_response(self, request, handler, *args, **kwargs):
+        model = self.get_queryset().model
+        # The payload depends on the full URL (query parameters, absolute pagination links) and the renderer
+        key = 'manager:response:{0}:{1}'.format(
+            model._meta.label_lower,
+            hashlib.md5('{0} {1}'.format(request.build_absolute_uri(), request.accepted_media_type)
+                        .encode('utf-8')).hexdigest())
+        values = cache.get_many([version_key(model), key])
+        version = values.get(version_key(model))
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(version_key(model), version, None)
+        cached = values.get(key)
+
+        if cached is not None and cached[0] == version:
+            etag, data = cached[1:]
+            response = Response(data)
+        else:
+            # Cached under the current version until the next write: never read it from a lagging replica
+            with primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = json.dumps(response.data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+            etag = '"{0}"'.format(hashlib.md5(body.encode('utf-8')).hexdigest())
+            cache.set(key, (version, etag, response.data), RESPONSE_CACHE_TIMEOUT)
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
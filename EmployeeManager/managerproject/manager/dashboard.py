@@ -0,0 +1,75 @@
+"""
+Personal dashboard of the app home screen.
+
+The numbers come from one conditional aggregation query per model over the user's own tasks and projects
+(COUNT(...) FILTER (WHERE ...), or SUM(CASE WHEN ...) on databases without FILTER). The payload is cached per
+user for DASHBOARD_CACHE_TIMEOUT seconds and invalidated whenever one of the user's tasks changes: the Task
+signals, the bulk task helpers and the bulk status endpoint call invalidate_dashboards. Project changes
+(status, team) only reach the cached payloads when they expire, except the team changes of the user.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def dashboard_key(user_id):
+    return 'manager:dashboard:v2:{0}'.format(user_id)
+
+
+def invalidate_dashboards(*user_ids):
+    """
+    Drops the cached dashboards of the users, e.g. when their tasks change.
+    """
+    cache.delete_many([dashboard_key(user_id) for user_id in set(user_ids) if user_id is not None])
+
+
+def compute_dashboard(user, today):
+    """
+    Task counts by status and priority, overdue tasks, working hours of the tasks due this week (Monday
+    to Sunday; the hours aren't logged by date) and project counts by status: one query for the tasks,
+    one for the projects.
+    """
+    from .deadlines import OPEN_TASK_STATUSES
+    from .models import Project, Task
+
+    week_start = today - datetime.timedelta(days=today.weekday())
+    tasks = Task.objects.filter(employee=user).aggregate(
+        task_count=Count('id'),
+        overdue_tasks=Count('id', filter=Q(due_date__lt=today, status__in=OPEN_TASK_STATUSES)),
+        hours_due_this_week=Sum('working_hours', filter=Q(
+            due_date__gte=week_start, due_date__lt=week_start + datetime.timedelta(days=7))),
+        **{'status_' + value: Count('id', filter=Q(status=value)) for value, _ in Task.STATUS_CHOICES},
+        **{'priority_{0}'.format(value): Count('id', filter=Q(priority=value)) for value, _ in Task.PRIORITY_CHOICES}
+    )
+    projects = Project.objects.filter(team=user).aggregate(
+        project_count=Count('id'),
+        **{'status_' + value: Count('id', filter=Q(status=value)) for value, _ in Project.STATUS_CHOICES}
+    )
+    return {
+        'date': today,
+        'task_count': tasks['task_count'],
+        'tasks_by_status': {value: tasks['status_' + value] for value, _ in Task.STATUS_CHOICES},
+        'tasks_by_priority': {value: tasks['priority_{0}'.format(value)] for value, _ in Task.PRIORITY_CHOICES},
+        'overdue_tasks': tasks['overdue_tasks'],
+        'hours_due_this_week': tasks['hours_due_this_week'] or 0,
+        'project_count': projects['project_count'],
+        'projects_by_status': {value: projects['status_' + value] for value, _ in Project.STATUS_CHOICES},
+    }
+
+
+def get_dashboard(user):
+    """
+    The user's dashboard, from the cache when it was computed today.
+    """
+    today = timezone.localdate()
+    key = dashboard_key(user.id)
+    dashboard = cache.get(key)
+    if dashboard is None or dashboard['date'] != today:
+        dashboard = compute_dashboard(user, today)
+        cache.set(key, dashboard, DASHBOARD_CACHE_TIMEOUT)
+    return dashboard
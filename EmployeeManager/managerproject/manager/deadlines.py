@@ -0,0 +1,57 @@
+"""
+Late projects and overdue tasks.
+
+Two set-based UPDATEs, run by the flag_deadlines command (once, from cron, or in a loop): the projects
+still in progress past their end_date become LATE, and Task.overdue follows whether an open task is past
+its due_date. Each touches only the rows that change, found through the (status, end_date) and
+(overdue, due_date) indexes, and sets their updated_at so the sync endpoint sends them again.
+The numbers of rows changed are logged to 'manager.deadlines'.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Project, Task
+
+logger = logging.getLogger('manager.deadlines')
+
+# The tasks that can still be overdue
+OPEN_TASK_STATUSES = (Task.CREATED, Task.IN_PROGRESS, Task.ON_HOLD)
+
+
+def flag_late_projects(today=None):
+    """
+    Marks LATE the projects in progress whose end_date has passed; returns how many.
+    """
+    today = today or timezone.localdate()
+    return Project.objects.filter(status=Project.IN_PROGRESS, end_date__lt=today).update(
+        status=Project.LATE, updated_at=timezone.now())
+
+
+def flag_overdue_tasks(today=None):
+    """
+    Sets Task.overdue on the open tasks past their due_date and clears it on the others (completed,
+    canceled or postponed since); returns (flagged, cleared).
+    """
+    today = today or timezone.localdate()
+    now = timezone.now()
+    flagged = Task.objects.filter(overdue=False, due_date__lt=today, status__in=OPEN_TASK_STATUSES).update(
+        overdue=True, updated_at=now)
+    cleared = Task.objects.filter(overdue=True).exclude(due_date__lt=today, status__in=OPEN_TASK_STATUSES).update(
+        overdue=False, updated_at=now)
+    return flagged, cleared
+
+
+def flag_deadlines(today=None):
+    """
+    Runs both jobs in one transaction; returns and logs the numbers of rows changed.
+    """
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        late_projects = flag_late_projects(today)
+        overdue_tasks, cleared_tasks = flag_overdue_tasks(today)
+    counts = {'late_projects': late_projects, 'overdue_tasks': overdue_tasks, 'cleared_tasks': cleared_tasks}
+    logger.info("Deadlines of %s: %d late project(s), %d overdue task(s), %d task(s) no longer overdue",
+                today, late_projects, overdue_tasks, cleared_tasks)
+    return counts
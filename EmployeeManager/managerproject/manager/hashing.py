@@ -0,0 +1,140 @@
+"""
+Password hashing off the request threads.
+
+Hashing a password (PBKDF2 by default) costs tens of milliseconds of CPU by design, holding the GIL: a
+burst of logins starves the cheap requests of the process. The functions here run Django's hashers in a
+pool of PASSWORD_HASH_WORKERS processes, with at most PASSWORD_HASH_MAX_PENDING hashes queued or running
+per process. Past that, or after PASSWORD_HASH_TIMEOUT seconds, the request fails fast with a 503
+(PasswordHashingUnavailable) instead of queueing behind the rush. With PASSWORD_HASH_WORKERS = 0 they run
+inline. The benchmark_hashers command measures the hashes per second of each hasher, to size the pool.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.backends import ModelBackend
+from rest_framework import exceptions, status
+
+PASSWORD_HASH_WORKERS = getattr(settings, 'PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+PASSWORD_HASH_MAX_PENDING = getattr(settings, 'PASSWORD_HASH_MAX_PENDING', PASSWORD_HASH_WORKERS * 4)
+PASSWORD_HASH_TIMEOUT = getattr(settings, 'PASSWORD_HASH_TIMEOUT', 10)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(max(PASSWORD_HASH_MAX_PENDING, 1))
+
+
+class PasswordHashingUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Servidor ocupado, tente novamente em instantes.'
+    default_code = 'password_hashing_unavailable'
+    wait = 1  # seconds, sent as Retry-After
+
+
+def make_executor(max_workers, mp_context=None):
+    """
+    A pool of processes for the hashers. Each worker sets Django up first: with the spawn and forkserver
+    start methods they start from scratch, and unpickling the functions of this module imports the auth models.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context, initializer=django.setup)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = make_executor(PASSWORD_HASH_WORKERS)
+    return _executor
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def run(function, *args):
+    """
+    function(*args) in the pool, or PasswordHashingUnavailable when the pool is full or too slow.
+    """
+    if not PASSWORD_HASH_WORKERS:
+        return function(*args)
+    if not _pending.acquire(blocking=False):
+        raise PasswordHashingUnavailable()
+
+    executor = get_executor()
+    try:
+        future = executor.submit(function, *args)
+    except BrokenProcessPool:
+        _pending.release()
+        _reset_executor(executor)
+        raise PasswordHashingUnavailable()
+    # Released when the hash is done, even if the request gave up waiting for it
+    future.add_done_callback(lambda future: _pending.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except TimeoutError:
+        raise PasswordHashingUnavailable()
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        raise PasswordHashingUnavailable()
+
+
+def _check_password(password, encoded):
+    """
+    Django's check_password, plus whether the hash must be upgraded (the setter can't cross processes).
+    """
+    upgrades = []
+    return hashers.check_password(password, encoded, setter=upgrades.append), bool(upgrades)
+
+
+def make_password(password):
+    return run(hashers.make_password, password)
+
+
+def set_password(user, raw_password):
+    """
+    user.set_password(raw_password), hashing in the pool.
+    """
+    user.password = make_password(raw_password)
+    user._password = raw_password
+
+
+def check_password(user, raw_password):
+    """
+    user.check_password(raw_password), verifying in the pool; also upgrades the stored hash when the
+    hasher settings changed.
+    """
+    correct, must_update = run(_check_password, raw_password, user.password)
+    if correct and must_update:
+        set_password(user, raw_password)
+        user._password = None
+        user.save(update_fields=['password'])
+    return correct
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend verifying the password in the pool: the login endpoint and the admin use it.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway, so the response time doesn't tell whether the user exists
+            make_password(password)
+        else:
+            if check_password(user, password) and self.user_can_authenticate(user):
+                return user
+        return None
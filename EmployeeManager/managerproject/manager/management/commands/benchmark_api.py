@@ -0,0 +1,168 @@
+# manager/management/commands/benchmark_api
+
+import json
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+from manager.authentication import token_cache
+from manager.models import Employee, Departament, Job, Client as ClientModel, Project, Task
+from manager.management.commands.seed_benchmark_data import BENCHMARK_PASSWORD
+
+# name, method, URL; the GETs are made by a manager with reports (Token authentication)
+ENDPOINTS = (
+    ('projects', 'get', '/api/v1/projects/'),
+    ('tasks', 'get', '/api/v1/tasks/'),
+    ('users', 'get', '/api/v1/users/'),
+    ('login', 'post', '/api/v1/login/'),
+)
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    values = sorted(values)
+    rank = max(int(round(percent / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def benchmark_user():
+    """
+    A manager of the second level: has reports, projects and tasks to list, like most API users.
+    """
+    director = Employee.objects.filter(manager=None).order_by('id').first()
+    user = Employee.objects.filter(manager=director).order_by('id').first() or director
+    if user is None:
+        raise CommandError("No employees: run seed_benchmark_data first.")
+    return user
+
+
+def measure(client, method, url, requests, warmup, **kwargs):
+    """
+    Runs the request `warmup` + `requests` times; returns latency percentiles (ms), the queries per request
+    (from QueryInstrumentationMiddleware) and the peak memory allocated by one request (traced separately,
+    tracing slows requests down).
+    """
+    latencies = []
+    queries = []
+    for run in range(warmup + requests):
+        # Every request pays the token lookup, as with requests spread over processes
+        token_cache.clear()
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise CommandError("{0} {1}: HTTP {2}".format(method.upper(), url, response.status_code))
+        if run >= warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(response.query_recorder.count)
+
+    token_cache.clear()
+    tracemalloc.start()
+    getattr(client, method)(url, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'queries': max(queries),
+        'peak_memory_kb': round(peak / 1024.0, 1),
+    }
+
+
+@contextmanager
+def benchmark_database():
+    """
+    A throwaway test database, so benchmarks never touch real data.
+    """
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def seed(scale):
+    """
+    Replaces the data of the benchmark database with the seed_benchmark_data dataset at `scale`.
+    """
+    call_command('flush', interactive=False, verbosity=0)
+    cache.clear()
+    token_cache.clear()
+    call_command('seed_benchmark_data', scale=scale, verbosity=0)
+    return {model._meta.model_name: model.objects.count()
+            for model in (Departament, Job, Employee, ClientModel, Project, Task)}
+
+
+def run_endpoints(requests, warmup):
+    user = benchmark_user()
+    client = Client(HTTP_AUTHORIZATION='Token ' + user.auth_token.key)
+    results = {}
+    for name, method, url in ENDPOINTS:
+        if name == 'login':
+            results[name] = measure(Client(), method, url, requests, warmup,
+                                    data={'username': user.email, 'password': BENCHMARK_PASSWORD})
+        else:
+            results[name] = measure(client, method, url, requests, warmup)
+    return results
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the main API endpoints through the test client, in a test database seeded with " \
+           "seed_benchmark_data at each --scale, and prints the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,5,25', help="Comma separated seed_benchmark_data scales.")
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', help="Also write the JSON to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError("Invalid --scales: {0}".format(options['scales']))
+
+        report = {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'runs': [],
+        }
+        with benchmark_database():
+            for scale in scales:
+                start = time.time()
+                dataset = seed(scale)
+                if options['verbosity'] >= 1:
+                    self.stderr.write("scale {0}: seeded in {1:.1f}s, benchmarking...".format(
+                        scale, time.time() - start))
+                report['runs'].append({
+                    'scale': scale,
+                    'dataset': dataset,
+                    'endpoints': run_endpoints(options['requests'], options['warmup']),
+                })
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+
+# command to run from terminal: python manage.py benchmark_api [--scales 1,5,25] [--requests 50] [--output before.json]
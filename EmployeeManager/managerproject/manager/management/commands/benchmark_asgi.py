@@ -0,0 +1,180 @@
+# manager/management/commands/benchmark_asgi
+
+import asyncio
+import io
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from manager.management.commands.benchmark_api import benchmark_database, benchmark_user, percentile, seed
+
+# The hot read endpoints, requested by a manager with reports (Token authentication)
+ENDPOINTS = (
+    ('tasks', '/api/v1/tasks/'),
+    ('projects', '/api/v1/projects/'),
+    ('users', '/api/v1/users/'),
+)
+MODES = ('wsgi', 'asgi')
+
+
+def wsgi_environ(path, token):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'HTTP_AUTHORIZATION': 'Token ' + token, 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def call_wsgi(application, path, token):
+    """
+    One request to the WSGI application, as a threaded WSGI server's worker would make it; returns the status.
+    """
+    statuses = []
+    body = application(wsgi_environ(path, token), lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return int(statuses[0].split()[0])
+
+
+async def call_asgi(application, path, token):
+    """
+    One request to the ASGI application, as an ASGI server would make it; returns the status.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode('ascii'), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', 'Token {0}'.format(token).encode('ascii'))],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    statuses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+async def run_clients(request, concurrency, requests):
+    """
+    `concurrency` clients making `requests` requests each, one after the other;
+    returns the latencies (ms, including the wait for a free thread) and the total time (s).
+    """
+    latencies = []
+
+    async def client():
+        for _ in range(requests):
+            start = time.perf_counter()
+            status = await request()
+            if status != 200:
+                raise CommandError("HTTP {0}".format(status))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - start
+
+
+def run_mode(mode, path, token, concurrency, requests, threads):
+    loop = asyncio.new_event_loop()
+    # A threaded WSGI server: `threads` workers, each busy for the whole request; under ASGI, the threads of
+    # the event loop's default executor, where the async read views run their sync part
+    executor = ThreadPoolExecutor(max_workers=threads)
+    loop.set_default_executor(executor)
+    try:
+        if mode == 'wsgi':
+            application = get_wsgi_application()
+
+            def request():
+                return loop.run_in_executor(executor, call_wsgi, application, path, token)
+        else:
+            from managerproject.asgi import application
+
+            def request():
+                return call_asgi(application, path, token)
+
+        latencies, elapsed = loop.run_until_complete(run_clients(request, concurrency, requests))
+    finally:
+        loop.close()
+        executor.shutdown()
+
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compares the WSGI and ASGI (managerproject.asgi) applications on the hot read endpoints at several " \
+           "numbers of concurrent clients, in a test database seeded with seed_benchmark_data, and prints the " \
+           "results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--concurrency', default='1,10,50', help="Comma separated numbers of clients.")
+        parser.add_argument('--requests', type=int, default=20, help="Requests per client.")
+        parser.add_argument('--threads', type=int, default=4,
+                            help="Worker threads of the WSGI server, and of the ASGI event loop's executor.")
+        parser.add_argument('--modes', default=','.join(MODES))
+        parser.add_argument('--output', help="Also write the JSON to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("Invalid --concurrency: {0}".format(options['concurrency']))
+        modes = options['modes'].split(',')
+        if not set(modes) <= set(MODES):
+            raise CommandError("Invalid --modes: {0}".format(options['modes']))
+        if 'asgi' in modes:
+            try:
+                import managerproject.asgi  # noqa: F401
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+
+        report = {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': options['scale'],
+            'threads': options['threads'],
+            'runs': [],
+        }
+        with benchmark_database():
+            report['dataset'] = seed(options['scale'])
+            token = benchmark_user().auth_token.key
+            for name, path in ENDPOINTS:
+                for concurrency in levels:
+                    if options['verbosity'] >= 1:
+                        self.stderr.write("{0}: {1} client(s)...".format(name, concurrency))
+                    report['runs'].append(dict({'endpoint': name, 'concurrency': concurrency}, **{
+                        mode: run_mode(mode, path, token, concurrency, options['requests'], options['threads'])
+                        for mode in modes}))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+
+# command to run from terminal: python manage.py benchmark_asgi [--concurrency 1,10,50] [--threads 4] [--modes wsgi,asgi]
@@ -0,0 +1,83 @@
+# manager/management/commands/benchmark_hashers
+
+import json
+import os
+import platform
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from manager.hashing import make_executor
+
+PASSWORD = 'benchmark-password'
+
+
+def encode(hasher_path, password):
+    hasher = import_string(hasher_path)()
+    return hasher.encode(password, hasher.salt())
+
+
+def hashes_per_second(hasher_path, workers, hashes):
+    """
+    Throughput of `workers` processes hashing `hashes` passwords each (after one warm-up hash per process).
+    """
+    with make_executor(workers) as executor:
+        list(executor.map(encode, [hasher_path] * workers, [PASSWORD] * workers))
+        start = time.perf_counter()
+        list(executor.map(encode, [hasher_path] * workers * hashes, [PASSWORD] * workers * hashes))
+        elapsed = time.perf_counter() - start
+    return round(workers * hashes / elapsed, 1)
+
+
+class Command(BaseCommand):
+    help = "Measures the hashes per second of each password hasher with 1..N processes, to size " \
+           "PASSWORD_HASH_WORKERS (manager.hashing), and prints the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', help="Comma separated hasher classes. Default: PASSWORD_HASHERS.")
+        parser.add_argument('--workers', default='1,2,4', help="Comma separated numbers of processes.")
+        parser.add_argument('--hashes', type=int, default=10, help="Hashes per process.")
+        parser.add_argument('--output', help="Also write the JSON to this file.")
+
+    def handle(self, *args, **options):
+        hasher_paths = options['hashers'].split(',') if options['hashers'] else settings.PASSWORD_HASHERS
+        try:
+            workers = [int(count) for count in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError("Invalid --workers: {0}".format(options['workers']))
+
+        report = {
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'hashers': [],
+        }
+        for hasher_path in hasher_paths:
+            try:
+                hasher = import_string(hasher_path)()
+                start = time.perf_counter()
+                hasher.encode(PASSWORD, hasher.salt())
+            except (ImportError, ValueError) as e:
+                # e.g. Argon2 or bcrypt without their library
+                report['hashers'].append({'hasher': hasher_path, 'error': str(e)})
+                continue
+            result = {
+                'hasher': hasher_path,
+                'algorithm': hasher.algorithm,
+                'ms_per_hash': round((time.perf_counter() - start) * 1000, 1),
+                'hashes_per_second': {},
+            }
+            for count in workers:
+                if options['verbosity'] >= 1:
+                    self.stderr.write("{0}: {1} process(es)...".format(hasher.algorithm, count))
+                result['hashes_per_second'][count] = hashes_per_second(hasher_path, count, options['hashes'])
+            report['hashers'].append(result)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+
+# command to run from terminal: python manage.py benchmark_hashers [--workers 1,2,4,8] [--hashes 20]
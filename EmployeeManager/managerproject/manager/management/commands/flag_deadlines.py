@@ -0,0 +1,29 @@
+# manager/management/commands/flag_deadlines
+
+import time
+
+from django.core.management.base import BaseCommand
+from manager.deadlines import flag_deadlines
+
+
+class Command(BaseCommand):
+    help = "Marks the projects past their end date as late and flags the overdue tasks, " \
+           "with one UPDATE per change (see manager.deadlines)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running instead of exiting.")
+        parser.add_argument('--interval', type=float, default=3600, help="Seconds between runs with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            counts = flag_deadlines()
+            verbosity = options['verbosity']
+            if (verbosity >= 1 and any(counts.values())) or verbosity >= 2:
+                self.stdout.write("{late_projects} late project(s), {overdue_tasks} overdue task(s), "
+                                  "{cleared_tasks} task(s) no longer overdue.".format(**counts))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+
+# command to run from terminal (e.g. daily from cron): python manage.py flag_deadlines [--loop --interval 3600]
@@ -0,0 +1,55 @@
+# manager/management/commands/generate_photo_variants
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+from django.core.management.base import BaseCommand
+from manager.models import Employee
+from manager.thumbnails import process_photo
+
+
+def process_photo_in_thread(employee_id, name):
+    try:
+        process_photo(employee_id, name)
+    finally:
+        db.connection.close()
+
+
+class Command(BaseCommand):
+    help = "Generates the profile photo variants of the employees that don't have them yet (of every " \
+           "employee with --all), e.g. after changing PROFILE_PHOTO_SIZES."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Also regenerate the variants that are ready.")
+        parser.add_argument('--workers', type=int, default=1, help="Photos processed in parallel.")
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.exclude(profile_photo='').exclude(profile_photo=None)
+        if not options['all']:
+            employees = employees.filter(profile_photo_variants_ready=False)
+        photos = list(employees.order_by('pk').values_list('pk', 'profile_photo'))
+
+        failed = 0
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = [(pk, executor.submit(process_photo_in_thread, pk, name)) for pk, name in photos]
+                for pk, future in futures:
+                    failed += self.report(pk, future.exception())
+        else:
+            for pk, name in photos:
+                try:
+                    process_photo(pk, name)
+                except Exception as e:
+                    failed += self.report(pk, e)
+
+        if options['verbosity'] >= 1:
+            self.stdout.write("{0} photo(s) processed, {1} failed".format(len(photos) - failed, failed))
+
+    def report(self, employee_id, error):
+        if error is None:
+            return 0
+        self.stderr.write("Employee {0}: {1}".format(employee_id, error))
+        return 1
+
+
+# command to run from terminal: python manage.py generate_photo_variants [--all] [--workers 4]
@@ -1,52 +1,198 @@
 # manager/management/commands/import_client_from_xls
 
-import xlrd
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django import db
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils.encoding import smart_str
+from manager.caching import bump_version
 from manager.models import Client
+from manager.search import KINDS_BY_MODEL, index_documents
 
 SILENT, NORMAL, VERBOSE, VERY_VERBOSE = 0, 1, 2, 3
 
+# The first sheet is a cover and the first rows of each sheet are the column captions
+SKIPPED_SHEETS = 1
+SKIPPED_ROWS = 3
+
+
+def open_workbook(file_path):
+    """
+    Returns a list of sheet names and a function that yields the rows of a sheet one at a time.
+    .xlsx files are streamed with openpyxl (read-only mode), .xls files are loaded one sheet at a time with xlrd.
+    """
+    if file_path.lower().endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise CommandError("Reading .xlsx files requires openpyxl: pip install openpyxl")
+
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        sheet_names = wb.sheetnames
+        wb.close()
+
+        def iter_rows(sheet_index):
+            wb = openpyxl.load_workbook(file_path, read_only=True)
+            try:
+                for row in wb[wb.sheetnames[sheet_index]].iter_rows(values_only=True):
+                    yield row
+            finally:
+                wb.close()
+
+        return sheet_names, iter_rows
+
+    try:
+        import xlrd
+    except ImportError:
+        raise CommandError("Reading .xls files requires xlrd: pip install xlrd")
+
+    wb = xlrd.open_workbook(file_path, on_demand=True)
+    sheet_names = wb.sheet_names()
+    wb.release_resources()
+
+    def iter_rows(sheet_index):
+        wb = xlrd.open_workbook(file_path, on_demand=True)
+        try:
+            sheet = wb.sheet_by_index(sheet_index)
+            for rownum in range(sheet.nrows):
+                yield sheet.row_values(rownum)
+        finally:
+            wb.release_resources()
+
+    return sheet_names, iter_rows
+
+
+def read_clients(rows, seen):
+    """
+    Yields (name, email) for every data row, skipping captions, rows without e-mail and e-mails already in `seen`.
+    """
+    for rownum, row in enumerate(rows):
+        if rownum < SKIPPED_ROWS or len(row) < 2:
+            continue
+        name, email = (smart_str(value).strip() if value is not None else '' for value in row[:2])
+        if not email or email in seen:
+            continue
+        seen.add(email)
+        yield name, email
+
+
+def save_chunk(chunk, dry_run):
+    """
+    Upserts a chunk of (name, email) pairs: one IN query to find the existing clients,
+    then one bulk insert and one bulk update, all in a single transaction.
+    """
+    with transaction.atomic():
+        existing = Client.objects.filter(email__in=[email for name, email in chunk]).only('id', 'name', 'email')
+        existing = {client.email: client for client in existing}
+        new_clients = []
+        changed_clients = []
+        for name, email in chunk:
+            client = existing.get(email)
+            if client is None:
+                new_clients.append(Client(name=name, email=email))
+            elif client.name != name:
+                client.name = name
+                changed_clients.append(client)
+
+        if not dry_run:
+            # ignore_conflicts: a parallel worker may insert the same e-mail from another sheet
+            Client.objects.bulk_create(new_clients, ignore_conflicts=True)
+            Client.objects.bulk_update(changed_clients, ['name'])
+            # bulk_create/bulk_update don't send the signals that index the clients for search;
+            # the new ones are read back for their ids, which bulk_create doesn't set here
+            indexed = changed_clients + list(Client.objects.filter(
+                email__in=[client.email for client in new_clients]).only('id', 'name'))
+            index_documents(db.connections[db.router.db_for_write(Client)], KINDS_BY_MODEL[Client], indexed)
+
+    return len(new_clients), len(changed_clients)
+
+
+def import_sheet(file_path, sheet_index, chunk_size, dry_run, seen=None):
+    """
+    Imports one sheet and returns (rows, created, updated).
+    Also used as the worker function when sheets are imported in parallel.
+    """
+    _, iter_rows = open_workbook(file_path)
+    seen = set() if seen is None else seen
+    rows = created = updated = 0
+    chunk = []
+    for client in read_clients(iter_rows(sheet_index), seen):
+        chunk.append(client)
+        if len(chunk) >= chunk_size:
+            new, changed = save_chunk(chunk, dry_run)
+            rows, created, updated = rows + len(chunk), created + new, updated + changed
+            chunk = []
+    if chunk:
+        new, changed = save_chunk(chunk, dry_run)
+        rows, created, updated = rows + len(chunk), created + new, updated + changed
+    return rows, created, updated
+
 
 class Command(BaseCommand):
-       help = "Imports clients from a local XLS file. " \
-              "Expects name, email."
-
-       def add_arguments(self, parser):
-           parser.add_argument('file_path')
-
-       def handle(self, *args, **options):
-           print("Reading xls...")
-           file_path = options['file_path']
-           wb = xlrd.open_workbook(file_path)
-           print("The number of worksheets is {0}".format(wb.nsheets))
-           print("Worksheet name(s): {0}".format(wb.sheet_names()))
-
-           verbosity = int(options.get("verbosity", NORMAL))
-           if verbosity >= NORMAL:
-               print("=== XLS file imported ===")
-
-           first_sheet = wb.sheet_by_index(0)  # get a single sheet
-           # print("{0} {1} {2}".format(first_sheet.name, first_sheet.nrows, first_sheet.ncols))
-
-           for sh in wb.sheets():
-               # let's skip the first sheet
-               if sh != first_sheet:
-                   print("Sheet name: {0}; number of rows: {1}; numbers of columns: {2};".format(sh.name, sh.nrows,
-                                                                                                 sh.ncols))
-                   for rownum in range(sh.nrows):
-                       # let's skip the column captions and blank rows
-                       if rownum > 2:
-                           (name, email, telephone, address) = sh.row_values(rownum)
-                           client, created = Client.objects.get_or_create(
-                               name=name,
-                               email=email,
-                           )
-                           if verbosity >= NORMAL:
-                               print(" - %s" % smart_str(client.name))
-
-
-# pip install xlrd
+    help = "Imports clients from a local XLS/XLSX file. " \
+           "Expects name, email."
 
-# command to run from terminal: python manage.py import_client_from_xls /Users/<Username>/Documents/<MyApp>/clients.xls
+    def add_arguments(self, parser):
+        parser.add_argument('file_path')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Rows upserted per query and per transaction.")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Import sheets in parallel processes. E-mails are then deduplicated per sheet.")
+        parser.add_argument('--dry-run', action='store_true', help="Read and match the rows but don't write them.")
+
+    def handle(self, *args, **options):
+        file_path = options['file_path']
+        if not os.path.exists(file_path):
+            raise CommandError("File {0} not found".format(file_path))
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        verbosity = int(options.get("verbosity", NORMAL))
+
+        sheet_names, _ = open_workbook(file_path)
+        if verbosity >= NORMAL:
+            self.stdout.write("The number of worksheets is {0}".format(len(sheet_names)))
+            self.stdout.write("Worksheet name(s): {0}".format(sheet_names))
+
+        workers = options['workers']
+        if workers > 1 and db.connection.vendor == 'sqlite':
+            self.stderr.write("SQLite allows a single writer, importing the sheets sequentially.")
+            workers = 1
 
+        start = time.time()
+        sheets = range(SKIPPED_SHEETS, len(sheet_names))
+        if workers > 1:
+            # Children must open their own database connections, and set Django up when they don't
+            # inherit it (spawn and forkserver start methods, e.g. the default on macOS)
+            db.connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                futures = [executor.submit(import_sheet, file_path, index, chunk_size, dry_run) for index in sheets]
+                results = [future.result() for future in futures]
+        else:
+            seen = set()
+            results = [import_sheet(file_path, index, chunk_size, dry_run, seen) for index in sheets]
+
+        if verbosity >= VERBOSE:
+            for index, (rows, created, updated) in zip(sheets, results):
+                self.stdout.write("Sheet name: {0}; rows: {1}; created: {2}; updated: {3};".format(
+                    sheet_names[index], rows, created, updated))
+
+        if not dry_run:
+            # bulk_create/bulk_update don't send the signals that invalidate the cached client lists
+            bump_version(Client)
+
+        elapsed = time.time() - start
+        rows, created, updated = (sum(values) for values in zip(*results)) if results else (0, 0, 0)
+        if verbosity >= NORMAL:
+            self.stdout.write("=== {0}{1} rows imported in {2:.2f}s ({3:.0f} rows/s): "
+                              "{4} created, {5} updated ===".format('[dry run] ' if dry_run else '', rows, elapsed,
+                                                                    rows / elapsed if elapsed else 0, created, updated))
+
+
+# pip install xlrd (.xls) / pip install openpyxl (.xlsx)
+
+# command to run from terminal: python manage.py import_client_from_xls /Users/<Username>/Documents/<MyApp>/clients.xls
+# options: --chunk-size 5000 --workers 4 --dry-run
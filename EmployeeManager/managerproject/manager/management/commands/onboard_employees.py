@@ -0,0 +1,283 @@
+# manager/management/commands/onboard_employees
+
+import csv
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import hashers
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.encoding import smart_str
+from rest_framework.authtoken.models import Token
+from manager.hashing import make_executor
+from manager.management.commands.import_client_from_xls import open_workbook
+from manager.models import Employee, Departament, Job, EmployeeClosure, reserve_ids
+from manager.permissions import invalidate_permission_context
+
+SILENT, NORMAL, VERBOSE, VERY_VERBOSE = 0, 1, 2, 3
+
+# The first row holds the column names; only email is required
+COLUMNS = ('email', 'first_name', 'last_name', 'password', 'manager', 'department', 'job', 'category',
+           'phone_number', 'salary')
+CATEGORIES = dict(Employee.CATEGORY_CHOICES)
+EMPLOYEE_GROUP = 'Funcionários'
+
+
+def read_rows(file_path):
+    """
+    Yields (line number, {column: value}) for every non-empty row of a CSV file or of the first sheet of an
+    XLS/XLSX file, with the values as stripped strings.
+    """
+    if file_path.lower().endswith('.csv'):
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.reader(f))
+    else:
+        _, iter_rows = open_workbook(file_path)
+        rows = iter_rows(0)
+
+    header = None
+    for line, row in enumerate(rows, 1):
+        values = [smart_str(value).strip() if value is not None else '' for value in row]
+        if not any(values):
+            continue
+        if header is None:
+            header = [value.lower() for value in values]
+            unknown = set(header) - set(COLUMNS) - {''}
+            if unknown:
+                raise CommandError("Unknown column(s): {0}. Expected: {1}".format(
+                    ', '.join(sorted(unknown)), ', '.join(COLUMNS)))
+            if 'email' not in header:
+                raise CommandError("The first row must name the columns, including email")
+            continue
+        yield line, dict(zip(header, values))
+
+
+def hash_passwords(passwords, workers):
+    """
+    make_password of every password, in `workers` processes (inline with 0). Empty passwords become
+    unusable ones, which needs no hashing.
+    """
+    usable = [password for password in passwords if password]
+    if workers and len(usable) > 1:
+        with make_executor(workers) as executor:
+            hashed = iter(executor.map(hashers.make_password, usable,
+                                       chunksize=max(len(usable) // (workers * 4), 1)))
+    else:
+        hashed = iter([hashers.make_password(password) for password in usable])
+    return [next(hashed) if password else hashers.make_password(None) for password in passwords]
+
+
+def closure_ancestors(employees, manager_ids):
+    """
+    (ancestor_id, depth) lists of the new employees, including themselves: up through the new managers of
+    the file, then the closure rows of the first existing manager of the chain.
+    """
+    by_id = {employee.id: employee for employee in employees}
+    existing = {}
+    for ancestor_id, descendant_id, depth in EmployeeClosure.objects.filter(
+            descendant_id__in=set(manager_ids) - set(by_id)).values_list('ancestor_id', 'descendant_id', 'depth'):
+        existing.setdefault(descendant_id, []).append((ancestor_id, depth))
+
+    ancestors = {}
+    for employee in employees:
+        chain = []
+        current = employee.id
+        while current in by_id and current not in ancestors:
+            chain.append(current)
+            current = by_id[current].manager_id
+        known = ancestors.get(current) or existing.get(current, [])
+        for node in reversed(chain):
+            known = [(node, 0)] + [(ancestor_id, depth + 1) for ancestor_id, depth in known]
+            ancestors[node] = known
+    return ancestors
+
+
+def find_cycles(accepted, new_managers):
+    """
+    (line, error) of the (line, row, employee) whose chain of new managers loops back to them.
+    """
+    errors = []
+    for line, _, employee in accepted:
+        seen = {employee.email}
+        current = employee.email
+        while current in new_managers:
+            current = new_managers[current].email
+            if current in seen:
+                break
+            seen.add(current)
+        if current == employee.email and employee.email in new_managers:
+            errors.append((line, "{0} is in a cycle of managers".format(employee.email)))
+    return errors
+
+
+def inherited_departments(employees, managers):
+    """
+    {email: department id} of the employees without a department: as EmployeeListView.post, the department
+    of their manager, which may itself come from further up the chain of new managers. Whatever the order
+    of the rows.
+    """
+    departments = {}
+    for employee in employees:
+        current, seen = employee, set()
+        while current.department_id is None and current.email in managers and current.email not in seen:
+            seen.add(current.email)
+            current = managers[current.email]
+        if employee.department_id is None:
+            departments[employee.email] = current.department_id
+    return departments
+
+
+class Command(BaseCommand):
+    help = "Creates employees from a CSV or XLS/XLSX file whose first row names the columns ({0}; only email " \
+           "is required) with bulk inserts: managers (by e-mail, existing or in the file), departments and jobs " \
+           "(by title) are resolved in a few queries and the passwords are hashed in parallel processes. " \
+           "Nothing is written if any row is invalid.".format(', '.join(COLUMNS))
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes hashing the passwords (0: hash in this process).")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows per INSERT; by default the most the database accepts.")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the rows.")
+
+    def handle(self, *args, **options):
+        file_path = options['file_path']
+        if not os.path.exists(file_path):
+            raise CommandError("File {0} not found".format(file_path))
+        self.batch_size = options['batch_size']
+        self.verbosity = int(options.get('verbosity', NORMAL))
+
+        start = time.time()
+        rows = list(read_rows(file_path))
+        employees, new_managers, passwords, errors = self.build_employees(rows)
+        if errors:
+            for line, error in errors:
+                self.stderr.write("Line {0}: {1}".format(line, error))
+            raise CommandError("{0} error(s), no employee created".format(len(errors)))
+        if options['dry_run'] or not employees:
+            if self.verbosity >= NORMAL:
+                self.stdout.write("=== {0}{1} employee(s) validated ===".format(
+                    '[dry run] ' if options['dry_run'] else '', len(employees)))
+            return
+
+        hashing_start = time.time()
+        for employee, password in zip(employees, hash_passwords(passwords, options['workers'])):
+            employee.password = password
+        if self.verbosity >= VERBOSE:
+            self.stdout.write("{0} password(s) hashed in {1:.2f}s".format(len(passwords), time.time() - hashing_start))
+
+        existing_managers = {employee.manager_id for employee in employees} - {None}
+        with transaction.atomic():
+            # The ids are taken in the transaction, right before the inserts, not before the (long) hashing.
+            # From the sequence on PostgreSQL; on SQLite and MySQL an insert made meanwhile fails this one on
+            # the primary key, and nothing is written.
+            for employee, pk in zip(employees, reserve_ids(Employee, len(employees))):
+                employee.id = pk
+            for employee in employees:
+                if employee.email in new_managers:
+                    employee.manager_id = new_managers[employee.email].id
+            self.create_employees(employees, existing_managers)
+        # What the post_save receivers skipped by bulk_create would have done
+        invalidate_permission_context(*existing_managers)
+
+        if self.verbosity >= NORMAL:
+            elapsed = time.time() - start
+            self.stdout.write("=== {0} employee(s) created in {1:.2f}s ({2:.0f} rows/s) ===".format(
+                len(employees), elapsed, len(employees) / elapsed if elapsed else 0))
+
+    def build_employees(self, rows):
+        """
+        Returns the unsaved employees (without ids yet), {email: new manager} of those managed by another
+        employee of the file, their raw passwords and the (line, error) of the invalid rows. Looks up the
+        managers, departments and jobs with one query each.
+        """
+        emails = [row.get('email', '') for line, row in rows]
+        manager_emails = {row.get('manager') for line, row in rows} - {None, ''}
+        existing_emails = set(Employee.objects.filter(email__in=emails).values_list('email', flat=True))
+        managers = {manager.email: manager for manager in Employee.objects.filter(
+            email__in=manager_emails).only('id', 'email', 'department_id')}
+        departments = dict(Departament.objects.filter(
+            title__in={row.get('department') for line, row in rows} - {None, ''}).values_list('title', 'id'))
+        jobs = {(title, department_id): pk for pk, title, department_id in Job.objects.filter(
+            title__in={row.get('job') for line, row in rows} - {None, ''}).values_list('id', 'title', 'department_id')}
+
+        new_employees = {}
+        accepted, errors = [], []
+        for line, row in rows:
+            email = row.get('email', '')
+            if not email:
+                errors.append((line, "missing e-mail"))
+                continue
+            if email in existing_emails or email in new_employees:
+                errors.append((line, "e-mail {0} is already used".format(email)))
+                continue
+            category = row.get('category') or Employee.EMPLOYEE
+            if category not in CATEGORIES:
+                errors.append((line, "invalid category {0} (expected {1})".format(category, ', '.join(CATEGORIES))))
+                continue
+            try:
+                salary = Decimal(row['salary'].replace(',', '.')) if row.get('salary') else None
+            except InvalidOperation:
+                errors.append((line, "invalid salary {0}".format(row['salary'])))
+                continue
+            if row.get('department') and row['department'] not in departments:
+                errors.append((line, "department {0} not found".format(row['department'])))
+                continue
+            employee = Employee(
+                email=email, first_name=row.get('first_name', ''), last_name=row.get('last_name', ''),
+                phone_number=row.get('phone_number') or None, salary=salary, category=category,
+                is_staff=category != Employee.EMPLOYEE, department_id=departments.get(row.get('department')),
+            )
+            new_employees[email] = employee
+            accepted.append((line, row, employee))
+
+        # Second pass: the managers may be new employees further down the file
+        managers_of = {}
+        for line, row, employee in accepted:
+            if row.get('manager'):
+                manager = new_employees.get(row['manager']) or managers.get(row['manager'])
+                if manager is None or manager is employee:
+                    errors.append((line, "manager {0} not found".format(row['manager'])))
+                    continue
+                managers_of[employee.email] = manager
+                employee.manager_id = manager.id
+        new_managers = {email: manager for email, manager in managers_of.items() if manager.id is None}
+        errors.extend(find_cycles(accepted, new_managers))
+
+        # Then the departments, down the chains of managers, before the jobs that depend on them
+        for email, department_id in inherited_departments(new_employees.values(), managers_of).items():
+            new_employees[email].department_id = department_id
+        for line, row, employee in accepted:
+            if row.get('job'):
+                employee.job_id = jobs.get((row['job'], employee.department_id))
+                if employee.job_id is None:
+                    errors.append((line, "job {0} not found in the employee's department".format(row['job'])))
+
+        return [employee for _, _, employee in accepted], new_managers, \
+            [row.get('password', '') for _, row, _ in accepted], sorted(errors)
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        if self.verbosity >= VERBOSE:
+            self.stdout.write("{0}: {1} row(s)".format(model._meta.verbose_name, len(objects)))
+        return objects
+
+    def create_employees(self, employees, existing_manager_ids):
+        self.bulk_create(Employee, employees)
+        ancestors = closure_ancestors(employees, existing_manager_ids)
+        self.bulk_create(EmployeeClosure, [
+            EmployeeClosure(ancestor_id=ancestor_id, descendant_id=employee.id, depth=depth)
+            for employee in employees for ancestor_id, depth in ancestors[employee.id]])
+        self.bulk_create(Token, [Token(key=Token().generate_key(), user_id=employee.id) for employee in employees])
+        # As EmployeeAdmin.save_model: the employees join the Funcionários group
+        group, _ = Group.objects.get_or_create(name=EMPLOYEE_GROUP)
+        self.bulk_create(Employee.groups.through, [Employee.groups.through(employee_id=employee.id, group=group)
+                                                   for employee in employees
+                                                   if employee.category == Employee.EMPLOYEE])
+
+
+# command to run from terminal: python manage.py onboard_employees /Users/<Username>/Documents/hires.csv
+# options: --workers 8 --batch-size 1000 --dry-run
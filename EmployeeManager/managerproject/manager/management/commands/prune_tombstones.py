@@ -0,0 +1,26 @@
+# manager/management/commands/prune_tombstones
+
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from manager.models import Tombstone
+from manager.sync import SYNC_TOMBSTONE_DAYS
+
+
+class Command(BaseCommand):
+    help = "Deletes the sync tombstones older than the sync tokens accepted (SYNC_TOMBSTONE_DAYS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=SYNC_TOMBSTONE_DAYS,
+                            help="Keep the tombstones of the last DAYS days. Tokens older than that get a full sync, "
+                                 "so use at least SYNC_TOMBSTONE_DAYS.")
+
+    def handle(self, *args, **options):
+        deleted, _ = Tombstone.objects.filter(
+            deleted_at__lt=timezone.now() - datetime.timedelta(days=options['days'])).delete()
+        if options['verbosity'] >= 1:
+            self.stdout.write("{0} tombstone(s) deleted".format(deleted))
+
+
+# command to run from terminal: python manage.py prune_tombstones [--days 30]
@@ -0,0 +1,28 @@
+# manager/management/commands/prune_upload_sessions
+
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from manager.models import UploadSession
+from manager.uploads import UPLOAD_SESSION_HOURS, discard
+
+
+class Command(BaseCommand):
+    help = "Deletes the upload sessions older than UPLOAD_SESSION_HOURS, with the partial files of the " \
+           "incomplete ones. Stored files are kept: projects and tasks may reference them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=UPLOAD_SESSION_HOURS)
+
+    def handle(self, *args, **options):
+        expired = UploadSession.objects.filter(
+            created_at__lt=timezone.now() - datetime.timedelta(hours=options['hours']))
+        for upload in expired.filter(completed_at=None).only('pk').iterator():
+            discard(upload)
+        deleted, _ = expired.delete()
+        if options['verbosity'] >= 1:
+            self.stdout.write("{0} upload session(s) deleted".format(deleted))
+
+
+# command to run from terminal: python manage.py prune_upload_sessions [--hours 24]
@@ -0,0 +1,63 @@
+# manager/management/commands/rebuild_employee_closure
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from manager.models import Employee, EmployeeClosure
+
+
+def compute_closure():
+    """
+    Returns the set of (ancestor_id, descendant_id, depth) rows of the whole Employee.manager hierarchy.
+    """
+    managers = dict(Employee.objects.values_list('id', 'manager_id'))
+    ancestors = {}  # employee id -> [(ancestor id, depth), ...], including itself
+
+    def get_ancestors(employee_id):
+        # Walks up iteratively until an employee whose chain is already known
+        chain = []
+        current = employee_id
+        while current is not None and current not in ancestors:
+            if current in chain:
+                raise CommandError("Cycle in the managers of employee {0}".format(employee_id))
+            chain.append(current)
+            current = managers.get(current)
+        known = ancestors.get(current, [])
+        for node in reversed(chain):
+            known = [(node, 0)] + [(ancestor_id, depth + 1) for ancestor_id, depth in known]
+            ancestors[node] = known
+        return ancestors[employee_id]
+
+    return {(ancestor_id, employee_id, depth)
+            for employee_id in managers for ancestor_id, depth in get_ancestors(employee_id)}
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the EmployeeClosure table (manager hierarchy) from Employee.manager."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the closure table with Employee.manager; fails if they differ.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = compute_closure()
+            current = set(EmployeeClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+            differences = len(expected ^ current)
+            if options['verbosity'] >= 1:
+                self.stdout.write("{0} closure row(s), {1} difference(s)".format(len(expected), differences))
+
+            if options['verify']:
+                if differences:
+                    raise CommandError("{0} closure row(s) differ from Employee.manager".format(differences))
+                return
+
+            EmployeeClosure.objects.all().delete()
+            EmployeeClosure.objects.bulk_create(
+                (EmployeeClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                 for ancestor_id, descendant_id, depth in expected),
+                batch_size=options['batch_size'],
+            )
+
+
+# command to run from terminal: python manage.py rebuild_employee_closure [--verify]
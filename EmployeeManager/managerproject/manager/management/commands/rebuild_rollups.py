@@ -0,0 +1,67 @@
+# manager/management/commands/rebuild_rollups
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from manager.models import Task, ProjectHours, EmployeeHours, DepartmentHours
+
+# rollup model, rollup key field, Task field it is grouped by
+ROLLUPS = (
+    (ProjectHours, 'project_id', 'project_id'),
+    (EmployeeHours, 'employee_id', 'employee_id'),
+    (DepartmentHours, 'department_id', 'project__department_id'),
+)
+
+
+def compute(group_by):
+    """
+    Returns {key: (working_hours, task_count)} computed from the tasks table.
+    """
+    rows = Task.objects.order_by().values(group_by).annotate(hours=Sum('working_hours'), tasks=Count('id'))
+    return {row[group_by]: (row['hours'] or Decimal('0'), row['tasks']) for row in rows}
+
+
+def stored(model, key_field):
+    rows = model.objects.values_list(key_field, 'working_hours', 'task_count')
+    return {key: (hours, tasks) for key, hours, tasks in rows}
+
+
+class Command(BaseCommand):
+    help = "Recomputes the working hours rollups (per project, employee and department) from the tasks " \
+           "and reports the rows that had drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the rollups with the tasks; fails if they differ.")
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for model, key_field, group_by in ROLLUPS:
+                expected = compute(group_by)
+                # Rows without tasks are kept with zeros by the signals, so they are not a difference
+                current = {key: value for key, value in stored(model, key_field).items() if any(value)}
+                differences = {key for key in set(expected) | set(current) if expected.get(key) != current.get(key)}
+                total += len(differences)
+                if options['verbosity'] >= 1:
+                    self.stdout.write("{0}: {1} row(s), {2} difference(s)".format(
+                        model._meta.verbose_name, len(expected), len(differences)))
+                if options['verbosity'] >= 2:
+                    for key in sorted(differences):
+                        self.stdout.write("  {0}={1}: stored {2}, expected {3}".format(
+                            key_field, key, current.get(key), expected.get(key)))
+
+                if not options['verify']:
+                    model.objects.all().delete()
+                    model.objects.bulk_create(
+                        model(working_hours=hours, task_count=tasks, **{key_field: key})
+                        for key, (hours, tasks) in expected.items()
+                    )
+
+        if options['verify'] and total:
+            raise CommandError("{0} rollup row(s) differ from the tasks".format(total))
+
+
+# command to run from terminal: python manage.py rebuild_rollups [--verify]
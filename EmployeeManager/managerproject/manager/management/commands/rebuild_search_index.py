@@ -0,0 +1,41 @@
+# manager/management/commands/rebuild_search_index
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from manager.search import KINDS, TABLE, create_search_index, index_documents, is_supported
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index of tasks, projects and clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not is_supported(connection):
+            raise CommandError("Full-text search needs PostgreSQL or SQLite (FTS5).")
+
+        create_search_index(connection)
+        with transaction.atomic(using=options['database']):
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM {0}".format(TABLE))
+            for kind in KINDS:
+                fields = ['pk', kind.title_field] + ([kind.body_field] if kind.body_field else [])
+                queryset = kind.model.objects.using(options['database']).order_by('pk').only(*fields)
+                batch = []
+                total = 0
+                for instance in queryset.iterator(chunk_size=options['batch_size']):
+                    batch.append(instance)
+                    if len(batch) >= options['batch_size']:
+                        index_documents(connection, kind, batch)
+                        total += len(batch)
+                        batch = []
+                index_documents(connection, kind, batch)
+                total += len(batch)
+                if options['verbosity'] >= 1:
+                    self.stdout.write("{0}: {1} document(s) indexed".format(kind.name, total))
+
+
+# command to run from terminal: python manage.py rebuild_search_index
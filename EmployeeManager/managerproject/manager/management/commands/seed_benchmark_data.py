@@ -0,0 +1,208 @@
+# manager/management/commands/seed_benchmark_data
+
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from manager.caching import bump_version
+from manager.models import Employee, Departament, Job, Client, Project, Task, EmployeeClosure
+
+BENCHMARK_PASSWORD = 'benchmark'
+
+# Dataset at --scale 1; --scale multiplies everything but the per-department, per-team and per-project sizes
+DEFAULTS = {
+    'departments': 5,
+    'jobs_per_department': 4,
+    'employees': 200,
+    'span': 8,
+    'clients': 50,
+    'projects': 40,
+    'team_size': 8,
+    'tasks_per_project': 25,
+}
+SCALED = ('departments', 'employees', 'clients', 'projects')
+
+
+def next_ids(model, count):
+    """
+    Primary keys for `count` new rows, given explicitly so that bulk_create works the same on every database
+    (SQLite doesn't return the new ids). The sequences are reset at the end.
+    """
+    last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    return range(last_id + 1, last_id + 1 + count)
+
+
+def build_hierarchy(count, span):
+    """
+    Returns the manager index (None for the director) of `count` employees: a tree where everyone
+    manages up to `span` employees, filled level by level.
+    """
+    return [None] + [(index - 1) // span for index in range(1, count)]
+
+
+def closure_rows(employee_ids, managers):
+    """
+    (ancestor_id, descendant_id, depth) rows of the hierarchy, including the depth 0 ones.
+    """
+    for index, employee_id in enumerate(employee_ids):
+        ancestor, depth = index, 0
+        while ancestor is not None:
+            yield employee_ids[ancestor], employee_id, depth
+            ancestor, depth = managers[ancestor], depth + 1
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic dataset (departments, jobs, an employee hierarchy, clients, projects with " \
+           "teams and tasks) with bulk inserts, for benchmarks. Every employee's password is '{0}'.".format(
+               BENCHMARK_PASSWORD)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1)
+        for name, default in DEFAULTS.items():
+            parser.add_argument('--' + name.replace('_', '-'), type=int, dest=name,
+                                help="Default: {0}{1}.".format(default, ' x scale' if name in SCALED else ''))
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible datasets.")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows per INSERT; by default the most the database accepts.")
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] if options[name] is not None else
+                 default * (options['scale'] if name in SCALED else 1) for name, default in DEFAULTS.items()}
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+
+        start = time.time()
+        with transaction.atomic():
+            departments = self.create_departments(sizes['departments'])
+            jobs = self.create_jobs(departments, sizes['jobs_per_department'])
+            employees = self.create_employees(sizes['employees'], sizes['span'], departments, jobs)
+            clients = self.create_clients(sizes['clients'])
+            projects = self.create_projects(sizes['projects'], sizes['team_size'], clients, departments, employees)
+            self.create_tasks(projects, sizes['tasks_per_project'])
+
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Departament, Job, Employee, Client,
+                                                                          Project, Task]):
+                    cursor.execute(sql)
+
+        # What the signals skipped by bulk_create would have done
+        call_command('rebuild_rollups', verbosity=0)
+        call_command('rebuild_search_index', verbosity=0)
+        for model in (Departament, Job, Client):
+            bump_version(model)
+
+        if self.verbosity >= 1:
+            self.stdout.write("=== Dataset generated in {0:.2f}s: {1} ===".format(
+                time.time() - start, ', '.join('{0} {1}'.format(model.objects.count(), model._meta.verbose_name)
+                                               for model in (Departament, Job, Employee, Client, Project, Task))))
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        if self.verbosity >= 2:
+            self.stdout.write("{0}: {1} row(s)".format(model._meta.verbose_name, len(objects)))
+        return objects
+
+    def create_departments(self, count):
+        return self.bulk_create(Departament, [Departament(id=pk, title='Departamento {0}'.format(pk))
+                                              for pk in next_ids(Departament, count)])
+
+    def create_jobs(self, departments, per_department):
+        ids = iter(next_ids(Job, len(departments) * per_department))
+        return self.bulk_create(Job, [Job(id=next(ids), title='Cargo {0}'.format(level), department=department)
+                                      for department in departments for level in range(per_department)])
+
+    def create_employees(self, count, span, departments, jobs):
+        ids = list(next_ids(Employee, count))
+        managers = build_hierarchy(count, span)
+        has_reports = {manager for manager in managers if manager is not None}
+        password = make_password(BENCHMARK_PASSWORD)  # hashed once, the same for everyone
+        jobs_by_department = {}
+        for job in jobs:
+            jobs_by_department.setdefault(job.department_id, []).append(job)
+
+        employees = []
+        for index, pk in enumerate(ids):
+            manager = managers[index]
+            if manager is None:
+                category, department = Employee.ADMIN, departments[0]
+            elif manager == 0:
+                # The director's reports head one department each (round-robin)
+                category, department = Employee.MANAGER, departments[(index - 1) % len(departments)]
+            else:
+                category = Employee.MANAGER if index in has_reports else Employee.EMPLOYEE
+                department = employees[manager].department
+            employees.append(Employee(
+                id=pk, email='funcionario{0}@benchmark.local'.format(pk), password=password,
+                first_name='Funcionário', last_name=str(pk), category=category,
+                is_staff=category != Employee.EMPLOYEE,
+                manager_id=ids[manager] if manager is not None else None, department=department,
+                job=self.rng.choice(jobs_by_department.get(department.id) or [None]),
+                salary=Decimal(self.rng.randrange(2000, 20000)),
+            ))
+        self.bulk_create(Employee, employees)
+
+        self.bulk_create(EmployeeClosure, [
+            EmployeeClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+            for ancestor_id, descendant_id, depth in closure_rows(ids, managers)])
+        self.bulk_create(Token, [Token(key=Token().generate_key(), user_id=pk) for pk in ids])
+        group, _ = Group.objects.get_or_create(name='Funcionários')
+        self.bulk_create(Employee.groups.through, [Employee.groups.through(employee_id=employee.id, group=group)
+                                                   for employee in employees
+                                                   if employee.category == Employee.EMPLOYEE])
+        return employees
+
+    def create_clients(self, count):
+        return self.bulk_create(Client, [Client(id=pk, name='Cliente {0}'.format(pk),
+                                                email='cliente{0}@benchmark.local'.format(pk))
+                                         for pk in next_ids(Client, count)])
+
+    def create_projects(self, count, team_size, clients, departments, employees):
+        by_department = {}
+        for employee in employees:
+            by_department.setdefault(employee.department_id, []).append(employee)
+        today = timezone.localdate()
+
+        projects = []
+        for pk in next_ids(Project, count):
+            department = self.rng.choice(departments)
+            start_date = today - datetime.timedelta(days=self.rng.randrange(0, 365))
+            project = Project(id=pk, title='Projeto {0}'.format(pk), detail='Projeto de benchmark {0}'.format(pk),
+                              client=self.rng.choice(clients), department=department,
+                              status=self.rng.choice(Project.STATUS_CHOICES)[0], start_date=start_date,
+                              end_date=start_date + datetime.timedelta(days=self.rng.randrange(30, 365)))
+            members = by_department.get(department.id) or employees
+            project.members = self.rng.sample(members, min(team_size, len(members)))
+            projects.append(project)
+        self.bulk_create(Project, projects)
+        self.bulk_create(Project.team.through, [Project.team.through(project_id=project.id, employee_id=member.id)
+                                                for project in projects for member in project.members])
+        return projects
+
+    def create_tasks(self, projects, per_project):
+        ids = iter(next_ids(Task, len(projects) * per_project))
+        tasks = []
+        for project in projects:
+            for _ in range(per_project):
+                pk = next(ids)
+                tasks.append(Task(
+                    id=pk, project=project, employee=self.rng.choice(project.members),
+                    title='Tarefa {0}'.format(pk), detail='Tarefa de benchmark do projeto {0}'.format(project.id),
+                    priority=self.rng.choice(Task.PRIORITY_CHOICES)[0], status=self.rng.choice(Task.STATUS_CHOICES)[0],
+                    due_date=project.start_date + datetime.timedelta(days=self.rng.randrange(0, 90)),
+                    working_hours=Decimal(self.rng.randrange(0, 4000)) / 100,
+                ))
+        return self.bulk_create(Task, tasks)
+
+
+# command to run from terminal: python manage.py seed_benchmark_data [--scale 10] [--employees 5000]
@@ -0,0 +1,96 @@
+# manager/management/commands/send_queued_mail
+
+import datetime
+import time
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from manager.models import OutgoingEmail
+
+
+class Command(BaseCommand):
+    help = "Delivers the queued e-mails (OutgoingEmail) in batches, " \
+           "reusing one SMTP connection per batch and retrying failures with exponential backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--backoff', type=int, default=60,
+                            help="Seconds before the first retry; doubles at each new attempt.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox instead of exiting.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self.drain(options)
+            verbosity = options['verbosity']
+            if (verbosity >= 1 and (sent or failed)) or verbosity >= 2:
+                self.stdout.write("{0} e-mail(s) sent, {1} failed.".format(sent, failed))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def drain(self, options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = self.send_batch(options)
+            total_sent += sent
+            total_failed += failed
+            if sent + failed < options['batch_size']:
+                return total_sent, total_failed
+
+    def send_batch(self, options):
+        sent = failed = 0
+        with transaction.atomic():
+            # Rows stay locked while the batch is sent, so concurrent workers skip them
+            emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+                status=OutgoingEmail.PENDING, next_attempt_at__lte=timezone.now(),
+            ).order_by('id')[:options['batch_size']])
+            if not emails:
+                return sent, failed
+
+            connection = get_connection()
+            try:
+                connection.open()
+            except Exception as e:
+                for email in emails:
+                    self.retry(email, e, options)
+                return sent, len(emails)
+
+            try:
+                for email in emails:
+                    message = EmailMultiAlternatives(email.subject, email.message, email.from_email,
+                                                     email.recipient_list(), connection=connection)
+                    if email.html_message:
+                        message.attach_alternative(email.html_message, 'text/html')
+                    try:
+                        message.send()
+                    except Exception as e:
+                        self.retry(email, e, options)
+                        failed += 1
+                    else:
+                        email.status = OutgoingEmail.SENT
+                        email.attempts += 1
+                        email.sent_at = timezone.now()
+                        email.last_error = None
+                        email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+                        sent += 1
+            finally:
+                connection.close()
+
+        return sent, failed
+
+    def retry(self, email, error, options):
+        email.attempts += 1
+        email.last_error = repr(error)
+        if email.attempts >= options['max_attempts']:
+            email.status = OutgoingEmail.FAILED
+        else:
+            delay = options['backoff'] * 2 ** (email.attempts - 1)
+            email.next_attempt_at = timezone.now() + datetime.timedelta(seconds=delay)
+        email.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
+
+
+# command to run from terminal: python manage.py send_queued_mail --loop
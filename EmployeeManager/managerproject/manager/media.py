@@ -0,0 +1,154 @@
+"""
+Permission checked delivery of the uploaded files (Project.file, Task.file, Employee.profile_photo and its
+variants), instead of serving MEDIA_ROOT to anyone who has the URL.
+
+A file is served when a project, task or employee the user can see references it (the same rules as the
+API). The transfer itself is handed to the front proxy when MEDIA_SENDFILE_BACKEND is set:
+'x-accel-redirect' (nginx, with an internal location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT)
+or 'x-sendfile' (Apache mod_xsendfile, lighttpd). Without a backend the file is streamed from Python,
+with ETag, Last-Modified, conditional requests and single byte ranges.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .thumbnails import PHOTO_FORMATS, PHOTO_SIZES, variant_name
+
+MEDIA_SENDFILE_BACKEND = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+MEDIA_ACCEL_REDIRECT_PREFIX = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+READ_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_PHOTO_VARIANT = re.compile(r'^(?P<photo>.+)_\d+\.[a-z]+$')
+
+
+def photo_names(name):
+    """
+    Condition on Employee.profile_photo of the photos `name` may be (or be a variant of).
+    """
+    match = _PHOTO_VARIANT.match(name)
+    condition = Q(profile_photo=name)
+    if match:
+        condition |= Q(profile_photo=match.group('photo'))
+    return condition
+
+
+def is_photo_of(name, photo):
+    return name == photo or name in {variant_name(photo, size, format)
+                                     for size in PHOTO_SIZES for format in PHOTO_FORMATS}
+
+
+def is_accessible(user, name):
+    """
+    Whether the file is referenced by an employee photo, project, task or upload session the user can see.
+    """
+    from .models import Employee, Project, Task, UploadSession
+
+    if user.is_superuser:
+        return True
+    if name.startswith(Employee._meta.get_field('profile_photo').upload_to.split('/')[0] + '/'):
+        photos = Employee.objects.visible_to(user).filter(photo_names(name)).values_list('profile_photo', flat=True)
+        return any(is_photo_of(name, photo) for photo in photos)
+    return Project.objects.visible_to(user).filter(file=name).exists() or \
+        Task.objects.visible_to(user).filter(file=name).exists() or \
+        UploadSession.objects.filter(employee=user, file=name).exists()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, end included. None to send the whole file (no range, several
+    ranges or an invalid one); ValueError when the range is outside the file.
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # The last `end` bytes
+        if not int(end) or not size:
+            raise ValueError(header)
+        return max(size - int(end), 0), size - 1
+    start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise ValueError(header)
+    return (start, end) if start <= end else None
+
+
+def read_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def sendfile_response(storage, name):
+    """
+    An empty response telling the front proxy which file to send.
+    """
+    response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    if MEDIA_SENDFILE_BACKEND == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+    else:
+        response['X-Sendfile'] = storage.path(name)
+    return response
+
+
+def file_response(request, storage, name):
+    """
+    Streams the file, honouring If-None-Match/If-Modified-Since (304), If-Match/If-Unmodified-Since (412)
+    and Range/If-Range (206, 416).
+    """
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = '"{0:x}-{1:x}"'.format(int(stat.st_mtime), stat.st_size)
+    last_modified = http_date(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if 'HTTP_RANGE' in request.META and if_range in (None, etag, last_modified):
+            try:
+                byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{0}'.format(stat.st_size)
+                return response
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(open(path, 'rb'), start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, stat.st_size)
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return response
+
+
+def serve(request, storage, name):
+    if MEDIA_SENDFILE_BACKEND:
+        response = sendfile_response(storage, name)
+    else:
+        response = file_response(request, storage, name)
+    # Permission checked: shared caches must not keep it, browsers revalidate with the ETag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,143 @@
+"""
+Per-request SQL instrumentation.
+
+QueryInstrumentationMiddleware records the queries of every request (count, database time and the
+fingerprints run more than once), adds them to the response as a Server-Timing header, keeps running
+totals per view name (query_stats()) and logs the requests over their URL's query budget
+(query_budgets in manager/urls.py) and the queries repeated DUPLICATE_QUERY_THRESHOLD times. With
+QUERY_BUDGET_STRICT (set by the test runner, see runner.py) it raises QueryBudgetExceeded instead, which
+fails the test that made the request.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('manager.queries')
+
+# A query run this many times in one request (with any parameters) is logged as a probable N+1
+DUPLICATE_QUERY_THRESHOLD = getattr(settings, 'DUPLICATE_QUERY_THRESHOLD', 3)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACES = re.compile(r'\s+')
+_SAVEPOINTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """
+    The query without its parameters: the same fingerprint repeated in a request usually means an N+1.
+    """
+    return _IN_LIST.sub('IN (...)', _SPACES.sub(' ', sql).strip())
+
+
+class QueryRecorder(object):
+    """
+    Records the queries run on every database connection while used as a context manager.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # seconds
+        self.fingerprints = Counter()
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            if not sql.startswith(_SAVEPOINTS):
+                self.count += 1
+                self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold=2):
+        """
+        {fingerprint: times} of the queries run at least `threshold` times.
+        """
+        return {sql: times for sql, times in self.fingerprints.items() if times >= threshold}
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record_stats(view_name, recorder):
+    with _stats_lock:
+        stats = _stats.setdefault(view_name, {'requests': 0, 'queries': 0, 'db_time': 0.0, 'duplicates': Counter()})
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['db_time'] += recorder.duration
+        stats['duplicates'].update(recorder.duplicates().keys())
+
+
+def query_stats():
+    """
+    Totals per view name since the process started: requests, queries, db_time (seconds)
+    and duplicates ({fingerprint: requests in which it ran more than once}).
+    """
+    with _stats_lock:
+        return {name: dict(stats, duplicates=dict(stats['duplicates'])) for name, stats in _stats.items()}
+
+
+def get_query_budget(url_name, method):
+    """
+    The most queries a request to `url_name` should run: query_budgets in manager/urls.py maps URL names
+    to a number, or to {method: number}.
+    """
+    from .urls import query_budgets
+    budget = query_budgets.get(url_name)
+    return budget.get(method) if isinstance(budget, dict) else budget
+
+
+class QueryInstrumentationMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        response.query_recorder = recorder
+        response['Server-Timing'] = 'db;dur={0:.1f};desc="{1} queries", app;dur={2:.1f}'.format(
+            recorder.duration * 1000, recorder.count, (total - recorder.duration) * 1000)
+        record_stats(match.view_name, recorder)
+
+        budget = get_query_budget(match.url_name, request.method)
+        if budget is not None and recorder.count > budget:
+            self.report("%s %s (%s): %d queries, budget is %d", request.method, request.path, match.url_name,
+                        recorder.count, budget)
+        for sql, times in recorder.duplicates(DUPLICATE_QUERY_THRESHOLD).items():
+            self.report("%s %s (%s): query run %d times: %s", request.method, request.path, match.view_name,
+                        times, sql[:500])
+        return response
+
+    def report(self, message, *args):
+        # Read on every request, so that override_settings applies
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message % args)
+        logger.warning(message, *args)
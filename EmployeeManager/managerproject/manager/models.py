@@ -1,18 +1,68 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser, Group
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction, connections, router
+from django.db.models import Case, F, Q, Value, When
+from django.contrib.auth.models import AbstractUser, Group, UserManager
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate, m2m_changed
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
 from .utils import create_hash
+from .authentication import token_cache
+from .permissions import invalidate_permission_context
+from .caching import bump_version
+from .dashboard import invalidate_dashboards
 
 # Create your models here.
 
+MANAGER_CYCLE_ERROR = 'Um funcionário não pode ser gerenciado por alguém da sua própria equipe.'
+
+
+class EmployeeQuerySet(models.QuerySet):
+
+    def subtree_of(self, employee, depth=None, include_self=False):
+        """
+        Employees managed by `employee`, directly or not, in a single join with the EmployeeClosure table.
+        `depth` limits how many levels down to go (1 = direct reports).
+        """
+        links = {'ancestor_links__ancestor': employee}
+        if not include_self:
+            links['ancestor_links__depth__gt'] = 0
+        if depth is not None:
+            links['ancestor_links__depth__lte'] = depth
+        return self.filter(**links)
+
+    def ancestors_of(self, employee, include_self=False):
+        """
+        The managers chain of `employee`, up to the top of the organization.
+        """
+        links = {'descendant_links__descendant': employee}
+        if not include_self:
+            links['descendant_links__depth__gt'] = 0
+        return self.filter(**links)
+
+    def visible_to(self, user):
+        """
+        Employees the user works with: itself, its manager and reports, its department and its projects' teams.
+        """
+        condition = Q(pk=user.pk) | Q(manager_id=user.pk) | Q(projects__team=user)
+        if user.manager_id is not None:
+            condition |= Q(pk=user.manager_id)
+        if user.department_id is not None:
+            condition |= Q(department_id=user.department_id)
+        return self.filter(condition).distinct()
+
+
+class EmployeeUserManager(UserManager.from_queryset(EmployeeQuerySet)):
+    pass
+
 
 class Employee(AbstractUser):
     ADMIN = 'Admin'
@@ -39,21 +89,53 @@ class Employee(AbstractUser):
                                       verbose_name='Foto do usuário')
     # ImageField stores a specif type of file: images (.png, .gif, .jpg)
     # Requires Pillow: pip install Pillow
+    # Set when the fixed-size variants of the photo have been generated (see thumbnails.py)
+    profile_photo_variants_ready = models.BooleanField(default=False, editable=False,
+                                                       verbose_name='Miniaturas da foto geradas')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    objects = EmployeeUserManager()
+
     def __str__(self):
         # return "%i " % self.id
         return self.first_name + " " + self.last_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # To notice a new profile photo on save (see signals below)
+        if 'profile_photo' in field_names:
+            instance._loaded_profile_photo = instance.profile_photo.name or None
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Updates the EmployeeClosure rows in the same transaction (see signals below)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def is_manager(self):
         return self.manager is None
 
+    def has_in_team(self, employee_id):
+        """
+        Whether the employee is this one or someone it manages, directly or not (see EmployeeClosure).
+        """
+        return self.pk is not None and employee_id is not None and \
+            EmployeeClosure.objects.filter(ancestor_id=self.pk, descendant_id=employee_id).exists()
+
+    def clean(self):
+        super().clean()
+        # A field error for the admin forms; the pre_save signal below is the last guard
+        if self.has_in_team(self.manager_id):
+            raise ValidationError({'manager': MANAGER_CYCLE_ERROR})
+
     class Meta:
         verbose_name = "Funcionário"
     #     verbose_name_plural = "Funcionários"
         ordering = ['first_name']
+        indexes = [models.Index(fields=['first_name', 'id'])]  # API keyset pagination
 
     # This code is triggered whenever a new user has been created and saved to the database
     @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -79,6 +161,7 @@ class Job(models.Model):
         verbose_name = "Cargo"
         unique_together = (('title', 'department'),)  # Sets of field names that, taken together, must be unique
         ordering = ['title']
+        indexes = [models.Index(fields=['title', 'id'])]  # API keyset pagination
 
 
 class Departament(models.Model):
@@ -92,6 +175,18 @@ class Departament(models.Model):
         ordering = ['title']
 
 
+class ProjectQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        """
+        Projects the user works on; staff users also see the projects of the employees they manage.
+        """
+        if user.is_staff:
+            # SELECT * from project WHERE tem__id = request.user.id OR team__manager = request.user
+            return self.filter(Q(team__id=user.id) | Q(team__manager=user)).distinct()
+        return self.filter(team__id=user.id)
+
+
 class Project(models.Model):
     IN_PROGRESS = 'in_progress'
     LATE = 'late'
@@ -108,7 +203,8 @@ class Project(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=IN_PROGRESS, verbose_name='Situação')
     title = models.CharField(max_length=255, verbose_name='Projeto', unique_for_year='start_date')
     detail = models.TextField(blank=True, null=True, verbose_name='Detalhes')
-    file = models.FileField(blank=True, null=True, upload_to='files/%Y/%m/%d/', verbose_name='Arquivo')
+    # Indexed: the media view looks the files up by name (see media.py)
+    file = models.FileField(blank=True, null=True, upload_to='files/%Y/%m/%d/', db_index=True, verbose_name='Arquivo')
     client = models.ForeignKey('Client', on_delete=models.CASCADE, related_name='projects', verbose_name='Cliente')
     department = models.ForeignKey('Departament', on_delete=models.CASCADE, related_name='projects',
                                     verbose_name='Departamento')
@@ -118,10 +214,19 @@ class Project(models.Model):
     end_date = models.DateField(default=timezone.now, verbose_name='Data de término',
                                 help_text="Por favor, use o seguinte formato: <em>DD/MM/YYYY</em>.")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    # Also touched when the team changes (see signals below); read by the sync endpoint
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Atualizado em')
+
+    objects = ProjectQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Moves the department working hours rollup in the same transaction (see signals below)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     # def clean(self):
     #     if self.start_date > self.end_date:
     #         raise ValidationError('A data de término deve ser maior que a data de início.')
@@ -134,6 +239,22 @@ class Project(models.Model):
         verbose_name = "Projeto"
         # unique_together = (('title', 'client'),)  # Sets of field names that, taken together, must be unique
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['title', 'id']),  # API keyset pagination
+            models.Index(fields=['status', 'end_date']),  # flag_deadlines
+        ]
+
+
+class TaskQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        """
+        Tasks of the user; staff users also see the tasks of the employees they manage.
+        """
+        if user.is_staff:
+            # SELECT * from task WHERE employee = request.user OR employee__manager = request.user
+            return self.filter(Q(employee=user) | Q(employee__manager=user))
+        return self.filter(employee=user)
 
 
 class Task(models.Model):
@@ -141,7 +262,8 @@ class Task(models.Model):
     employee = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name='tasks', verbose_name='Funcionário')
     title = models.CharField(max_length=255, verbose_name='Tarefa')
     detail = models.TextField(blank=True, null=True, verbose_name='Detalhes')
-    file = models.FileField(blank=True, null=True, upload_to='files/%Y/%m/%d/', verbose_name='Arquivo')
+    # Indexed: the media view looks the files up by name (see media.py)
+    file = models.FileField(blank=True, null=True, upload_to='files/%Y/%m/%d/', db_index=True, verbose_name='Arquivo')
     URGENT = 0
     HIGH = 1
     NORMAL = 2
@@ -153,7 +275,7 @@ class Task(models.Model):
         (LOW, 'Baixa'),
     )
     priority = models.IntegerField(choices=PRIORITY_CHOICES, default=NORMAL, verbose_name='Prioridade')
-    due_date = models.DateField(default=timezone.now, verbose_name='Data limite de conclusão',
+    due_date = models.DateField(default=timezone.localdate, verbose_name='Data limite de conclusão',
                                 help_text="Por favor, use o seguinte formato: <em>DD/MM/YYYY</em>")
     CREATED = 'created'
     IN_PROGRESS = 'in_progress'
@@ -170,14 +292,29 @@ class Task(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=CREATED, verbose_name='Status')
     working_hours = models.DecimalField(decimal_places=2, max_digits=4, blank=True, null=True,
                                         verbose_name='Horas trabalhadas')
+    # Open and past its due_date, as of the last flag_deadlines run (see deadlines.py)
+    overdue = models.BooleanField(default=False, editable=False, verbose_name='Atrasada')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criada em')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Atualizada em')
+
+    objects = TaskQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Applies the working hours rollups deltas in the same transaction (see signals below)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Tarefa"
         ordering = ['priority']
+        indexes = [
+            models.Index(fields=['priority', 'due_date', 'id']),  # API keyset pagination
+            models.Index(fields=['employee', 'updated_at']),  # sync endpoint
+            models.Index(fields=['overdue', 'due_date']),  # flag_deadlines
+        ]
 
 
 class Client(models.Model):
@@ -190,6 +327,7 @@ class Client(models.Model):
     class Meta:
         verbose_name = "Cliente"
         ordering = ['name']
+        indexes = [models.Index(fields=['name', 'id'])]  # API keyset pagination
 
 
 class LostPassword(models.Model):
@@ -199,4 +337,568 @@ class LostPassword(models.Model):
     expired = models.BooleanField(default=False)
 
     def __str__(self):
-        return self.user.email
\ No newline at end of file
+        return self.user.email
+
+
+class OutgoingEmailManager(models.Manager):
+
+    def queue(self, subject, message, from_email, recipient_list, html_message=None):
+        """
+        Same arguments as django.core.mail.send_mail, but only stores the message.
+        Call it inside the request's transaction; the send_queued_mail command delivers it.
+        """
+        return self.create(subject=subject, message=message, html_message=html_message, from_email=from_email,
+                           recipients='\n'.join(recipient_list))
+
+
+class OutgoingEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pendente'),
+        (SENT, 'Enviado'),
+        (FAILED, 'Falhou'),
+    )
+    subject = models.CharField(max_length=255, verbose_name='Assunto')
+    message = models.TextField(blank=True, verbose_name='Mensagem')
+    html_message = models.TextField(blank=True, null=True, verbose_name='Mensagem HTML')
+    from_email = models.CharField(max_length=255, verbose_name='Remetente')
+    recipients = models.TextField(verbose_name='Destinatários')  # one address per line
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name='Situação')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Tentativas')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Próxima tentativa')
+    last_error = models.TextField(blank=True, null=True, verbose_name='Último erro')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')
+
+    objects = OutgoingEmailManager()
+
+    def __str__(self):
+        return self.subject
+
+    def recipient_list(self):
+        return self.recipients.splitlines()
+
+    class Meta:
+        verbose_name = "E-mail de saída"
+        verbose_name_plural = "E-mails de saída"
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]  # send_queued_mail batches
+
+
+class EmployeeClosure(models.Model):
+    """
+    Closure table of the Employee.manager hierarchy: one row for every (manager, managed employee) pair
+    at any distance, plus a depth 0 row linking each employee to itself.
+    Kept current by the Employee signals below and rebuilt by the rebuild_employee_closure command.
+    """
+    ancestor = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    def __str__(self):
+        return "{0} -> {1} ({2})".format(self.ancestor_id, self.descendant_id, self.depth)
+
+    class Meta:
+        unique_together = (('ancestor', 'descendant'),)
+        indexes = [models.Index(fields=['ancestor', 'depth']), models.Index(fields=['descendant', 'depth'])]
+
+
+def move_employee_subtree(employee_id, manager_id):
+    """
+    Re-links the subtree rooted at `employee_id` under `manager_id` (None = top of the organization):
+    drops the links to its old managers and adds one link per (new manager, subtree member) pair.
+    """
+    subtree = EmployeeClosure.objects.filter(ancestor_id=employee_id)
+    EmployeeClosure.objects.filter(descendant_id__in=subtree.values('descendant_id')).exclude(
+        ancestor_id__in=subtree.values('descendant_id')).delete()
+    if manager_id is None:
+        return
+    ancestors = list(EmployeeClosure.objects.filter(descendant_id=manager_id).values_list('ancestor_id', 'depth'))
+    EmployeeClosure.objects.bulk_create([
+        EmployeeClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + 1 + depth)
+        for descendant_id, depth in subtree.values_list('descendant_id', 'depth')
+        for ancestor_id, ancestor_depth in ancestors
+    ])
+
+
+class Tombstone(models.Model):
+    """
+    A deleted task or project, for the sync endpoint. With an employee, the object still exists but may
+    no longer be visible to that employee (reassigned task, team change...): the sync endpoint checks it
+    against the current visibility rules. Pruned by the prune_tombstones command.
+    """
+    TASK = 'task'
+    PROJECT = 'project'
+    KIND_CHOICES = (
+        (TASK, 'Tarefa'),
+        (PROJECT, 'Projeto'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Tipo')
+    object_id = models.PositiveIntegerField(verbose_name='Id')
+    employee = models.ForeignKey('Employee', blank=True, null=True, on_delete=models.CASCADE, related_name='+',
+                                 verbose_name='Funcionário')
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Removido em')
+
+    def __str__(self):
+        return "{0} {1}".format(self.kind, self.object_id)
+
+    class Meta:
+        verbose_name = "Remoção"
+        verbose_name_plural = "Remoções"
+
+
+def add_tombstones(kind, object_ids, employee_ids=None, include_managers=True):
+    """
+    Records the deletion of the objects or, with `employee_ids`, that they may no longer be visible to those
+    employees and (unless include_managers is False) to their managers, who see them through the employees.
+    """
+    object_ids = list(object_ids)
+    if employee_ids is None:
+        employee_ids = [None]
+    else:
+        employee_ids = set(employee_ids) - {None}
+        if include_managers:
+            employee_ids |= set(Employee.objects.filter(pk__in=employee_ids).exclude(manager=None).values_list(
+                'manager_id', flat=True))
+    if not object_ids or not employee_ids:
+        return
+    now = timezone.now()
+    Tombstone.objects.bulk_create([Tombstone(kind=kind, object_id=object_id, employee_id=employee_id, deleted_at=now)
+                                   for object_id in object_ids for employee_id in employee_ids])
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of a Project/Task file: the client sends the file in ranged chunks, appended to a
+    partial file, and completes the session to move it into the content addressed storage (see uploads.py).
+    `file` is then the stored name, set on the project or task through the "upload_id" of their serializers.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    employee = models.ForeignKey('Employee', on_delete=models.CASCADE, related_name='upload_sessions',
+                                 verbose_name='Funcionário')
+    filename = models.CharField(max_length=255, verbose_name='Nome do arquivo')
+    size = models.BigIntegerField(verbose_name='Tamanho')
+    received = models.BigIntegerField(default=0, verbose_name='Recebido')
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name='SHA-256')
+    file = models.FileField(blank=True, null=True, max_length=255, verbose_name='Arquivo')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Criado em')
+    completed_at = models.DateTimeField(blank=True, null=True, verbose_name='Concluído em')
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+    class Meta:
+        verbose_name = "Envio de arquivo"
+        verbose_name_plural = "Envios de arquivos"
+
+
+# Working hours rollups, kept current by the Task signals below and rebuilt by the rebuild_rollups command
+
+class WorkingHoursRollup(models.Model):
+    working_hours = models.DecimalField(decimal_places=2, max_digits=12, default=0, verbose_name='Horas trabalhadas')
+    task_count = models.PositiveIntegerField(default=0, verbose_name='Tarefas')
+
+    class Meta:
+        abstract = True
+
+
+class ProjectHours(WorkingHoursRollup):
+    project = models.OneToOneField('Project', primary_key=True, on_delete=models.CASCADE, related_name='hours',
+                                   verbose_name='Projeto')
+
+    class Meta:
+        verbose_name = "Horas por projeto"
+
+
+class EmployeeHours(WorkingHoursRollup):
+    employee = models.OneToOneField('Employee', primary_key=True, on_delete=models.CASCADE, related_name='hours',
+                                    verbose_name='Funcionário')
+
+    class Meta:
+        verbose_name = "Horas por funcionário"
+
+
+class DepartmentHours(WorkingHoursRollup):
+    # Department of the task's project
+    department = models.OneToOneField('Departament', primary_key=True, on_delete=models.CASCADE,
+                                      related_name='hours', verbose_name='Departamento')
+
+    class Meta:
+        verbose_name = "Horas por departamento"
+
+
+def add_rollup_delta(model, key, hours, tasks, create=True):
+    """
+    Adds hours/tasks to one rollup row with an UPDATE ... SET x = x + delta,
+    creating the row if it doesn't exist yet (unless `create` is False, e.g. while deleting).
+    """
+    if not hours and not tasks:
+        return
+    delta = {'working_hours': F('working_hours') + hours, 'task_count': F('task_count') + tasks}
+    if model.objects.filter(**key).update(**delta) or not create:
+        return
+    rollup, created = model.objects.get_or_create(defaults={'working_hours': hours, 'task_count': tasks}, **key)
+    if not created:
+        model.objects.filter(**key).update(**delta)
+
+
+def add_task_hours(project_id, employee_id, hours, tasks, create=True):
+    department_id = Project.objects.filter(pk=project_id).values_list('department_id', flat=True).first()
+    add_rollup_delta(ProjectHours, {'project_id': project_id}, hours, tasks, create)
+    add_rollup_delta(EmployeeHours, {'employee_id': employee_id}, hours, tasks, create)
+    if department_id is not None:
+        add_rollup_delta(DepartmentHours, {'department_id': department_id}, hours, tasks, create)
+
+
+def add_tasks_hours(changes):
+    """
+    Bulk version of add_task_hours for an iterable of (project_id, employee_id, hours, tasks).
+    The deltas are summed per rollup row, then each rollup table gets one INSERT of its missing rows and one
+    UPDATE ... SET x = x + CASE key WHEN ... END, whatever the number of tasks and rows.
+    """
+    changes = list(changes)
+    departments = dict(Project.objects.filter(pk__in={change[0] for change in changes}).values_list(
+        'id', 'department_id'))
+    deltas = defaultdict(lambda: defaultdict(lambda: [Decimal('0'), 0]))  # (model, key field) -> key -> deltas
+    for project_id, employee_id, hours, tasks in changes:
+        for model, key_field, key in ((ProjectHours, 'project_id', project_id),
+                                      (EmployeeHours, 'employee_id', employee_id),
+                                      (DepartmentHours, 'department_id', departments.get(project_id))):
+            if key is not None:
+                deltas[model, key_field][key][0] += hours
+                deltas[model, key_field][key][1] += tasks
+
+    for (model, key_field), rows in deltas.items():
+        rows = {key: delta for key, delta in rows.items() if any(delta)}
+        if not rows:
+            continue
+        # Rows only losing tasks must exist already (see add_rollup_delta's `create`)
+        model.objects.bulk_create([model(**{key_field: key}) for key, (hours, tasks) in rows.items() if tasks >= 0],
+                                  ignore_conflicts=True)
+        model.objects.filter(**{key_field + '__in': list(rows)}).update(
+            working_hours=F('working_hours') + Case(
+                *[When(then=Value(hours), **{key_field: key}) for key, (hours, tasks) in rows.items()],
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            task_count=F('task_count') + Case(
+                *[When(then=Value(tasks), **{key_field: key}) for key, (hours, tasks) in rows.items()],
+                output_field=models.IntegerField()),
+        )
+
+
+def reserve_ids(model, count, using=None):
+    """
+    Primary keys for `count` new rows of `model`, given explicitly to bulk_create when the new ids are needed
+    before the inserts, or the database doesn't return them (SQLite, MySQL). On PostgreSQL they are taken from
+    the table's sequence, so the concurrent inserts get other ones. Elsewhere they come after the last id the
+    table ever gave, as the autoincrement would, not after MAX(id): the ids of deleted rows keep their
+    tombstones and search documents. The sequences then continue after them, without a reset.
+    """
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                           [model._meta.db_table, model._meta.pk.column, count])
+            return [pk for pk, in cursor.fetchall()]
+    last_id = model._default_manager.using(using).aggregate(last_id=models.Max('pk'))['last_id'] or 0
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [model._meta.db_table])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT AUTO_INCREMENT - 1 FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [model._meta.db_table])
+        row = cursor.fetchone() if connection.vendor in ('sqlite', 'mysql') else None
+    last_id = max(last_id, row[0] or 0 if row else 0)
+    return range(last_id + 1, last_id + 1 + count)
+
+
+def bulk_create_tasks(tasks, batch_size=None):
+    """
+    Inserts the tasks with bulk_create and does what the Task signals would have done for each one
+    (working hours rollups, search documents), all in one transaction. Sets the primary keys of `tasks`.
+    """
+    from .search import KINDS_BY_MODEL, index_documents
+
+    connection = connections[router.db_for_write(Task)]
+    with transaction.atomic(using=connection.alias):
+        if not connection.features.can_return_ids_from_bulk_insert:
+            # e.g. SQLite, which doesn't return the new ids: take the next ones. SQLite has a single writer,
+            # a concurrent insert makes this transaction fail on the primary key instead of mixing rows up.
+            for task, pk in zip(tasks, reserve_ids(Task, len(tasks), using=connection.alias)):
+                task.pk = pk
+        Task.objects.using(connection.alias).bulk_create(tasks, batch_size=batch_size)
+        add_tasks_hours((task.project_id, task.employee_id, task.working_hours or Decimal('0'), 1) for task in tasks)
+        index_documents(connection, KINDS_BY_MODEL[Task], tasks)
+    invalidate_dashboards(*(task.employee_id for task in tasks))
+    return tasks
+
+
+def bulk_update_tasks(tasks, fields, old_values, batch_size=None):
+    """
+    Saves `fields` of the tasks with bulk_update and applies the rollup, search and sync changes the Task signals
+    would have applied, in one transaction. `old_values` maps each task pk to its (project_id, employee_id,
+    working_hours) before the changes.
+    """
+    from .search import KINDS_BY_MODEL, index_documents
+
+    connection = connections[router.db_for_write(Task)]
+    with transaction.atomic(using=connection.alias):
+        # bulk_update doesn't run the auto_now of updated_at
+        now = timezone.now()
+        for task in tasks:
+            task.updated_at = now
+        Task.objects.using(connection.alias).bulk_update(tasks, set(fields) | {'updated_at'}, batch_size=batch_size)
+
+        changes = []
+        reassigned = defaultdict(list)  # old employee id -> task ids
+        for task in tasks:
+            project_id, employee_id, hours = old_values[task.pk]
+            hours = hours or Decimal('0')
+            new_hours = task.working_hours or Decimal('0')
+            if (project_id, employee_id) == (task.project_id, task.employee_id):
+                changes.append((project_id, employee_id, new_hours - hours, 0))
+            else:
+                changes.append((project_id, employee_id, -hours, -1))
+                changes.append((task.project_id, task.employee_id, new_hours, 1))
+            if employee_id != task.employee_id:
+                reassigned[employee_id].append(task.pk)
+        add_tasks_hours(changes)
+        for employee_id, task_ids in reassigned.items():
+            add_tombstones(Tombstone.TASK, task_ids, [employee_id])
+        if {'title', 'detail'} & set(fields):
+            index_documents(connection, KINDS_BY_MODEL[Task], tasks)
+    invalidate_dashboards(*[task.employee_id for task in tasks] + [old[1] for old in old_values.values()])
+    return tasks
+
+
+# Signals
+
+@receiver(pre_save, sender=Employee)
+def remember_employee_manager(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._closure_manager_id = None
+    if not instance.pk or raw or (update_fields is not None and 'manager' not in update_fields):
+        instance._closure_manager_changed = False
+        return
+
+    instance._closure_manager_id = Employee.objects.filter(pk=instance.pk).values_list('manager_id', flat=True).first()
+    instance._closure_manager_changed = instance._closure_manager_id != instance.manager_id
+    if instance._closure_manager_changed and instance.has_in_team(instance.manager_id):
+        raise ValidationError(MANAGER_CYCLE_ERROR)
+
+
+@receiver(post_save, sender=Employee)
+def update_employee_closure(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        EmployeeClosure.objects.create(ancestor_id=instance.pk, descendant_id=instance.pk, depth=0)
+        if instance.manager_id is not None:
+            move_employee_subtree(instance.pk, instance.manager_id)
+    elif getattr(instance, '_closure_manager_changed', False):
+        move_employee_subtree(instance.pk, instance.manager_id)
+
+
+@receiver(pre_save, sender=Task)
+def remember_task_rollup_values(sender, instance, raw=False, **kwargs):
+    instance._rollup_old = None
+    if instance.pk and not raw:
+        instance._rollup_old = Task.objects.select_for_update().filter(pk=instance.pk).values_list(
+            'project_id', 'employee_id', 'working_hours').first()
+
+
+@receiver(post_save, sender=Task)
+def update_task_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_rollup_old', None)
+    new = (instance.project_id, instance.employee_id, instance.working_hours or Decimal('0'))
+    if old is None:
+        add_task_hours(*new, tasks=1)
+        return
+
+    old = old[:2] + (old[2] or Decimal('0'),)
+    if old[:2] == new[:2]:
+        add_task_hours(new[0], new[1], new[2] - old[2], tasks=0)
+    else:
+        add_task_hours(old[0], old[1], -old[2], tasks=-1, create=False)
+        add_task_hours(*new, tasks=1)
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_rollups(sender, instance, **kwargs):
+    add_task_hours(instance.project_id, instance.employee_id, -(instance.working_hours or Decimal('0')), tasks=-1,
+                   create=False)
+
+
+@receiver(pre_save, sender=Project)
+def remember_project_department(sender, instance, raw=False, **kwargs):
+    instance._rollup_department_id = None
+    if instance.pk and not raw:
+        instance._rollup_department_id = Project.objects.filter(pk=instance.pk).values_list(
+            'department_id', flat=True).first()
+
+
+@receiver(post_save, sender=Project)
+def move_project_department_rollup(sender, instance, raw=False, **kwargs):
+    old_department_id = getattr(instance, '_rollup_department_id', None)
+    if raw or old_department_id is None or old_department_id == instance.department_id:
+        return
+    rollup = ProjectHours.objects.filter(project=instance).first()
+    if rollup is not None:
+        add_rollup_delta(DepartmentHours, {'department_id': old_department_id}, -rollup.working_hours,
+                         -rollup.task_count, create=False)
+        add_rollup_delta(DepartmentHours, {'department_id': instance.department_id}, rollup.working_hours,
+                         rollup.task_count)
+
+
+
+# Drop cached token -> user entries whenever the token goes away or the user changes (e.g. is deactivated).
+# After the commit: a concurrent cache miss would otherwise store the old row again.
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: token_cache.invalidate(key))
+
+
+@receiver(post_save, sender=Employee)
+def invalidate_cached_user_tokens(sender, instance, created=False, **kwargs):
+    if not created:
+        keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+        transaction.on_commit(lambda: token_cache.invalidate(*keys))
+
+
+# Fixed-size variants of the profile photo, generated in a thread pool after commit (see thumbnails.py)
+@receiver(pre_save, sender=Employee)
+def reset_profile_photo_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._profile_photo_changed = False
+    if raw or 'profile_photo' in instance.get_deferred_fields() or \
+            (update_fields is not None and 'profile_photo' not in update_fields):
+        return
+    old_name = getattr(instance, '_loaded_profile_photo', None)
+    if (instance.profile_photo.name or None) != old_name:
+        instance._profile_photo_changed = True
+        instance.profile_photo_variants_ready = False
+
+
+@receiver(post_save, sender=Employee)
+def schedule_profile_photo_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not getattr(instance, '_profile_photo_changed', False):
+        return
+    from .thumbnails import schedule_variants
+    if update_fields is not None and 'profile_photo_variants_ready' not in update_fields:
+        Employee.objects.filter(pk=instance.pk).update(profile_photo_variants_ready=False)
+    old_name = getattr(instance, '_loaded_profile_photo', None)
+    instance._loaded_profile_photo = instance.profile_photo.name or None
+    if instance._loaded_profile_photo or old_name:
+        schedule_variants(instance.pk, instance._loaded_profile_photo, old_name)
+
+
+# Cached dashboards of the employees whose tasks or teams change (see dashboard.py)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_dashboards(sender, instance, raw=False, **kwargs):
+    old = getattr(instance, '_rollup_old', None)
+    invalidate_dashboards(instance.employee_id, old[1] if old is not None else None)
+
+
+# Cached managed employee ids of the permission context (see permissions.PermissionContext)
+@receiver(post_save, sender=Employee)
+def invalidate_manager_permission_context(sender, instance, created=False, **kwargs):
+    if created:
+        invalidate_permission_context(instance.pk, instance.manager_id)
+    elif getattr(instance, '_closure_manager_changed', False):
+        invalidate_permission_context(instance._closure_manager_id, instance.manager_id)
+
+
+@receiver(post_delete, sender=Employee)
+def invalidate_deleted_permission_context(sender, instance, **kwargs):
+    invalidate_permission_context(instance.pk, instance.manager_id)
+
+
+# Cached API payloads of the reference data (see caching.VersionedCacheMixin)
+@receiver(post_save, sender=Departament)
+@receiver(post_save, sender=Job)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Departament)
+@receiver(post_delete, sender=Job)
+@receiver(post_delete, sender=Client)
+def bump_model_version(sender, **kwargs):
+    # After the commit: a concurrent reader could otherwise cache the old rows under the new version
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+# Full-text search documents of tasks, projects and clients (see search.py)
+@receiver(post_migrate)
+def create_search_index(sender, using='default', **kwargs):
+    if sender.name == 'manager':
+        from .search import create_search_index
+        create_search_index(connections[using])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Client)
+def index_search_document(sender, instance, **kwargs):
+    from .search import index_object
+    index_object(instance)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Client)
+def unindex_search_document(sender, instance, **kwargs):
+    from .search import unindex_object
+    unindex_object(instance)
+
+
+# Sync endpoint: deletions and lost visibility become tombstones, team and manager changes touch updated_at
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Project)
+def add_deletion_tombstone(sender, instance, **kwargs):
+    add_tombstones(Tombstone.TASK if sender is Task else Tombstone.PROJECT, [instance.pk])
+
+
+@receiver(post_save, sender=Task)
+def add_reassigned_task_tombstone(sender, instance, raw=False, **kwargs):
+    old = getattr(instance, '_rollup_old', None)
+    if not raw and old is not None and old[1] != instance.employee_id:
+        add_tombstones(Tombstone.TASK, [instance.pk], [old[1]])
+
+
+@receiver(m2m_changed, sender=Project.team.through)
+def touch_project_team(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    if action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if reverse:
+        # employee.projects.add/remove/clear()
+        project_ids = pk_set if action != 'pre_clear' else instance.projects.values_list('pk', flat=True)
+        employee_ids = [instance.pk]
+    else:
+        project_ids = [instance.pk]
+        employee_ids = pk_set if action != 'pre_clear' else instance.team.values_list('pk', flat=True)
+    project_ids, employee_ids = list(project_ids), list(employee_ids)
+    Project.objects.filter(pk__in=project_ids).update(updated_at=timezone.now())
+    invalidate_dashboards(*employee_ids)
+    if action != 'post_add':
+        add_tombstones(Tombstone.PROJECT, project_ids, employee_ids)
+
+
+@receiver(post_save, sender=Employee)
+def touch_managed_employee_objects(sender, instance, raw=False, **kwargs):
+    # The new manager starts seeing the employee's tasks and projects, the old one may stop seeing them
+    if raw or not getattr(instance, '_closure_manager_changed', False):
+        return
+    tasks = Task.objects.filter(employee=instance)
+    projects = Project.objects.filter(team=instance)
+    tasks.update(updated_at=timezone.now())
+    projects.update(updated_at=timezone.now())
+    if instance._closure_manager_id is not None:
+        old_manager = [instance._closure_manager_id]
+        add_tombstones(Tombstone.TASK, tasks.values_list('pk', flat=True), old_manager, include_managers=False)
+        add_tombstones(Tombstone.PROJECT, projects.values_list('pk', flat=True), old_manager, include_managers=False)
@@ -0,0 +1,182 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a composite ordering, e.g. ('priority', 'due_date', 'id').
+
+    The cursor holds the values of every ordering field of the boundary row, so each page is a
+    `WHERE (a, b, id) > (x, y, z) ORDER BY a, b, id LIMIT n` that uses the matching index: deep pages
+    cost the same as the first one and no COUNT(*) is ever issued.
+    The view sets the ordering with an `ordering` attribute, which must end with a unique field.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'ordering', None) or self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request, queryset.model)
+
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            reverse, position = self.cursor
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._get_keyset_filter(ordering, position))
+
+        # Fetch one extra row to know if there is a following page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor((False, position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor((True, position))
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_').decode('utf-8'))
+            reverse, position = bool(cursor['r']), cursor['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # The cursor comes from the client: each value must be valid for its field
+        try:
+            position = [model._meta.get_field(order.lstrip('-')).to_python(value)
+                        for order, value in zip(self.ordering, position)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def encode_cursor(self, cursor):
+        reverse, position = cursor
+        data = json.dumps({'r': int(reverse), 'p': position}, separators=(',', ':'))
+        encoded = b64encode(data.encode('utf-8'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for order in ordering:
+            field = instance._meta.get_field(order.lstrip('-'))
+            position.append(field.value_to_string(instance))
+        return position
+
+    def _get_keyset_filter(self, ordering, position):
+        """
+        Builds the lexicographic "row comes after position" condition for the given ordering.
+        The leading `>=`/`<=` on the first field lets the database start an index range scan.
+        """
+        keyset = Q()
+        equal = Q()
+        for order, value in zip(ordering, position):
+            attr = order.lstrip('-')
+            lookup = '__lt' if order.startswith('-') else '__gt'
+            keyset |= equal & Q(**{attr + lookup: value})
+            equal &= Q(**{attr: value})
+
+        first = ordering[0]
+        lookup = '__lte' if first.startswith('-') else '__gte'
+        return Q(**{first.lstrip('-') + lookup: position[0]}) & keyset
+
+
+def _reverse_ordering(ordering):
+    return tuple(order[1:] if order.startswith('-') else '-' + order for order in ordering)
+
+
+def estimate_count(queryset):
+    """
+    Returns the query planner's row estimate for the queryset, or None when the database can't tell.
+
+    PostgreSQL: pg_class.reltuples for a whole table, EXPLAIN's "Plan Rows" for a filtered queryset.
+    SQLite: the row count stored by ANALYZE in sqlite_stat1, for whole tables only.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    filtered = bool(queryset.query.where) or queryset.query.distinct
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if not filtered:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+                row = cursor.fetchone()
+                # reltuples is -1 (or 0) until the table has been vacuumed/analyzed
+                return row[0] if row and row[0] > 0 else None
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+        if connection.vendor == 'sqlite' and not filtered:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin changelist paginator that uses the planner's row estimate instead of COUNT(*)
+    once the estimate reaches `threshold` rows. Small or unknown results are still counted exactly.
+    Use with `show_full_result_count = False`, otherwise the changelist runs its own COUNT(*) of the table.
+    """
+    threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.threshold:
+            return super().count
+        return estimate
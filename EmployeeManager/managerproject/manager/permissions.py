@@ -1,5 +1,59 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework import permissions
 
+PERMISSION_CACHE_TIMEOUT = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 300)
+
+
+def managed_ids_key(user_id):
+    return 'manager:managed:{0}'.format(user_id)
+
+
+def invalidate_permission_context(*user_ids):
+    """
+    Drops the cached managed employee ids of the users, e.g. when an employee's manager changes, once the
+    transaction commits (a request running meanwhile would cache the ids from before the change again).
+    """
+    keys = [managed_ids_key(user_id) for user_id in user_ids if user_id is not None]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class PermissionContext(object):
+    """
+    What the permission checks need to know about the user, computed once per request: the ids of the
+    employees it manages (cached per user). Object checks are then set-membership tests, without queries.
+    """
+
+    def __init__(self, user):
+        self.user_id = user.id
+        self.is_staff = user.is_staff
+        key = managed_ids_key(user.id)
+        managed_ids = cache.get(key)
+        if managed_ids is None:
+            managed_ids = frozenset(get_user_model().objects.filter(manager_id=user.id).values_list('id', flat=True))
+            cache.set(key, managed_ids, PERMISSION_CACHE_TIMEOUT)
+        self.managed_ids = managed_ids
+
+    def manages(self, employee_id):
+        return employee_id in self.managed_ids
+
+    def can_update_task(self, employee_id):
+        # UPDATE permissions are only allowed to the employee of a task or its manager
+        return employee_id == self.user_id or employee_id in self.managed_ids
+
+    def can_delete_task(self, employee_id):
+        # DELETE permission are only allowed to the managers of an employee's task
+        return employee_id in self.managed_ids or (self.is_staff and employee_id == self.user_id)
+
+
+def get_permission_context(request):
+    context = getattr(request, '_permission_context', None)
+    if context is None or context.user_id != request.user.id:
+        context = request._permission_context = PermissionContext(request.user)
+    return context
+
 
 class IsTaskOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -12,12 +66,9 @@ class IsTaskOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         else:
-            # DELETE permission are only allowed to the managers of an employee's task
             if request.method == 'DELETE':
-                return obj.employee.manager == request.user or\
-                       (request.user.is_staff and obj.employee == request.user)
-            # UPDATE permissions are only allowed to the employee of a task or its manager
-            return obj.employee == request.user or obj.employee.manager == request.user
+                return get_permission_context(request).can_delete_task(obj.employee_id)
+            return get_permission_context(request).can_update_task(obj.employee_id)
 
 
 class IsStaffOrReadOnly(permissions.BasePermission):
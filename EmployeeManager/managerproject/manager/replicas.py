@@ -0,0 +1,121 @@
+"""
+Read replicas for the read-heavy API endpoints.
+
+The viewsets with ReplicaReadMixin run the reads of their safe-method `replica_actions` on one of the
+DATABASE_REPLICAS aliases (picked once per request), through ReplicaRouter; everything else, and every
+write, uses the "default" database. After a user's unsafe request, ReplicaPinMiddleware pins the user to
+"default" for REPLICA_PIN_SECONDS (in the shared cache, so across processes), long enough for the replicas
+to catch up: users always read their own writes.
+
+Without DATABASE_REPLICAS nothing changes.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+_state = threading.local()
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_key(user_id):
+    return 'manager:replica-pin:{0}'.format(user_id)
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id)) is not None
+
+
+def read_from_replica():
+    """
+    Sends the reads of this thread to a replica until read_from_primary(); returns its alias (None without
+    replicas).
+    """
+    replicas = get_replicas()
+    _state.alias = random.choice(replicas) if replicas else None
+    return _state.alias
+
+
+def read_from_primary():
+    _state.alias = None
+
+
+@contextmanager
+def primary():
+    """
+    Reads from "default" inside the block, e.g. what must not be stale.
+    """
+    alias, _state.alias = getattr(_state, 'alias', None), None
+    try:
+        yield
+    finally:
+        _state.alias = alias
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        # Writes of the instances read from a replica (Django would use the instance's database)
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in get_replicas():
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS} | set(get_replicas())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin(object):
+    """
+    Reads from a replica in the safe-method `replica_actions` of the viewset, unless the user is pinned to
+    the primary after a write.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaReadMixin, self).initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action in self.replica_actions and \
+                get_replicas() and not is_pinned(request.user.id):
+            read_from_replica()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super(ReplicaReadMixin, self).dispatch(request, *args, **kwargs)
+        finally:
+            read_from_primary()
+
+
+class ReplicaPinMiddleware(object):
+    """
+    Pins the users to the primary database for REPLICA_PIN_SECONDS after each of their unsafe requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # The API authenticates in the view, which also sets request.user
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and user is not None and user.is_authenticated and get_replicas():
+            pin_to_primary(user.id)
+        return response
@@ -0,0 +1,18 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """
+    Runs the tests with QUERY_BUDGET_STRICT: a request over its query budget (or repeating a query
+    DUPLICATE_QUERY_THRESHOLD times) raises QueryBudgetExceeded, which fails the test that made it.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._strict = override_settings(QUERY_BUDGET_STRICT=True)
+        self._strict.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._strict.disable()
+        super().teardown_test_environment(**kwargs)
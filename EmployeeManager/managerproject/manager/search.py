@@ -0,0 +1,139 @@
+"""
+Full-text search over tasks, projects and clients.
+
+The documents live in one search table, kept current by the model signals (see models.py) and filled
+from scratch by the rebuild_search_index command:
+- PostgreSQL: a regular table with a weighted tsvector column and a GIN index on it;
+- SQLite: an FTS5 virtual table (accent-insensitive, ranked with bm25).
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Task, Project, Client
+
+TABLE = 'manager_search_index'
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'portuguese')  # PostgreSQL text search configuration
+
+SearchKind = namedtuple('SearchKind', ['name', 'code', 'model', 'title_field', 'body_field'])
+KINDS = (
+    SearchKind('task', 1, Task, 'title', 'detail'),
+    SearchKind('project', 2, Project, 'title', 'detail'),
+    SearchKind('client', 3, Client, 'name', None),
+)
+KINDS_BY_NAME = {kind.name: kind for kind in KINDS}
+KINDS_BY_MODEL = {kind.model: kind for kind in KINDS}
+
+
+def is_supported(connection):
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def create_search_index(connection):
+    """
+    Creates the search table if it doesn't exist yet (called after migrate).
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {0} (id bigint PRIMARY KEY, kind smallint NOT NULL, "
+                "object_id integer NOT NULL, title text NOT NULL, vector tsvector NOT NULL)".format(TABLE))
+            cursor.execute("CREATE INDEX IF NOT EXISTS {0}_vector ON {0} USING GIN (vector)".format(TABLE))
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5(kind UNINDEXED, object_id UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 1')".format(TABLE))
+
+
+def _document_id(kind, object_id):
+    # One integer key per (kind, object): the primary key on PostgreSQL, the rowid on SQLite
+    return object_id * 4 + kind.code
+
+
+def _document(kind, instance):
+    title = getattr(instance, kind.title_field) or ''
+    body = (getattr(instance, kind.body_field) or '') if kind.body_field else ''
+    return _document_id(kind, instance.pk), kind.code, instance.pk, title, body
+
+
+def index_documents(connection, kind, instances):
+    documents = [_document(kind, instance) for instance in instances]
+    if not documents or not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                "INSERT INTO {0} (id, kind, object_id, title, vector) VALUES (%s, %s, %s, %s, "
+                "setweight(to_tsvector(%s::regconfig, %s), 'A') || setweight(to_tsvector(%s::regconfig, %s), 'B')) "
+                "ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, vector = EXCLUDED.vector".format(TABLE),
+                [(doc_id, code, object_id, title, SEARCH_CONFIG, title, SEARCH_CONFIG, body)
+                 for doc_id, code, object_id, title, body in documents])
+        else:
+            cursor.executemany("DELETE FROM {0} WHERE rowid = %s".format(TABLE),
+                               [(document[0],) for document in documents])
+            cursor.executemany("INSERT INTO {0} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)"
+                               .format(TABLE), documents)
+
+
+def index_object(instance):
+    kind = KINDS_BY_MODEL[type(instance)]
+    index_documents(connections[instance._state.db or 'default'], kind, [instance])
+
+
+def unindex_object(instance):
+    connection = connections[instance._state.db or 'default']
+    if not is_supported(connection):
+        return
+    kind = KINDS_BY_MODEL[type(instance)]
+    key = 'id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {0} WHERE {1} = %s".format(TABLE, key), [_document_id(kind, instance.pk)])
+
+
+def visible_queryset(kind, user):
+    """
+    Same visibility rules as the API viewsets.
+    """
+    if kind.model is Task:
+        return Task.objects.visible_to(user)
+    if kind.model is Project:
+        return Project.objects.visible_to(user)
+    return Client.objects.all()
+
+
+def search(user, text, kinds=KINDS, limit=20):
+    """
+    Returns up to `limit` dicts (type, id, title, rank), best matches first, among the objects visible to `user`.
+    Every word of `text` must match, as a word prefix.
+    """
+    words = re.findall(r'\w+', text)[:10]
+    if not words:
+        return []
+
+    results = []
+    for kind in kinds:
+        visible = visible_queryset(kind, user).order_by().values('pk')
+        connection = connections[visible.db]
+        visible_sql, visible_params = visible.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT s.object_id, s.title, ts_rank(s.vector, q) AS rank "
+                    "FROM {0} s, to_tsquery(%s::regconfig, %s) q "
+                    "WHERE s.kind = %s AND s.vector @@ q AND s.object_id IN ({1}) "
+                    "ORDER BY rank DESC LIMIT %s".format(TABLE, visible_sql),
+                    [SEARCH_CONFIG, ' & '.join(word + ':*' for word in words), kind.code] +
+                    list(visible_params) + [limit])
+            else:
+                cursor.execute(
+                    "SELECT object_id, title, -bm25({0}, 0, 0, 10.0, 1.0) AS rank FROM {0} "
+                    "WHERE {0} MATCH %s AND kind = %s AND object_id IN ({1}) "
+                    "ORDER BY rank DESC LIMIT %s".format(TABLE, visible_sql),
+                    [' '.join('"{0}"*'.format(word) for word in words), kind.code] + list(visible_params) + [limit])
+            results.extend({'type': kind.name, 'id': object_id, 'title': title, 'rank': rank}
+                           for object_id, title, rank in cursor.fetchall())
+
+    results.sort(key=lambda result: result['rank'], reverse=True)
+    return results[:limit]
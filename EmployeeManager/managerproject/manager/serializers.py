@@ -1,18 +1,119 @@
+import os
+import re
+
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Prefetch
+from django.utils.text import get_valid_filename
+
+from .models import Employee, Departament, Task, Project, Job, Client, UploadSession, MANAGER_CYCLE_ERROR
+from .thumbnails import variant_urls
+from .uploads import UPLOAD_MAX_SIZE
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the upload endpoints. "sha256" is optional: when given, completing the upload checks it.
+    """
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'size', 'sha256', 'received', 'file', 'created_at', 'completed_at',)
+        read_only_fields = ('received', 'file', 'created_at', 'completed_at',)
+
+    def validate_filename(self, value):
+        filename = get_valid_filename(os.path.basename(value.replace('\\', '/')))
+        if not filename:
+            raise serializers.ValidationError('Nome de arquivo inválido.')
+        return filename
 
-from .models import Employee, Departament, Task, Project, Job, Client
+    def validate_size(self, value):
+        if not 0 < value <= UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError('O arquivo deve ter de 1 a {} bytes.'.format(UPLOAD_MAX_SIZE))
+        return value
 
+    def validate_sha256(self, value):
+        value = value.lower()
+        if value and not re.match(r'^[0-9a-f]{64}$', value):
+            raise serializers.ValidationError('SHA-256 inválido.')
+        return value
 
-class TaskSerializer(serializers.ModelSerializer):
+
+class CompletedUploadField(serializers.PrimaryKeyRelatedField):
+    """
+    A completed upload session of the user, whose file goes to the model's "file" (see UploadedFileMixin).
+    """
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        user_id = request.user.id if request is not None else None
+        return UploadSession.objects.filter(employee_id=user_id, completed_at__isnull=False)
+
+
+class UploadedFileMixin(object):
+    """
+    Sets the file of the instance to the one of the completed upload session sent as "upload_id",
+    instead of a multipart upload (see uploads.py).
+    """
+
+    def validate(self, attrs):
+        upload = attrs.pop('upload', None)
+        if upload is not None:
+            attrs['file'] = upload.file.name
+        return super().validate(attrs)
+
+
+class TaskSerializer(UploadedFileMixin, serializers.ModelSerializer):
     project_id = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all(), source='project')
     project_title = serializers.ReadOnlyField(source='project.title')
     employee_id = serializers.PrimaryKeyRelatedField(queryset=Employee.objects.all(), source='employee',)
+    upload_id = CompletedUploadField(source='upload', write_only=True, required=False)
 
     class Meta:
         model = Task
-        fields = ('id', 'project_id', 'project_title', 'employee_id', 'title', 'detail', 'file', 'priority', 'due_date',
-                  'status', 'working_hours', 'created_at',)
+        fields = ('id', 'project_id', 'project_title', 'employee_id', 'title', 'detail', 'file', 'upload_id',
+                  'priority', 'due_date', 'status', 'overdue', 'working_hours', 'created_at', 'updated_at',)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the project, read by project_title.
+        """
+        return queryset.select_related('project')
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks the primary key up in the objects the view loaded beforehand (context['preloaded'][model]),
+    instead of running one query per item.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.context['preloaded'][self.get_queryset().model][int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class BulkTaskSerializer(TaskSerializer):
+    """
+    Serializer for the bulk task endpoints (one instance per item). Files are attached by "upload_id" only.
+    """
+    project_id = PreloadedPrimaryKeyRelatedField(queryset=Project.objects.all(), source='project')
+    employee_id = PreloadedPrimaryKeyRelatedField(queryset=Employee.objects.all(), source='employee')
+    file = serializers.FileField(read_only=True)
+
+
+class BulkTaskStatusSerializer(serializers.Serializer):
+    """
+    Serializer for the bulk task status endpoint.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=500)
+    status = serializers.ChoiceField(choices=Task.STATUS_CHOICES)
 
 
 class DepartmentSerializer(serializers.ModelSerializer):
@@ -38,13 +139,33 @@ class EmployeeSerializer(serializers.ModelSerializer):
     # job_title = serializers.ReadOnlyField(source='job.title')
     job_id = serializers.PrimaryKeyRelatedField(queryset=Job.objects.all())
     job = JobSerializer(read_only=True)
+    profile_photo_variants = serializers.SerializerMethodField()
     # projects = serializers.PrimaryKeyRelatedField(many=True, queryset=Project.objects.all())
     # tasks = TaskSerializer(many=True, read_only=True)
 
     class Meta:
         model = Employee
-        fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'profile_photo', 'category',
-                  'department_id', 'department_title', 'job_id', 'job', 'manager_id', )
+        fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'profile_photo',
+                  'profile_photo_variants', 'category', 'department_id', 'department_title', 'job_id', 'job',
+                  'manager_id', )
+
+    def get_profile_photo_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
+    def validate_manager_id(self, value):
+        if self.instance is not None and value is not None and self.instance.has_in_team(value.pk):
+            raise serializers.ValidationError(MANAGER_CYCLE_ERROR)
+        return value
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins department and job and loads only the columns this serializer reads.
+        """
+        return queryset.select_related('department', 'job').only(
+            'id', 'email', 'first_name', 'last_name', 'phone_number', 'profile_photo', 'profile_photo_variants_ready',
+            'category', 'department_id', 'department__title', 'job_id', 'job__title', 'manager_id',
+        )
 
 
 class SessionUserSerializer(serializers.ModelSerializer):
@@ -54,11 +175,16 @@ class SessionUserSerializer(serializers.ModelSerializer):
     job_id = serializers.PrimaryKeyRelatedField(queryset=Job.objects.all())
     job = JobSerializer(read_only=True)
     manager = EmployeeSerializer(read_only=True)
+    profile_photo_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Employee
-        fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'profile_photo', 'category',
-                  'department_id', 'department_title', 'job_id', 'job', 'manager_id', 'manager', )
+        fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'profile_photo',
+                  'profile_photo_variants', 'category', 'department_id', 'department_title', 'job_id', 'job',
+                  'manager_id', 'manager', )
+
+    def get_profile_photo_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
 
 
 class ClientSerializer(serializers.ModelSerializer):
@@ -70,17 +196,59 @@ class ClientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'email')
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(UploadedFileMixin, serializers.ModelSerializer):
     client_id = serializers.PrimaryKeyRelatedField(queryset=Client.objects.all(), source='client',)
     client = ClientSerializer(read_only=True)
     department_id = serializers.PrimaryKeyRelatedField(queryset=Departament.objects.all(), source='department',)
     team_id = serializers.PrimaryKeyRelatedField(many=True, queryset=Employee.objects.all(), source='team', write_only=True)
     team = EmployeeSerializer(many=True, read_only=True)
+    upload_id = CompletedUploadField(source='upload', write_only=True, required=False)
 
     class Meta:
         model = Project
-        fields = ('id', 'status', 'title', 'detail', 'file', 'client_id', 'client', 'department_id',
-                  'team_id', 'start_date', 'end_date', 'created_at', 'team', )
+        fields = ('id', 'status', 'title', 'detail', 'file', 'upload_id', 'client_id', 'client', 'department_id',
+                  'team_id', 'start_date', 'end_date', 'created_at', 'updated_at', 'team', )
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the client and prefetches the team (with its department and job) in a single extra query,
+        so the number of queries doesn't grow with the number of projects or team members.
+        """
+        team = EmployeeSerializer.setup_eager_loading(Employee.objects.all())
+        return queryset.select_related('client').prefetch_related(Prefetch('team', queryset=team))
+
+
+class WorkingHoursSerializer(serializers.Serializer):
+    """
+    Serializer for the working hours rollups (ProjectHours, EmployeeHours and DepartmentHours).
+    """
+    working_hours = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    task_count = serializers.IntegerField(read_only=True)
+
+
+class SearchResultSerializer(serializers.Serializer):
+    """
+    Serializer for search endpoint results.
+    """
+    type = serializers.CharField(read_only=True)
+    id = serializers.IntegerField(read_only=True)
+    title = serializers.CharField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+
+class DashboardSerializer(serializers.Serializer):
+    """
+    Serializer for the dashboard endpoint (see dashboard.py).
+    """
+    date = serializers.DateField(read_only=True)
+    task_count = serializers.IntegerField(read_only=True)
+    tasks_by_status = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    tasks_by_priority = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    overdue_tasks = serializers.IntegerField(read_only=True)
+    hours_due_this_week = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    project_count = serializers.IntegerField(read_only=True)
+    projects_by_status = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
 
 class EditEmployeeSerializer(serializers.ModelSerializer):
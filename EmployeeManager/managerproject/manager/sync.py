@@ -0,0 +1,75 @@
+"""
+Delta sync for the mobile app: the tasks and projects changed since the last sync, the ids of the ones
+deleted (or no longer visible to the user) and a new opaque token to send on the next sync.
+
+Changes are found with Task.updated_at / Project.updated_at (team changes touch the project) and the
+Tombstone rows written by the model signals (see models.py).
+"""
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task, Project, Tombstone
+from .serializers import ProjectSerializer, TaskSerializer
+
+TOKEN_SALT = 'manager.sync'
+# Rows written by transactions still open when a token is issued may get an updated_at older than the token:
+# every sync goes back this many seconds, the app applies rows idempotently.
+SYNC_OVERLAP = getattr(settings, 'SYNC_OVERLAP', 5)
+# Tombstones are pruned after this many days (prune_tombstones command); older tokens get a full sync
+SYNC_TOMBSTONE_DAYS = getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30)
+
+
+class InvalidSyncToken(Exception):
+    pass
+
+
+def make_token(user, issued_at):
+    return signing.dumps({'u': user.pk, 't': issued_at.timestamp()}, salt=TOKEN_SALT)
+
+
+def read_token(user, token):
+    """
+    Returns the time the token was issued at, or None if it's too old for the tombstones kept.
+    Raises InvalidSyncToken if it was tampered with or belongs to another user.
+    """
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise InvalidSyncToken(token)
+    if data.get('u') != user.pk:
+        raise InvalidSyncToken(token)
+    issued_at = datetime.datetime.fromtimestamp(data['t'], tz=datetime.timezone.utc)
+    if issued_at < timezone.now() - datetime.timedelta(days=SYNC_TOMBSTONE_DAYS):
+        return None
+    return issued_at
+
+
+def changes_since(user, since=None):
+    """
+    Returns (tasks, projects, deleted) for `user`, under the same visibility rules as the API viewsets:
+    the tasks and projects changed after `since` (all of them if None) and {'tasks': [...], 'projects': [...]},
+    the ids to drop.
+    """
+    tasks = TaskSerializer.setup_eager_loading(Task.objects.visible_to(user)).order_by('updated_at', 'id')
+    projects = ProjectSerializer.setup_eager_loading(Project.objects.visible_to(user)).order_by('updated_at', 'id')
+    deleted = {Tombstone.TASK: set(), Tombstone.PROJECT: set()}
+    if since is not None:
+        since -= datetime.timedelta(seconds=SYNC_OVERLAP)
+        tasks = tasks.filter(updated_at__gt=since)
+        projects = projects.filter(updated_at__gt=since)
+
+        hidden = {Tombstone.TASK: set(), Tombstone.PROJECT: set()}
+        tombstones = Tombstone.objects.filter(Q(employee=None) | Q(employee=user), deleted_at__gt=since)
+        for kind, object_id, employee_id in tombstones.values_list('kind', 'object_id', 'employee_id'):
+            (deleted if employee_id is None else hidden)[kind].add(object_id)
+        # Objects that may have left the user's view are only dropped if they really aren't visible anymore
+        for kind, model in ((Tombstone.TASK, Task), (Tombstone.PROJECT, Project)):
+            if hidden[kind]:
+                visible = model.objects.visible_to(user).filter(pk__in=hidden[kind]).values_list('pk', flat=True)
+                deleted[kind] |= hidden[kind] - set(visible)
+
+    return tasks, projects, {'tasks': sorted(deleted[Tombstone.TASK]), 'projects': sorted(deleted[Tombstone.PROJECT])}
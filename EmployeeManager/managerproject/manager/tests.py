@@ -1,3 +1,1516 @@
-from django.test import TestCase
+import asyncio
+import base64
+import copy
+import datetime
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .models import Employee, Departament, Job, Client, Project, Task, OutgoingEmail, ProjectHours, EmployeeHours,\
+    DepartmentHours, EmployeeClosure, bulk_create_tasks
+from .authentication import token_cache
+from .pagination import EstimatedCountPaginator, estimate_count
+from .middleware import DUPLICATE_QUERY_THRESHOLD, QueryBudgetExceeded, get_query_budget
+from .permissions import IsTaskOwnerOrReadOnly, PermissionContext, managed_ids_key
+from .serializers import EmployeeSerializer
+from .thumbnails import PHOTO_FORMATS, PHOTO_SIZES, process_photo, variant_name
+from .urls import query_budgets
+from . import deadlines, hashing, media, replicas, search, uploads
+
+
+@contextmanager
+def run_on_commit(using='default'):
+    """
+    Runs the transaction.on_commit callbacks registered inside the block when it exits, as a commit would
+    (a TestCase never commits).
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    for sids, callback in connection.run_on_commit[start:]:
+        callback()
+
+
+class QueryBudgetMixin(object):
+    """
+    assertWithinQueryBudget(response) fails when the request ran more queries than the budget of its URL name
+    (query_budgets in manager/urls.py), or ran the same query DUPLICATE_QUERY_THRESHOLD times (an N+1).
+    """
+
+    def assertWithinQueryBudget(self, response):
+        url_name, method = response.resolver_match.url_name, response.request['REQUEST_METHOD']
+        recorder = response.query_recorder
+        budget = get_query_budget(url_name, method)
+        self.assertIsNotNone(budget, "No query budget for {0} {1} in manager/urls.py".format(method, url_name))
+        self.assertLessEqual(recorder.count, budget, "{0} {1}: {2} queries, budget is {3}".format(
+            method, url_name, recorder.count, budget))
+        self.assertEqual(recorder.duplicates(DUPLICATE_QUERY_THRESHOLD), {},
+                         "{0} {1}: repeated queries".format(method, url_name))
+
+
+def create_company(target):
+    """
+    The rows most tests start from, as attributes of `target`: a department and its job, a client, a manager
+    (gerente@empresa.com, staff) with one employee (func@empresa.com), and a project without team.
+    """
+    target.department = Departament.objects.create(title='Desenvolvimento')
+    target.job = Job.objects.create(title='Desenvolvedor', department=target.department)
+    target.client_obj = Client.objects.create(name='Cliente', email='cliente@empresa.com')
+    target.manager = Employee.objects.create(email='gerente@empresa.com', first_name='Gerente', last_name='Top',
+                                             category=Employee.MANAGER, is_staff=True,
+                                             department=target.department, job=target.job)
+    target.employee = Employee.objects.create(email='func@empresa.com', first_name='Func', last_name='Top',
+                                              manager=target.manager, department=target.department, job=target.job)
+    target.project = Project.objects.create(title='Projeto', client=target.client_obj, department=target.department)
+
+
+class CompanyTestCase(TestCase):
+    """
+    TestCase whose setUpTestData creates the company of create_company, once per class. The subclasses add their
+    own rows in setUpTestData after calling super(), and each test gets its own copies of the class attributes it
+    set (as setUpTestData does from Django 3.2).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        attributes = set(vars(cls))
+        super().setUpClass()
+        cls.class_data = [name for name in vars(cls) if name not in attributes]
+
+    @classmethod
+    def setUpTestData(cls):
+        create_company(cls)
+
+    def setUp(self):
+        memo = {}
+        for name in self.class_data:
+            setattr(self, name, copy.deepcopy(getattr(type(self), name), memo))
+
+
+class ProjectViewSetTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.manager)
+
+    def create_projects(self, projects, team_size):
+        for _ in range(projects):
+            i = Project.objects.count()
+            project = Project.objects.create(title='Projeto {}'.format(i), client=self.client_obj,
+                                             department=self.department)
+            project.team.add(self.manager)
+            for j in range(team_size):
+                employee = Employee.objects.create(email='{}.{}@empresa.com'.format(i, j), first_name='Func',
+                                                   last_name=str(j), manager=self.manager,
+                                                   department=self.department, job=self.job)
+                project.team.add(employee)
+
+    def test_list_query_count_is_constant(self):
+        # projects joined with clients, team joined with departments and jobs
+        self.create_projects(projects=1, team_size=1)
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/v1/projects/')
+        self.assertEqual(response.status_code, 200)
+
+        self.create_projects(projects=5, team_size=10)
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/v1/projects/')
+        self.assertEqual(len(response.data['results']), 6)
+        team = response.data['results'][-1]['team']
+        self.assertEqual(len(team), 11)
+        self.assertEqual(team[0]['department_title'], 'Desenvolvimento')
+        self.assertEqual(team[0]['job']['title'], 'Desenvolvedor')
+
+
+class KeysetPaginationTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        today = datetime.date(2019, 1, 1)
+        for i in range(25):
+            Task.objects.create(project=cls.project, employee=cls.employee, title='Tarefa {}'.format(i),
+                                priority=i % 3, due_date=today + datetime.timedelta(days=i % 2))
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION='Token ' + self.employee.auth_token.key)
+
+    def test_walks_tasks_forward_and_backward(self):
+        expected = list(Task.objects.order_by('priority', 'due_date', 'id').values_list('id', flat=True))
+
+        pages = []
+        url = '/api/v1/tasks/?page_size=10'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.get(url)
+            self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertEqual([task['id'] for page in pages for task in page['results']], expected)
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.api.get(pages[-1]['previous'])
+        self.assertEqual([task['id'] for task in response.data['results']], expected[10:20])
+        response = self.api.get(response.data['previous'])
+        self.assertEqual([task['id'] for task in response.data['results']], expected[:10])
+        self.assertIsNone(response.data['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.api.get('/api/v1/tasks/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+        for position in (['High', '2019-01-01', 1], [{'a': 1}, '2019-01-01', 1], [0, 'amanhã', 1]):
+            data = json.dumps({'r': 0, 'p': position}).encode('utf-8')
+            cursor = base64.b64encode(data, altchars=b'-_').decode('ascii')
+            response = self.api.get('/api/v1/tasks/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+class CachedTokenAuthenticationTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION='Token ' + self.employee.auth_token.key)
+
+    def test_token_lookup_is_cached(self):
+        # token lookup joined with the user, then the (empty) tasks page
+        with self.assertNumQueries(2):
+            self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        stats = token_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_invalidated_on_user_deactivation(self):
+        self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        with run_on_commit():
+            self.employee.is_active = False
+            self.employee.save()
+            # not before the commit: a concurrent request could cache the old row again
+            self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 401)
+
+    def test_invalidated_on_token_delete(self):
+        self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        with run_on_commit():
+            self.employee.auth_token.delete()
+        self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 401)
+
+    def test_caches_only_what_authentication_reads(self):
+        Employee.objects.filter(pk=self.employee.pk).update(salary=Decimal('12345.67'), password='hash-secreto')
+        self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        created, values = cache.get(token_cache.key_prefix + self.employee.auth_token.key)
+        self.assertNotIn('hash-secreto', values)
+        self.assertNotIn(Decimal('12345.67'), values)
+
+    def test_cached_user_writes_only_what_the_view_changes(self):
+        self.assertEqual(self.api.get('/api/v1/tasks/').status_code, 200)
+        # changed after the user was cached, e.g. by an admin
+        Employee.objects.filter(pk=self.employee.pk).update(manager=None, category=Employee.MANAGER)
+
+        response = self.api.post('/api/v1/device-token/', {'token': 'dispositivo-1', 'type': 1})
+        self.assertEqual(response.status_code, 200)
+        employee = Employee.objects.get(pk=self.employee.pk)
+        self.assertEqual((employee.device_token, employee.manager_id, employee.category),
+                         ('dispositivo-1', None, Employee.MANAGER))
+
+
+class FailingEmailBackend(EmailBackend):
+
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP indisponível')
+
+
+class OutgoingEmailTests(CompanyTestCase):
+
+    def test_recover_password_queues_email(self):
+        response = APIClient().post('/api/v1/recover-password/', {'email': 'func@empresa.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipient_list(), ['func@empresa.com'])
+
+        call_command('send_queued_mail', verbosity=0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['func@empresa.com'])
+        self.assertIn(self.employee.lostpassword_set.get().hash, mail.outbox[0].alternatives[0][0])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+
+    def test_batches_share_one_connection(self):
+        for i in range(5):
+            OutgoingEmail.objects.queue('Assunto', 'Mensagem', 'naoresponda@empresa.com', ['{}@empresa.com'.format(i)])
+        call_command('send_queued_mail', batch_size=2, verbosity=0)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.SENT).exists())
+
+    @override_settings(EMAIL_BACKEND='manager.tests.FailingEmailBackend')
+    def test_failure_is_retried_with_backoff(self):
+        email = OutgoingEmail.objects.queue('Assunto', 'Mensagem', 'naoresponda@empresa.com', ['a@empresa.com'])
+        call_command('send_queued_mail', backoff=60, max_attempts=2, verbosity=0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        call_command('send_queued_mail', backoff=60, max_attempts=2, verbosity=0)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.FAILED, 2))
+        self.assertIn('SMTP indisponível', email.last_error)
+
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+@unittest.skipUnless(openpyxl, "openpyxl is not installed")
+class ImportClientTests(TestCase):
+
+    def write_workbook(self, sheets):
+        wb = openpyxl.Workbook()
+        wb.active.title = 'Capa'
+        for title, rows in sheets:
+            sheet = wb.create_sheet(title)
+            for row in [('Clientes',), (), ('Nome', 'E-mail', 'Telefone', 'Endereço')] + rows:
+                sheet.append(row)
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        wb.save(path)
+        return path
+
+    def test_upserts_and_dedupes(self):
+        Client.objects.create(name='Antigo', email='a@cliente.com')
+        path = self.write_workbook([
+            ('A', [('Novo A', 'a@cliente.com', '', ''), ('B', 'b@cliente.com', '', ''), ('C', 'c@cliente.com', '', '')]),
+            ('B', [('B repetido', 'b@cliente.com', '', ''), ('Sem e-mail', None, '', ''), ('D', 'd@cliente.com', '', '')]),
+        ])
+
+        call_command('import_client_from_xls', path, dry_run=True, verbosity=0)
+        self.assertEqual(Client.objects.count(), 1)
+
+        call_command('import_client_from_xls', path, chunk_size=2, verbosity=0)
+        self.assertEqual(dict(Client.objects.values_list('email', 'name')), {
+            'a@cliente.com': 'Novo A', 'b@cliente.com': 'B', 'c@cliente.com': 'C', 'd@cliente.com': 'D',
+        })
+
+        # new and renamed clients are searchable
+        user = Employee.objects.create(email='func@empresa.com', first_name='Func', last_name='Top')
+        clients = [search.KINDS_BY_NAME['client']]
+        self.assertEqual([result['title'] for result in search.search(user, 'Novo', clients)], ['Novo A'])
+        self.assertEqual(search.search(user, 'Antigo', clients), [])
+        self.assertEqual(len(search.search(user, 'D', clients)), 1)
+
+
+class WorkingHoursRollupTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.project.team.add(cls.manager, cls.employee)
+        cls.other_department = Departament.objects.create(title='Suporte')
+        cls.other_project = Project.objects.create(title='Outro', client=cls.client_obj,
+                                                   department=cls.other_department)
+
+    def hours(self, model, pk):
+        rollup = model.objects.get(pk=pk)
+        return rollup.working_hours, rollup.task_count
+
+    def test_rollups_follow_task_changes(self):
+        task = Task.objects.create(project=self.project, employee=self.employee, title='A', working_hours=5)
+        Task.objects.create(project=self.project, employee=self.manager, title='B', working_hours=2)
+        self.assertEqual(self.hours(ProjectHours, self.project.pk), (7, 2))
+        self.assertEqual(self.hours(EmployeeHours, self.employee.pk), (5, 1))
+        self.assertEqual(self.hours(DepartmentHours, self.department.pk), (7, 2))
+
+        task.working_hours = 8
+        task.save()
+        self.assertEqual(self.hours(ProjectHours, self.project.pk), (10, 2))
+
+        task.project = self.other_project
+        task.employee = self.manager
+        task.save()
+        self.assertEqual(self.hours(ProjectHours, self.project.pk), (2, 1))
+        self.assertEqual(self.hours(ProjectHours, self.other_project.pk), (8, 1))
+        self.assertEqual(self.hours(EmployeeHours, self.employee.pk), (0, 0))
+        self.assertEqual(self.hours(EmployeeHours, self.manager.pk), (10, 2))
+        self.assertEqual(self.hours(DepartmentHours, self.other_department.pk), (8, 1))
+
+        self.other_project.department = self.department
+        self.other_project.save()
+        self.assertEqual(self.hours(DepartmentHours, self.department.pk), (10, 2))
+        self.assertEqual(self.hours(DepartmentHours, self.other_department.pk), (0, 0))
+
+        task.delete()
+        self.assertEqual(self.hours(EmployeeHours, self.manager.pk), (2, 1))
+        call_command('rebuild_rollups', verify=True, verbosity=0)
+
+    def test_rebuild_fixes_drift(self):
+        Task.objects.create(project=self.project, employee=self.employee, title='A', working_hours=5)
+        ProjectHours.objects.update(working_hours=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', verify=True, verbosity=0)
+        call_command('rebuild_rollups', verbosity=0)
+        self.assertEqual(self.hours(ProjectHours, self.project.pk), (5, 1))
+        call_command('rebuild_rollups', verify=True, verbosity=0)
+
+    def test_hours_endpoints(self):
+        Task.objects.create(project=self.project, employee=self.employee, title='A', working_hours=5)
+        api = APIClient()
+        api.force_authenticate(user=self.manager)
+        with self.assertNumQueries(1):
+            response = api.get('/api/v1/projects/{}/hours/'.format(self.project.pk))
+        self.assertEqual(response.data, {'working_hours': '5.00', 'task_count': 1})
+        self.assertEqual(api.get('/api/v1/projects/{}/hours/'.format(self.other_project.pk)).status_code, 404)
+        response = api.get('/api/v1/departments/{}/hours/'.format(self.other_department.pk))
+        self.assertEqual(response.data, {'working_hours': '0.00', 'task_count': 0})
+        with self.assertNumQueries(1):
+            response = api.get('/api/v1/users/{}/hours/'.format(self.employee.pk))
+        self.assertEqual(response.data['task_count'], 1)
+        for url in ('/api/v1/projects/abc/hours/', '/api/v1/departments/abc/hours/', '/api/v1/users/abc/hours/'):
+            self.assertEqual(api.get(url).status_code, 404)
+
+
+class EmployeeClosureTests(TestCase):
+
+    def create(self, email, manager=None):
+        return Employee.objects.create(email=email, first_name=email, last_name='Top', manager=manager)
+
+    def setUp(self):
+        self.director = self.create('diretor@empresa.com')
+        self.manager = self.create('gerente@empresa.com', self.director)
+        self.other_manager = self.create('gerente2@empresa.com', self.director)
+        self.employee = self.create('func@empresa.com', self.manager)
+        self.intern = self.create('estagiario@empresa.com', self.employee)
+
+    def subtree(self, employee, **kwargs):
+        return set(Employee.objects.subtree_of(employee, **kwargs))
+
+    def test_subtree_queries(self):
+        self.assertEqual(self.subtree(self.director),
+                         {self.manager, self.other_manager, self.employee, self.intern})
+        self.assertEqual(self.subtree(self.director, depth=1), {self.manager, self.other_manager})
+        self.assertEqual(self.subtree(self.manager, include_self=True), {self.manager, self.employee, self.intern})
+        self.assertEqual(set(Employee.objects.ancestors_of(self.intern)), {self.employee, self.manager, self.director})
+
+    def test_moving_a_manager_moves_its_subtree(self):
+        self.employee.manager = self.other_manager
+        self.employee.save()
+        self.assertEqual(self.subtree(self.manager), set())
+        self.assertEqual(self.subtree(self.other_manager), {self.employee, self.intern})
+        self.assertEqual(EmployeeClosure.objects.get(ancestor=self.director, descendant=self.intern).depth, 3)
+        call_command('rebuild_employee_closure', verify=True, verbosity=0)
+
+    def test_cycles_are_rejected(self):
+        self.manager.manager = self.intern
+        # as field errors of the admin form and of the API
+        with self.assertRaises(ValidationError) as error:
+            self.manager.clean()
+        self.assertEqual(list(error.exception.message_dict), ['manager'])
+        serializer = EmployeeSerializer(Employee.objects.get(pk=self.manager.pk), data={'manager_id': self.intern.pk},
+                                        partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(list(serializer.errors), ['manager_id'])
+        with self.assertRaises(ValidationError):
+            self.manager.save()
+        self.other_manager.manager = self.manager
+        self.other_manager.clean()
+
+    def test_rebuild(self):
+        EmployeeClosure.objects.filter(descendant=self.intern).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_employee_closure', verify=True, verbosity=0)
+        call_command('rebuild_employee_closure', verbosity=0)
+        self.assertEqual(self.subtree(self.director, depth=3), {self.manager, self.other_manager, self.employee,
+                                                                self.intern})
+
+    def test_users_endpoint_depth(self):
+        api = APIClient()
+        api.force_authenticate(user=self.manager)
+        response = api.get('/api/v1/users/')
+        self.assertEqual([user['id'] for user in response.data['results']], [self.employee.id])
+        response = api.get('/api/v1/users/?depth=all')
+        self.assertEqual({user['id'] for user in response.data['results']}, {self.employee.id, self.intern.id})
+
+
+class EmployeeAdminTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.superuser = Employee.objects.create(email='admin@empresa.com', first_name='Admin', last_name='Top',
+                                                is_staff=True, is_superuser=True)
+        cls.group = Group.objects.create(name='Funcionários')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.superuser)
+
+    def create_employees(self, count):
+        start = Employee.objects.count()
+        for i in range(start, start + count):
+            employee = Employee.objects.create(email='{}@empresa.com'.format(i), first_name='Func', last_name=str(i),
+                                               manager=self.superuser, department=self.department, job=self.job)
+            employee.groups.add(self.group)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/manager/employee/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_depend_on_page_size(self):
+        self.create_employees(1)
+        queries = self.changelist_queries()
+        self.create_employees(96)
+        with self.assertNumQueries(queries):
+            response = self.client.get('/admin/manager/employee/')
+        # full first page (list_per_page = 100): the superuser, the manager, its employee and 97 employees
+        self.assertContains(response, '<td class="field-group">Funcionários</td>', count=97)
+
+
+class EstimatedCountPaginatorTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Task.objects.bulk_create(Task(project=cls.project, employee=cls.employee, title='Tarefa {}'.format(i),
+                                      priority=i % 4) for i in range(30))
+
+    def test_estimate_above_threshold(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_count(Task.objects.all()), 30)
+        # Filtered querysets have no estimate on SQLite
+        self.assertIsNone(estimate_count(Task.objects.filter(priority=Task.URGENT)))
+
+        paginator = EstimatedCountPaginator(Task.objects.order_by('id'), 10)
+        paginator.threshold = 20
+        Task.objects.filter(priority=Task.LOW).delete()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 30)  # stale estimate, no COUNT(*)
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+        paginator = EstimatedCountPaginator(Task.objects.order_by('id'), 10)
+        paginator.threshold = 100
+        self.assertEqual(paginator.count, 23)
+
+    def test_admin_changelist(self):
+        superuser = Employee.objects.create(email='admin@empresa.com', first_name='Admin', last_name='Top',
+                                            is_staff=True, is_superuser=True)
+        self.client.force_login(superuser)
+        response = self.client.get('/admin/manager/task/?priority__exact=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 8)
+
+
+class SearchTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reports_client = Client.objects.create(name='Relatórios Ltda', email='relatorios@empresa.com')
+        other = Employee.objects.create(email='outro@empresa.com', first_name='Outro', last_name='Top')
+        cls.portal = Project.objects.create(title='Portal', detail='Relatório mensal', client=cls.reports_client,
+                                            department=cls.department)
+        cls.portal.team.add(cls.employee)
+        cls.task = Task.objects.create(project=cls.portal, employee=cls.employee, title='Relatório de vendas')
+        Task.objects.create(project=cls.portal, employee=other, title='Relatório de compras')
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.employee)
+
+    def search(self, query):
+        response = self.api.get('/api/v1/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['id']) for result in response.data['results']]
+
+    def test_ranked_and_scoped(self):
+        # accent-insensitive prefix match; the other employee's task is not visible; title matches rank higher
+        results = self.search('relatorio')
+        self.assertEqual(set(results[:2]), {('task', self.task.id), ('client', self.reports_client.id)})
+        self.assertEqual(results[2:], [('project', self.portal.id)])
+        self.assertEqual(self.search('relat vend'), [('task', self.task.id)])
+        self.assertEqual(self.search('***'), [])
+
+    def test_index_follows_changes(self):
+        self.task.title = 'Apresentação'
+        self.task.save()
+        self.assertEqual(self.search('apresenta'), [('task', self.task.id)])
+        self.task.delete()
+        self.assertEqual(self.search('apresenta'), [])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM manager_search_index')
+        self.assertEqual(self.search('portal'), [])
+        call_command('rebuild_search_index', verbosity=0)
+        self.assertEqual(self.search('portal'), [('project', self.portal.id)])
+
+
+class VersionedCacheTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.employee)
+
+    def test_cached_payload_and_etag(self):
+        response = self.api.get('/api/v1/departments/')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.api.get('/api/v1/departments/')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'], [{'id': self.department.id, 'title': 'Desenvolvimento'}])
+
+        with self.assertNumQueries(0):
+            response = self.api.get('/api/v1/departments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with run_on_commit():
+            self.department.title = 'Suporte'
+            self.department.save()
+            # still the old version until the commit
+            self.assertEqual(self.api.get('/api/v1/departments/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.api.get('/api/v1/departments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['title'], 'Suporte')
+
+    def test_detail(self):
+        url = '/api/v1/departments/{}/'.format(self.department.id)
+        etag = self.api.get(url)['ETag']
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.api.get('/api/v1/departments/0/').status_code, 404)
+
+
+class BulkTaskTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.stranger = Employee.objects.create(email='outro@empresa.com', first_name='Outro', last_name='Top')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.manager)
+
+    def post_tasks(self, count, **extra):
+        items = [dict({'project_id': self.project.pk, 'employee_id': self.employee.pk,
+                       'title': 'Relatório {}'.format(i), 'working_hours': '2.00'}, **extra) for i in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post('/api/v1/tasks/bulk/', items, format='json')
+        return response, len(queries)
+
+    def test_create(self):
+        response, queries = self.post_tasks(1)
+        self.assertEqual(response.status_code, 201)
+        response, few_queries = self.post_tasks(2)
+        response, many_queries = self.post_tasks(20)
+        self.assertEqual(few_queries, many_queries)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [201] * 20)
+        self.assertEqual(results[0]['data']['project_title'], 'Projeto')
+        self.assertEqual(Task.objects.get(pk=results[0]['data']['id']).title, 'Relatório 0')
+
+        response, queries = self.post_tasks(2, project_id=0)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [400, 400])
+        self.assertIn('project_id', response.data['results'][0]['errors'])
+
+        self.assertEqual(ProjectHours.objects.get(pk=self.project.pk).task_count, 23)
+        self.assertEqual(EmployeeHours.objects.get(pk=self.employee.pk).working_hours, 46)
+        call_command('rebuild_rollups', verify=True, verbosity=0)
+        search = self.api.get('/api/v1/search/', {'q': 'relatorio', 'type': 'task', 'limit': 100}).data['results']
+        self.assertEqual(len(search), 23)
+
+    def test_update(self):
+        tasks = [Task.objects.create(project=self.project, employee=self.employee, title='T', working_hours=1)
+                 for _ in range(3)]
+        other = Task.objects.create(project=self.project, employee=self.stranger, title='Outra')
+        items = [{'id': tasks[0].pk, 'title': 'Apresentação', 'working_hours': '5.00'},
+                 {'id': tasks[1].pk, 'employee_id': self.manager.pk},
+                 {'id': tasks[2].pk, 'priority': 99},
+                 {'id': other.pk, 'title': 'X'},
+                 {'title': 'Sem id'}]
+        response = self.api.patch('/api/v1/tasks/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 200, 400, 404, 404])
+        self.assertEqual(Task.objects.get(pk=tasks[0].pk).title, 'Apresentação')
+        self.assertEqual(Task.objects.get(pk=tasks[1].pk).employee, self.manager)
+        self.assertEqual(Task.objects.get(pk=tasks[2].pk).priority, Task.NORMAL)
+        self.assertEqual(EmployeeHours.objects.get(pk=self.employee.pk).working_hours, 6)
+        call_command('rebuild_rollups', verify=True, verbosity=0)
+        search = self.api.get('/api/v1/search/', {'q': 'apresenta'}).data['results']
+        self.assertEqual([result['id'] for result in search], [tasks[0].pk])
+
+    def test_status_transition(self):
+        tasks = [Task.objects.create(project=self.project, employee=self.employee, title='T') for _ in range(50)]
+        forbidden = Task.objects.create(project=self.project, employee=self.employee, title='T')
+        ids = [task.pk for task in tasks]
+        # savepoint, the managed ids of the permission context (then cached), one scoped SELECT, one UPDATE, release
+        with self.assertNumQueries(5):
+            response = self.api.post('/api/v1/tasks/bulk-status/', {'ids': ids, 'status': Task.COMPLETED},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects.filter(status=Task.COMPLETED).count(), 50)
+
+        # the employee can't close tasks of others, nor see them
+        self.api.force_authenticate(user=self.employee)
+        forbidden.employee = self.manager
+        forbidden.save()
+        response = self.api.post('/api/v1/tasks/bulk-status/', {'ids': [ids[0], forbidden.pk], 'status': 'on_hold'},
+                                 format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 404])
+        response = self.api.post('/api/v1/tasks/bulk-status/', {'ids': ids, 'status': 'invalido'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SyncTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Employee.objects.create(email='outro@empresa.com', first_name='Outro', last_name='Top')
+        cls.project.team.add(cls.employee)
+        cls.tasks = [Task.objects.create(project=cls.project, employee=cls.employee, title='T{}'.format(i))
+                     for i in range(3)]
+        # Older than the sync overlap window
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        Task.objects.update(updated_at=an_hour_ago)
+        Project.objects.update(updated_at=an_hour_ago)
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.employee)
+
+    def sync(self, token=None):
+        response = self.api.get('/api/v1/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_delta_sync(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual([task['id'] for task in data['tasks']], [task.id for task in self.tasks])
+        self.assertEqual([project['id'] for project in data['projects']], [self.project.id])
+
+        with self.assertNumQueries(3):
+            data = self.sync(data['token'])
+        self.assertFalse(data['reset'])
+        self.assertEqual((data['tasks'], data['projects'], data['deleted']), ([], [], {'tasks': [], 'projects': []}))
+
+        token = data['token']
+        ids = [task.id for task in self.tasks]
+        self.tasks[0].title = 'Alterada'
+        self.tasks[0].save()
+        self.tasks[1].delete()
+        self.tasks[2].employee = self.other
+        self.tasks[2].save()
+        data = self.sync(token)
+        self.assertEqual([task['title'] for task in data['tasks']], ['Alterada'])
+        self.assertEqual(data['deleted'], {'tasks': ids[1:], 'projects': []})
+
+        # the manager still sees the project through its team, the employee doesn't
+        self.project.team.remove(self.employee)
+        self.project.team.add(self.manager)
+        data = self.sync(token)
+        self.assertEqual(data['deleted']['projects'], [self.project.id])
+        self.api.force_authenticate(user=self.manager)
+        data = self.sync(self.sync()['token'])
+        self.assertEqual(data['deleted']['projects'], [])
+        self.assertEqual([project['id'] for project in data['projects']], [self.project.id])
+
+    def test_bulk_created_tasks_dont_reuse_deleted_ids(self):
+        token = self.sync()['token']
+        deleted_id = self.tasks[-1].pk
+        self.tasks[-1].delete()
+        task, = bulk_create_tasks([Task(project=self.project, employee=self.employee, title='Nova')])
+        self.assertGreater(task.pk, deleted_id)
+        data = self.sync(token)
+        self.assertEqual([task['id'] for task in data['tasks']], [task.pk])
+        self.assertEqual(data['deleted']['tasks'], [deleted_id])
+
+    def test_invalid_token(self):
+        token = self.sync()['token']
+        self.assertEqual(self.api.get('/api/v1/sync/', {'since': token + 'x'}).status_code, 400)
+        self.api.force_authenticate(user=self.other)
+        self.assertEqual(self.api.get('/api/v1/sync/', {'since': token}).status_code, 400)
+
+
+class QueryBudgetTests(QueryBudgetMixin, CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(5):
+            employee = Employee.objects.create(email='{}@empresa.com'.format(i), first_name='Func', last_name='Top',
+                                               manager=cls.manager, department=cls.department, job=cls.job)
+            project = Project.objects.create(title='Projeto {}'.format(i), client=cls.client_obj,
+                                             department=cls.department)
+            project.team.add(cls.manager, employee)
+            for j in range(3):
+                Task.objects.create(project=project, employee=employee, title='Tarefa {}'.format(j))
+        cls.task = Task.objects.first()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION='Token ' + self.manager.auth_token.key)
+
+    def request(self, method, url, data=None):
+        # The budgets count the token lookup
+        token_cache.clear()
+        response = getattr(self.api, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300)
+        self.assertWithinQueryBudget(response)
+        return response
+
+    def test_read_endpoints(self):
+        task, project, department = self.task.pk, self.task.project_id, self.department.pk
+        for url in ['/api/v1/tasks/', '/api/v1/tasks/{}/'.format(task), '/api/v1/projects/',
+                    '/api/v1/projects/{}/'.format(project), '/api/v1/projects/{}/hours/'.format(project),
+                    '/api/v1/departments/', '/api/v1/departments/{}/'.format(department),
+                    '/api/v1/departments/{}/hours/'.format(department), '/api/v1/jobs/', '/api/v1/clients/',
+                    '/api/v1/users/', '/api/v1/users/?depth=all', '/api/v1/users/{}/'.format(self.manager.pk),
+                    '/api/v1/users/{}/hours/'.format(self.manager.pk), '/api/v1/search/?q=tarefa', '/api/v1/sync/']:
+            self.request('get', url)
+
+    def test_write_endpoints(self):
+        task = {'title': 'Nova', 'project_id': self.task.project_id, 'employee_id': self.task.employee_id}
+        self.request('post', '/api/v1/tasks/', task)
+        self.request('patch', '/api/v1/tasks/{}/'.format(self.task.pk), {'title': 'Alterada'})
+        self.request('post', '/api/v1/tasks/bulk/', [task] * 20)
+        ids = list(Task.objects.values_list('pk', flat=True))
+        self.request('patch', '/api/v1/tasks/bulk/', [{'id': pk, 'working_hours': '1.00'} for pk in ids])
+        self.request('post', '/api/v1/tasks/bulk-status/', {'ids': ids, 'status': Task.COMPLETED})
+
+    def test_server_timing_and_logged_violations(self):
+        with self.assertLogs('manager.queries', 'WARNING') as logs, \
+                mock.patch.dict(query_budgets, {'task-list': 0}), override_settings(QUERY_BUDGET_STRICT=False):
+            response = self.api.get('/api/v1/tasks/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        self.assertIn('budget is 0', logs.output[0])
+
+    def test_violations_fail_the_tests(self):
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+        with mock.patch.dict(query_budgets, {'task-list': 0}), \
+                self.assertRaisesMessage(QueryBudgetExceeded, 'budget is 0'):
+            self.api.get('/api/v1/tasks/')
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_and_measure(self):
+        from .management.commands.benchmark_api import run_endpoints
+        call_command('seed_benchmark_data', employees=30, span=3, departments=2, projects=4, tasks_per_project=5,
+                     clients=3, verbosity=0)
+        self.assertEqual(Employee.objects.count(), 30)
+        self.assertEqual(Task.objects.count(), 20)
+        self.assertEqual(Employee.objects.subtree_of(Employee.objects.get(manager=None)).count(), 29)
+        call_command('rebuild_employee_closure', verify=True, verbosity=0)
+        call_command('rebuild_rollups', verify=True, verbosity=0)
+        # the sequences continue after the explicit ids
+        Task.objects.create(project=Project.objects.first(), employee=Employee.objects.first(), title='Nova')
+
+        results = run_endpoints(requests=2, warmup=1)
+        self.assertEqual(set(results), {'projects', 'tasks', 'users', 'login'})
+        self.assertLessEqual(results['tasks']['p50_ms'], results['tasks']['p99_ms'])
+        self.assertEqual(results['tasks']['queries'], 2)
+
+
+class PermissionContextTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_manager = Employee.objects.create(email='gerente2@empresa.com', first_name='Gerente',
+                                                    last_name='Dois', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_cached_per_user_and_invalidated(self):
+        with self.assertNumQueries(1):
+            context = PermissionContext(self.manager)
+        with self.assertNumQueries(0):
+            context = PermissionContext(self.manager)
+        self.assertEqual(context.managed_ids, {self.employee.pk})
+        self.assertTrue(context.can_update_task(self.employee.pk))
+        self.assertTrue(context.can_delete_task(self.manager.pk))
+        self.assertFalse(PermissionContext(self.employee).can_delete_task(self.employee.pk))
+
+        self.employee.manager = self.other_manager
+        with run_on_commit():
+            self.employee.save()
+            # until the commit, the other requests still see the cached ids
+            self.assertTrue(PermissionContext(self.manager).manages(self.employee.pk))
+        self.assertFalse(PermissionContext(self.manager).manages(self.employee.pk))
+        self.assertTrue(PermissionContext(self.other_manager).manages(self.employee.pk))
+
+    def test_object_checks_without_queries(self):
+        tasks = [Task.objects.create(project=self.project, employee=employee, title='T')
+                 for employee in (self.employee, self.manager, self.other_manager)]
+        request = mock.Mock(method='PATCH', user=self.manager, _permission_context=None)
+        permission = IsTaskOwnerOrReadOnly()
+        permission.has_object_permission(request, None, tasks[0])
+        with self.assertNumQueries(0):
+            allowed = [permission.has_object_permission(request, None, task) for task in tasks]
+        self.assertEqual(allowed, [True, True, False])
+
+
+class ProfilePhotoVariantsTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def save_photo(self, employee, name):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(buffer, 'PNG')
+        with mock.patch('manager.thumbnails.schedule_variants') as schedule_variants:
+            employee.profile_photo.save(name, ContentFile(buffer.getvalue()))
+        return schedule_variants
+
+    def test_scheduled_on_new_photo_and_falls_back_to_original(self):
+        schedule_variants = self.save_photo(self.employee, 'foto.png')
+        schedule_variants.assert_called_once_with(self.employee.pk, self.employee.profile_photo.name, None)
+
+        employee = Employee.objects.get(pk=self.employee.pk)
+        urls = EmployeeSerializer(employee).data['profile_photo_variants']
+        self.assertEqual(urls['64'], {'webp': urls['original'], 'jpeg': urls['original']})
+
+        # Saving without changing the photo doesn't schedule anything
+        with mock.patch('manager.thumbnails.schedule_variants') as schedule_variants:
+            employee.save()
+        schedule_variants.assert_not_called()
+
+    def test_process_photo(self):
+        self.save_photo(self.employee, 'foto.png')
+        old_name = self.employee.profile_photo.name
+        process_photo(self.employee.pk, old_name)
+
+        employee = Employee.objects.get(pk=self.employee.pk)
+        self.assertTrue(employee.profile_photo_variants_ready)
+        storage = employee.profile_photo.storage
+        for size in PHOTO_SIZES:
+            for format in PHOTO_FORMATS:
+                self.assertTrue(storage.exists(variant_name(old_name, size, format)))
+        from PIL import Image
+        with storage.open(variant_name(old_name, 64, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (64, 64))
+        urls = EmployeeSerializer(employee).data['profile_photo_variants']
+        self.assertTrue(urls['128']['jpeg'].endswith('_128.jpg'))
+
+        # A new photo isn't ready until processed, and the replaced photo's variants are deleted
+        schedule_variants = self.save_photo(employee, 'nova.png')
+        self.assertFalse(Employee.objects.get(pk=employee.pk).profile_photo_variants_ready)
+        schedule_variants.assert_called_once_with(employee.pk, employee.profile_photo.name, old_name)
+        process_photo(employee.pk, employee.profile_photo.name, old_name)
+        self.assertFalse(storage.exists(variant_name(old_name, 64, 'webp')))
+        self.assertTrue(Employee.objects.get(pk=employee.pk).profile_photo_variants_ready)
+
+    def test_replaced_by_a_photo_with_the_same_stem(self):
+        self.save_photo(self.employee, 'foto.png')
+        old_name = self.employee.profile_photo.name
+        process_photo(self.employee.pk, old_name)
+        self.save_photo(self.employee, 'foto.jpg')
+        new_name = self.employee.profile_photo.name
+        process_photo(self.employee.pk, new_name, old_name)
+
+        storage = self.employee.profile_photo.storage
+        for size in PHOTO_SIZES:
+            for format in PHOTO_FORMATS:
+                self.assertTrue(storage.exists(variant_name(new_name, size, format)))
+                self.assertFalse(storage.exists(variant_name(old_name, size, format)))
+        self.assertTrue(Employee.objects.get(pk=self.employee.pk).profile_photo_variants_ready)
+
+
+class UploadSessionTests(QueryBudgetMixin, CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for setting in ('media_root', 'partial_dir'):
+            path = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, path)
+            setattr(self, setting, path)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch('manager.uploads.UPLOAD_SESSION_DIR', self.partial_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.employee)
+
+    def start(self, content, **data):
+        response = self.api.post('/api/v1/uploads/', dict({'filename': 'relatório.PDF', 'size': len(content)},
+                                                          **data), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertWithinQueryBudget(response)
+        return '/api/v1/uploads/{}/'.format(response.data['id'])
+
+    def send(self, url, content, start, end):
+        return self.api.put(url, content[start:end + 1], content_type='application/octet-stream',
+                            HTTP_CONTENT_RANGE='bytes {0}-{1}/{2}'.format(start, end, len(content)))
+
+    def upload(self, content, chunk_size=4):
+        url = self.start(content)
+        for start in range(0, len(content), chunk_size):
+            response = self.send(url, content, start, min(start + chunk_size, len(content)) - 1)
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertWithinQueryBudget(response)
+        response = self.api.post(url + 'complete/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertWithinQueryBudget(response)
+        return response.data
+
+    def test_resumable_chunks(self):
+        content = b'0123456789abcdefghij'
+        url = self.start(content, sha256=hashlib.sha256(content).hexdigest())
+        self.assertEqual(self.send(url, content, 0, 7).status_code, 200)
+
+        # A chunk that doesn't continue from the offset is refused with the offset to resume from
+        response = self.send(url, content, 4, 11)
+        self.assertEqual((response.status_code, response.data['received']), (409, 8))
+        self.assertEqual(self.api.post(url + 'complete/').status_code, 409)
+        # A request that died halfway leaves the offset where it was
+        response = self.api.put(url, content[8:12], content_type='application/octet-stream',
+                                HTTP_CONTENT_RANGE='bytes 8-15/20')
+        self.assertEqual((response.status_code, response.data['received']), (400, 8))
+
+        # The hash of the first chunk is recomputed if this process doesn't have it
+        uploads._hashers.clear()
+        self.assertEqual(self.api.get(url).data['received'], 8)
+        self.assertEqual(self.send(url, content, 8, 19).data['received'], 20)
+        data = self.api.post(url + 'complete/').data
+        self.assertEqual(data['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(os.listdir(self.partial_dir), [])
+        with open(os.path.join(self.media_root, *data['file'].split('/')[-5:]), 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_deduplicated_and_attached_to_tasks(self):
+        first = self.upload(b'mesmo conteudo')
+        second = self.upload(b'mesmo conteudo', chunk_size=100)
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(first['file'], second['file'])
+        self.assertIn('/files/sha256/', first['file'])
+        self.assertTrue(first['file'].endswith('.pdf'))
+
+        for upload in (first, second):
+            response = self.api.post('/api/v1/tasks/', {
+                'project_id': self.project.pk, 'employee_id': self.employee.pk, 'title': 'Tarefa',
+                'upload_id': upload['id']}, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+        names = set(Task.objects.values_list('file', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names.pop().startswith('files/sha256/'))
+
+        # Another employee's upload can't be attached
+        other = Employee.objects.create(email='outro@empresa.com', first_name='Outro', last_name='Top')
+        self.api.force_authenticate(user=other)
+        response = self.api.post('/api/v1/tasks/', {
+            'project_id': self.project.pk, 'employee_id': other.pk, 'title': 'Tarefa', 'upload_id': first['id']},
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('upload_id', response.data)
+
+    def test_hash_mismatch_restarts(self):
+        content = b'conteudo'
+        url = self.start(content, sha256='0' * 64)
+        self.send(url, content, 0, len(content) - 1)
+        response = self.api.post(url + 'complete/')
+        self.assertEqual((response.status_code, response.data['received']), (400, 0))
+        self.assertEqual(os.listdir(self.partial_dir), [])
+        self.assertEqual(self.api.get(url).data['received'], 0)
+
+
+class MediaViewTests(QueryBudgetMixin, CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outsider = Employee.objects.create(email='outro@empresa.com', first_name='Outro', last_name='Top')
+        cls.project.team.add(cls.employee)
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.name = default_storage.save('files/2020/01/01/relatorio.txt', ContentFile(b'0123456789'))
+        self.project.file = self.name
+        self.project.save()
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.employee)
+        self.url = settings.MEDIA_URL + self.name
+
+    def test_permission_checked(self):
+        response = self.api.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertWithinQueryBudget(response)
+
+        self.api.force_authenticate(user=self.outsider)
+        self.assertEqual(self.api.get(self.url).status_code, 404)
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_ranges_and_conditional_requests(self):
+        etag = self.api.get(self.url)['ETag']
+        for header, status_code, content in (('bytes=2-5', 206, b'2345'), ('bytes=-3', 206, b'789'),
+                                             ('bytes=8-100', 206, b'89'), ('bytes=0-1,4-5', 200, b'0123456789')):
+            response = self.api.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, status_code, header)
+            self.assertEqual(b''.join(response.streaming_content), content, header)
+        self.assertEqual(self.api.get(self.url, HTTP_RANGE='bytes=2-5')['Content-Range'], 'bytes 2-5/10')
+
+        response = self.api.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+        # The range only applies to the same version of the file
+        self.assertEqual(self.api.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.api.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"velho"').status_code, 200)
+
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        response = self.api.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_sendfile_backends(self):
+        with mock.patch('manager.media.MEDIA_SENDFILE_BACKEND', 'x-accel-redirect'):
+            response = self.api.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(response.content, b'')
+        with mock.patch('manager.media.MEDIA_SENDFILE_BACKEND', 'x-sendfile'):
+            response = self.api.get(self.url)
+        self.assertEqual(response['X-Sendfile'], default_storage.path(self.name))
+
+    def test_profile_photo_variants(self):
+        colleague = Employee.objects.create(email='colega@empresa.com', first_name='Colega', last_name='Top',
+                                            department=self.employee.department,
+                                            profile_photo='profile_photos/2020/01/01/colega.png')
+        variant = variant_name(colleague.profile_photo.name, 64, 'webp')
+        self.assertTrue(media.is_accessible(self.employee, variant))
+        self.assertTrue(media.is_accessible(self.employee, colleague.profile_photo.name))
+        self.assertFalse(media.is_accessible(self.employee, 'profile_photos/2020/01/01/colega.png_65.webp'))
+        self.assertFalse(media.is_accessible(self.outsider, variant))
+        # a photo with the same stem has its own variants
+        self.outsider.profile_photo = 'profile_photos/2020/01/01/colega.jpg'
+        self.outsider.save()
+        self.assertFalse(media.is_accessible(self.outsider, variant))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        # The same rows in both databases (bulk_create: without the signals, that write to "default"),
+        # but with different titles to tell where each read went
+        self.employee = Employee(pk=1, email='func@empresa.com', first_name='Func', last_name='Top')
+        for alias, suffix in (('default', 'primário'), ('replica', 'réplica')):
+            Employee.objects.using(alias).bulk_create([self.employee])
+            Departament.objects.using(alias).bulk_create([Departament(pk=1, title='Depto ' + suffix)])
+            Client.objects.using(alias).bulk_create([Client(pk=1, name='Cliente', email='c@empresa.com')])
+            Project.objects.using(alias).bulk_create([Project(pk=1, title='Projeto ' + suffix, client_id=1,
+                                                              department_id=1)])
+            Project.team.through.objects.using(alias).bulk_create([Project.team.through(project_id=1,
+                                                                                        employee_id=1)])
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.employee)
+
+    def project_titles(self):
+        response = self.api.get('/api/v1/projects/')
+        self.assertEqual(response.status_code, 200)
+        return [project['title'] for project in response.data['results']]
+
+    def test_reads_from_replica_until_the_user_writes(self):
+        self.assertEqual(self.project_titles(), ['Projeto réplica'])
+        # Writes always go to the primary, and pin the user to it for a while
+        response = self.api.post('/api/v1/device-token/', {'token': 'abc', 'type': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Employee.objects.using('default').get(pk=1).device_token, 'abc')
+        self.assertIsNone(Employee.objects.using('replica').get(pk=1).device_token)
+        self.assertEqual(self.project_titles(), ['Projeto primário'])
+
+        cache.delete(replicas.pin_key(self.employee.pk))
+        self.assertEqual(self.project_titles(), ['Projeto réplica'])
+        # Only the configured actions
+        response = self.api.get('/api/v1/projects/1/')
+        self.assertEqual(response.data['title'], 'Projeto primário')
+
+    def test_cached_payloads_read_from_primary(self):
+        response = self.api.get('/api/v1/departments/')
+        self.assertEqual([department['title'] for department in response.data['results']], ['Depto primário'])
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Project))
+        self.assertEqual(replicas.read_from_replica(), 'replica')
+        try:
+            self.assertEqual(router.db_for_read(Project), 'replica')
+            self.assertIsNone(router.db_for_write(Project))
+            replica_project = Project.objects.using('replica').get(pk=1)
+            self.assertEqual(router.db_for_write(Project, instance=replica_project), 'default')
+            with replicas.primary():
+                self.assertIsNone(router.db_for_read(Project))
+            self.assertEqual(router.db_for_read(Project), 'replica')
+        finally:
+            replicas.read_from_primary()
+        self.assertTrue(router.allow_relation(Project.objects.using('replica').get(pk=1), self.employee))
+
+
+class PasswordHashingTests(CompanyTestCase):
+
+    def setUp(self):
+        super().setUp()
+        hashing.set_password(self.employee, 'senha-antiga-123')
+        self.employee.save()
+
+    def login(self, password):
+        return APIClient().post('/api/v1/login/', {'username': 'func@empresa.com', 'password': password})
+
+    def test_login_and_change_password(self):
+        self.assertTrue(self.employee.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.login('senha-antiga-123').status_code, 200)
+        self.assertEqual(self.login('errada').status_code, 400)
+
+        api = APIClient()
+        api.force_authenticate(user=self.employee)
+        response = api.put('/api/v1/change-password/', {'old_password': 'errada', 'new_password': 'nova-senha-456'})
+        self.assertEqual(response.status_code, 400)
+        response = api.put('/api/v1/change-password/', {'old_password': 'senha-antiga-123',
+                                                        'new_password': 'nova-senha-456'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.login('nova-senha-456').status_code, 200)
+
+    def test_upgrades_old_hashes(self):
+        Employee.objects.filter(pk=self.employee.pk).update(
+            password=make_password('senha-antiga-123', hasher='pbkdf2_sha1'))
+        self.assertEqual(self.login('senha-antiga-123').status_code, 200)
+        self.assertTrue(Employee.objects.get(pk=self.employee.pk).password.startswith('pbkdf2_sha256$'))
+
+    def test_spawned_workers(self):
+        # As the pool started by gunicorn, uwsgi or macOS: the workers don't inherit the loaded apps
+        executor = hashing.make_executor(1, multiprocessing.get_context('spawn'))
+        self.addCleanup(executor.shutdown)
+        with mock.patch('manager.hashing._executor', executor):
+            self.assertEqual(self.login('senha-antiga-123').status_code, 200)
+            self.assertEqual(self.login('errada').status_code, 400)
+
+    def test_fails_fast_when_overloaded(self):
+        full = threading.BoundedSemaphore(1)
+        full.acquire()
+        with mock.patch('manager.hashing._pending', full):
+            response = self.login('senha-antiga-123')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class OnboardEmployeesTests(TestCase):
+
+    def setUp(self):
+        self.department = Departament.objects.create(title='Engenharia')
+        self.job = Job.objects.create(title='Desenvolvedor', department=self.department)
+        self.director = Employee.objects.create(email='diretor@empresa.com', first_name='Dir', last_name='Etor',
+                                                category=Employee.ADMIN, department=self.department)
+
+    def write_csv(self, rows):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(','.join(row) for row in rows) + '\n')
+        return path
+
+    def test_creates_employees_in_bulk(self):
+        path = self.write_csv([
+            ('email', 'first_name', 'last_name', 'password', 'manager', 'department', 'job', 'category'),
+            ('dev@empresa.com', 'Dev', 'Um', 'senha-dev-123', 'gerente@empresa.com', '', 'Desenvolvedor', ''),
+            ('gerente@empresa.com', 'Ger', 'Ente', 'senha-gerente-123', 'diretor@empresa.com', 'Engenharia', '',
+             'Manager'),
+            ('sem-senha@empresa.com', 'Sem', 'Senha', '', 'gerente@empresa.com', '', '', ''),
+        ])
+        cache.set(managed_ids_key(self.director.pk), frozenset())
+        with run_on_commit():
+            call_command('onboard_employees', path, workers=2, verbosity=0)
+
+        dev = Employee.objects.get(email='dev@empresa.com')
+        manager = Employee.objects.get(email='gerente@empresa.com')
+        self.assertEqual((dev.manager, dev.department, dev.job), (manager, self.department, self.job))
+        self.assertTrue(dev.check_password('senha-dev-123'))
+        self.assertFalse(Employee.objects.get(email='sem-senha@empresa.com').has_usable_password())
+        self.assertTrue(manager.is_staff)
+        self.assertEqual(set(Employee.objects.filter(groups__name='Funcionários').values_list('email', flat=True)),
+                         {'dev@empresa.com', 'sem-senha@empresa.com'})
+        self.assertEqual(Token.objects.filter(user__email__endswith='@empresa.com').count(), 4)
+        self.assertEqual(set(Employee.objects.subtree_of(self.director).values_list('email', flat=True)),
+                         {'gerente@empresa.com', 'dev@empresa.com', 'sem-senha@empresa.com'})
+        call_command('rebuild_employee_closure', verify=True, verbosity=0)
+        self.assertEqual(PermissionContext(self.director).managed_ids, {manager.pk})
+        # the sequence continues after the explicit ids
+        Employee.objects.create(email='depois@empresa.com', first_name='De', last_name='Pois')
+
+    def test_departments_follow_the_managers_whatever_the_order(self):
+        sales = Departament.objects.create(title='Vendas')
+        seller = Job.objects.create(title='Vendedor', department=sales)
+        path = self.write_csv([
+            ('email', 'manager', 'department', 'job'),
+            ('vendedor@empresa.com', 'lider@empresa.com', '', 'Vendedor'),
+            ('lider@empresa.com', 'gerente@empresa.com', '', ''),
+            ('gerente@empresa.com', 'diretor@empresa.com', 'Vendas', ''),
+        ])
+        call_command('onboard_employees', path, workers=0, verbosity=0)
+
+        self.assertEqual(dict(Employee.objects.filter(email__in=['vendedor@empresa.com', 'lider@empresa.com'])
+                              .values_list('email', 'department')),
+                         {'vendedor@empresa.com': sales.pk, 'lider@empresa.com': sales.pk})
+        self.assertEqual(Employee.objects.get(email='vendedor@empresa.com').job, seller)
+        self.assertEqual(Employee.objects.get(email='lider@empresa.com').manager.email, 'gerente@empresa.com')
+
+    def test_doesnt_reuse_the_ids_of_deleted_employees(self):
+        deleted_id = Employee.objects.create(email='saiu@empresa.com', first_name='Sa', last_name='Iu').pk
+        Employee.objects.filter(pk=deleted_id).delete()
+        call_command('onboard_employees', self.write_csv([('email',), ('novo@empresa.com',)]), workers=0,
+                     verbosity=0)
+        self.assertGreater(Employee.objects.get(email='novo@empresa.com').pk, deleted_id)
+
+    def test_writes_nothing_when_a_row_is_invalid(self):
+        path = self.write_csv([
+            ('email', 'manager', 'job'),
+            ('a@empresa.com', 'diretor@empresa.com', ''),
+            ('b@empresa.com', 'ninguem@empresa.com', ''),
+            ('c@empresa.com', '', 'Astronauta'),
+            ('diretor@empresa.com', '', ''),
+        ])
+        with self.assertRaisesMessage(CommandError, '3 error(s)'):
+            call_command('onboard_employees', path, workers=0, verbosity=0, stderr=io.StringIO())
+        self.assertEqual(Employee.objects.count(), 1)
+
+
+class FlagDeadlinesTests(CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        today = timezone.localdate()
+        cls.yesterday = today - datetime.timedelta(days=1)
+        cls.late = Project.objects.create(title='Atrasado', client=cls.client_obj, department=cls.department,
+                                          start_date=today - datetime.timedelta(days=30), end_date=cls.yesterday)
+        cls.finished = Project.objects.create(title='Finalizado', client=cls.client_obj, department=cls.department,
+                                              status=Project.FINISHED, end_date=cls.yesterday)
+        cls.current = Project.objects.create(title='Em dia', client=cls.client_obj, department=cls.department,
+                                             end_date=today)
+        cls.tasks = {status: Task.objects.create(project=cls.current, employee=cls.employee, title=status,
+                                                 status=status, due_date=cls.yesterday)
+                     for status in (Task.IN_PROGRESS, Task.COMPLETED)}
+        cls.tasks['today'] = Task.objects.create(project=cls.current, employee=cls.employee, title='Hoje')
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        Task.objects.update(updated_at=an_hour_ago)
+        Project.objects.update(updated_at=an_hour_ago)
+
+    def test_flags_with_one_update_per_job(self):
+        with CaptureQueriesContext(connection) as queries:
+            counts = deadlines.flag_deadlines()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 3)
+        self.assertEqual(counts, {'late_projects': 1, 'overdue_tasks': 1, 'cleared_tasks': 0})
+        self.assertEqual(dict(Project.objects.values_list('title', 'status')), {
+            'Atrasado': Project.LATE, 'Finalizado': Project.FINISHED, 'Em dia': Project.IN_PROGRESS,
+            'Projeto': Project.IN_PROGRESS})
+        self.assertEqual(list(Task.objects.filter(overdue=True)), [self.tasks[Task.IN_PROGRESS]])
+        # the sync endpoint sends the changed rows again
+        recent = timezone.now() - datetime.timedelta(minutes=1)
+        self.assertEqual(set(Project.objects.filter(updated_at__gte=recent)), {self.late})
+        self.assertEqual(set(Task.objects.filter(updated_at__gte=recent)), {self.tasks[Task.IN_PROGRESS]})
+
+        # nothing left to change
+        self.assertEqual(deadlines.flag_deadlines(), {'late_projects': 0, 'overdue_tasks': 0, 'cleared_tasks': 0})
+
+        Task.objects.filter(pk=self.tasks[Task.IN_PROGRESS].pk).update(status=Task.COMPLETED)
+        out = io.StringIO()
+        call_command('flag_deadlines', stdout=out)
+        self.assertIn('1 task(s) no longer overdue', out.getvalue())
+        self.assertFalse(Task.objects.filter(overdue=True).exists())
+
+
+class DashboardTests(QueryBudgetMixin, CompanyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other = Employee.objects.create(email='outro@empresa.com', first_name='Outro', last_name='Top')
+        cls.project.team.add(cls.employee)
+        Project.objects.create(title='Outro', client=cls.client_obj, department=cls.department,
+                               status=Project.LATE).team.add(other)
+        today = timezone.localdate()
+        cls.task = Task.objects.create(project=cls.project, employee=cls.employee, title='Atrasada',
+                                       priority=Task.URGENT, due_date=today - datetime.timedelta(days=1))
+        Task.objects.create(project=cls.project, employee=cls.employee, title='Hoje', status=Task.IN_PROGRESS,
+                            due_date=today, working_hours=Decimal('2.5'))
+        Task.objects.create(project=cls.project, employee=cls.employee, title='Feita', status=Task.COMPLETED,
+                            due_date=today - datetime.timedelta(days=30), working_hours=Decimal('8'))
+        Task.objects.create(project=cls.project, employee=other, title='De outro', working_hours=Decimal('1'))
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION='Token ' + self.employee.auth_token.key)
+
+    def dashboard(self):
+        response = self.api.get('/api/v1/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        return response
+
+    def test_counts_and_caches(self):
+        data = self.dashboard().data
+        self.assertEqual(data['task_count'], 3)
+        self.assertEqual(data['tasks_by_status'], {Task.CREATED: 1, Task.IN_PROGRESS: 1, Task.ON_HOLD: 0,
+                                                   Task.COMPLETED: 1, Task.CANCELED: 0})
+        self.assertEqual(data['tasks_by_priority'], {'0': 1, '1': 0, '2': 2, '3': 0})
+        self.assertEqual(data['overdue_tasks'], 1)
+        self.assertEqual(data['hours_due_this_week'], '2.50')
+        self.assertEqual(data['project_count'], 1)
+        self.assertEqual(data['projects_by_status'][Project.IN_PROGRESS], 1)
+        self.assertEqual(data['projects_by_status'][Project.LATE], 0)
+
+        # cached: only the token lookup, or nothing with the token cached
+        self.assertLessEqual(self.dashboard().query_recorder.count, 1)
+
+    def test_invalidated_when_the_tasks_change(self):
+        self.assertEqual(self.dashboard().data['overdue_tasks'], 1)
+        self.task.status = Task.COMPLETED
+        self.task.save()
+        self.assertEqual(self.dashboard().data['overdue_tasks'], 0)
+
+        response = self.api.post('/api/v1/tasks/bulk-status/', {'ids': [self.task.pk], 'status': Task.CANCELED},
+                                 format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.dashboard().data['tasks_by_status'][Task.CANCELED], 1)
+
+        self.task.delete()
+        self.assertEqual(self.dashboard().data['task_count'], 2)
+
+
+try:
+    from .async_views import AsyncReadHandler
+except ImportError:
+    AsyncReadHandler = None
+
+
+@unittest.skipUnless(AsyncReadHandler, "asgiref is not installed")
+class AsyncReadViewsTests(TransactionTestCase):
+    # The views run on the threads of asgiref's pool, with their own connections: the data must be committed
+
+    def setUp(self):
+        cache.clear()
+        create_company(self)
+        self.project.team.add(self.manager, self.employee)
+        Task.objects.create(project=self.project, employee=self.employee, title='Tarefa', working_hours=Decimal('2.5'))
+        self.token = Token.objects.get(user=self.manager).key
+        self.application = AsyncReadHandler(get_wsgi_application())
+
+    def request(self, method, path, query_string=b''):
+        """
+        (status, headers, body) of a request to the ASGI application, as an ASGI server would make it.
+        """
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+            'path': path, 'raw_path': path.encode('ascii'), 'query_string': query_string, 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'authorization', 'Token {0}'.format(self.token).encode('ascii'))],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.application(scope, receive, send))
+        finally:
+            loop.close()
+        start, body = messages[0], b''.join(message.get('body', b'') for message in messages[1:])
+        return start['status'], dict((name.decode(), value.decode()) for name, value in start['headers']), body
+
+    def test_same_responses_as_wsgi(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        for path, query_string in (('/api/v1/tasks/', b''), ('/api/v1/projects/', b''),
+                                   ('/api/v1/users/', b'depth=all')):
+            self.assertTrue(self.application.is_async_read({'type': 'http', 'method': 'GET', 'path': path}))
+            status, headers, body = self.request('GET', path, query_string)
+            self.assertEqual(status, 200, body)
+            self.assertEqual(json.loads(body.decode()), api.get(path + '?' + query_string.decode()).json())
+            # through the middleware
+            self.assertIn('Server-Timing', headers)
+            self.assertEqual(headers['X-Frame-Options'], 'SAMEORIGIN')
+
+        status, headers, body = self.request('HEAD', '/api/v1/tasks/')
+        self.assertEqual((status, body), (200, b''))
+        status, _, _ = self.request('GET', '/api/v1/users/', b'depth=-1')
+        self.assertEqual(status, 400)
+
+    def test_other_requests_through_wsgi(self):
+        self.assertFalse(self.application.is_async_read({'type': 'http', 'method': 'POST', 'path': '/api/v1/tasks/'}))
+        self.assertFalse(self.application.is_async_read({'type': 'http', 'method': 'GET', 'path': '/api/v1/sync/'}))
+        self.assertFalse(self.application.is_async_read({'type': 'http', 'method': 'GET', 'path': '/nada/'}))
+        status, _, body = self.request('GET', '/api/v1/dashboard/')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['task_count'], 0)
@@ -0,0 +1,132 @@
+"""
+Fixed-size variants of Employee.profile_photo (square, WebP and JPEG), so the app doesn't download
+the original upload to render an avatar.
+
+The variants are stored next to the original, whose whole name they keep ("foto.png_64.webp": a foto.jpg
+uploaded on the same day has its own), and generated in a thread pool
+once the transaction that set the photo commits (see the Employee signals in models.py);
+Employee.profile_photo_variants_ready tells when they exist. The generate_photo_variants command
+(re)generates them in bulk.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+logger = logging.getLogger('manager.thumbnails')
+
+PHOTO_SIZES = getattr(settings, 'PROFILE_PHOTO_SIZES', (64, 128, 512))
+# format -> (file extension, Pillow save options)
+PHOTO_FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, size, format):
+    return '{0}_{1}.{2}'.format(name, size, PHOTO_FORMATS[format][0])
+
+
+def generate_variants(field_file):
+    """
+    Writes every size/format of the photo to its storage, replacing older files with the same names.
+    """
+    from PIL import Image, ImageOps
+
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+
+    for size in PHOTO_SIZES:
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for format, (extension, options) in PHOTO_FORMATS.items():
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format.upper(), **options)
+            name = variant_name(field_file.name, size, format)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def delete_variants(storage, name):
+    for size in PHOTO_SIZES:
+        for format in PHOTO_FORMATS:
+            storage.delete(variant_name(name, size, format))
+
+
+def variant_urls(employee, request=None):
+    """
+    {size: {format: url}} of the employee's photo; the original's URL while the variants aren't ready.
+    None without a photo.
+    """
+    photo = employee.profile_photo
+    if not photo:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request is not None else url
+
+    original = absolute(photo.url)
+    urls = {'original': original}
+    for size in PHOTO_SIZES:
+        urls[str(size)] = {
+            format: absolute(photo.storage.url(variant_name(photo.name, size, format)))
+            if employee.profile_photo_variants_ready else original
+            for format in PHOTO_FORMATS
+        }
+    return urls
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2))
+    return _executor
+
+
+def process_photo(employee_id, name, old_name=None):
+    """
+    Generates the variants of the employee's photo `name` and marks them ready (unless the photo changed
+    again meanwhile), then deletes the variants of the replaced photo.
+    """
+    from .models import Employee
+
+    employee = Employee.objects.filter(pk=employee_id, profile_photo=name).first()
+    if employee is not None:
+        generate_variants(employee.profile_photo)
+        # update() skips the signals: drop the cached users of the employee's tokens ourselves
+        if Employee.objects.filter(pk=employee_id, profile_photo=name).update(profile_photo_variants_ready=True):
+            token_cache.invalidate(*Token.objects.filter(user_id=employee_id).values_list('key', flat=True))
+    if old_name:
+        delete_variants(Employee._meta.get_field('profile_photo').storage, old_name)
+
+
+def _process_photo_in_pool(employee_id, name, old_name):
+    try:
+        process_photo(employee_id, name, old_name)
+    except Exception:
+        logger.exception("Profile photo variants of employee %s (%s) failed", employee_id, name)
+    finally:
+        # Each thread has its own database connection
+        db.connection.close()
+
+
+def schedule_variants(employee_id, name, old_name=None):
+    """
+    Queues process_photo in the thread pool for when the current transaction commits, off the request path.
+    """
+    transaction.on_commit(lambda: get_executor().submit(_process_photo_in_pool, employee_id, name, old_name))
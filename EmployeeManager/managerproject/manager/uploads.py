@@ -0,0 +1,196 @@
+"""
+Resumable, content addressed uploads of Project and Task files.
+
+The client creates an UploadSession (filename and size), sends the file in chunks, each as the raw body of
+a PUT with "Content-Range: bytes <start>-<end>/<size>", and completes the session. Chunks are appended to
+a partial file (UPLOAD_SESSION_DIR) and hashed as they arrive; a client that lost the connection reads
+the session's "received" offset and resumes from there. On completion the file is stored under its
+SHA-256 ("files/sha256/ab/cd/<sha256><ext>"), once for any number of identical attachments, and the
+projects and tasks reference that name (the "upload_id" field of their serializers).
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from rest_framework import status
+
+UPLOAD_SESSION_DIR = getattr(settings, 'UPLOAD_SESSION_DIR', None) or \
+    os.path.join(tempfile.gettempdir(), 'manager-uploads')
+UPLOAD_MAX_SIZE = getattr(settings, 'UPLOAD_MAX_SIZE', 1024 ** 3)
+UPLOAD_CHUNK_MAX_SIZE = getattr(settings, 'UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 ** 2)
+UPLOAD_SESSION_HOURS = getattr(settings, 'UPLOAD_SESSION_HOURS', 24)
+
+READ_SIZE = 64 * 1024
+HASHER_CACHE_SIZE = 256
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+_EXTENSION = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+class UploadError(Exception):
+
+    def __init__(self, detail, status=status.HTTP_400_BAD_REQUEST, received=None):
+        super().__init__(detail)
+        self.status = status
+        self.data = {'detail': detail}
+        if received is not None:
+            self.data['received'] = received
+
+
+class PartialFile(File):
+    """
+    The partial file as a "temporary uploaded file": FileSystemStorage moves it instead of copying.
+    """
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def partial_path(upload):
+    return os.path.join(UPLOAD_SESSION_DIR, str(upload.pk))
+
+
+def content_name(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if not _EXTENSION.match(extension):
+        extension = ''
+    return 'files/sha256/{0}/{1}/{2}{3}'.format(digest[:2], digest[2:4], digest, extension)
+
+
+def get_storage():
+    from .models import Task
+    return Task._meta.get_field('file').storage
+
+
+# Running hashes of the sessions uploaded through this process: {session id: (offset, hasher)}.
+# Another process (or a restart) hashes the partial file again, once.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _pop_hasher(upload):
+    with _hashers_lock:
+        offset, hasher = _hashers.pop(upload.pk, (None, None))
+    if offset == upload.received:
+        return hasher
+
+    hasher = hashlib.sha256()
+    remaining = upload.received
+    if remaining:
+        with open(partial_path(upload), 'rb') as f:
+            while remaining:
+                data = f.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise UploadError("Arquivo parcial perdido, reinicie o envio.", status.HTTP_409_CONFLICT)
+                hasher.update(data)
+                remaining -= len(data)
+    return hasher
+
+
+def _keep_hasher(upload, hasher):
+    with _hashers_lock:
+        _hashers[upload.pk] = (upload.received, hasher)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def parse_content_range(header, size):
+    """
+    (start, end) of a "bytes <start>-<end>/<size>" header, end included.
+    """
+    match = _CONTENT_RANGE.match(header or '')
+    if not match:
+        raise UploadError('Cabeçalho Content-Range inválido, use "bytes <início>-<fim>/<tamanho>".')
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or start > end or end >= size:
+        raise UploadError("Intervalo fora do arquivo de {0} bytes.".format(size),
+                          status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+    return start, end
+
+
+def append_chunk(upload, content_range, stream):
+    """
+    Appends the chunk read from `stream` to the session's partial file. The chunk must start at the
+    session's offset: retried chunks and gaps are refused, with the offset to resume from.
+    Call it with the session row locked (select_for_update).
+    """
+    start, end = parse_content_range(content_range, upload.size)
+    if start != upload.received:
+        raise UploadError("O envio deve continuar do byte {0}.".format(upload.received), status.HTTP_409_CONFLICT,
+                          received=upload.received)
+    length = end - start + 1
+    if length > UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError("Envie partes de até {0} bytes.".format(UPLOAD_CHUNK_MAX_SIZE),
+                          status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    if stream is None:
+        raise UploadError("Parte vazia.")
+
+    hasher = _pop_hasher(upload)
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+    path = partial_path(upload)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        # Drops what an interrupted request wrote past the offset
+        f.truncate(upload.received)
+        f.seek(upload.received)
+        remaining = length
+        while remaining:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                raise UploadError("A parte tem menos bytes que o intervalo informado.", received=upload.received)
+            f.write(data)
+            hasher.update(data)
+            remaining -= len(data)
+        if stream.read(1):
+            raise UploadError("A parte tem mais bytes que o intervalo informado.", received=upload.received)
+
+    upload.received = end + 1
+    upload.save(update_fields=['received'])
+    _keep_hasher(upload, hasher)
+
+
+def complete(upload):
+    """
+    Moves the uploaded file into the content addressed storage, unless a file with the same content (and
+    extension) is already there, and records its name in the session.
+    """
+    if upload.received != upload.size:
+        raise UploadError("Envio incompleto: {0} de {1} bytes recebidos.".format(upload.received, upload.size),
+                          status.HTTP_409_CONFLICT, received=upload.received)
+
+    digest = _pop_hasher(upload).hexdigest()
+    if upload.sha256 and upload.sha256 != digest:
+        discard(upload)
+        upload.received = 0
+        upload.save(update_fields=['received'])
+        raise UploadError("O SHA-256 do arquivo recebido não confere, reinicie o envio.", received=0)
+
+    storage = get_storage()
+    name = content_name(digest, upload.filename)
+    path = partial_path(upload)
+    if not storage.exists(name):
+        with open(path, 'rb') as f:
+            name = storage.save(name, PartialFile(f, name=path))
+    discard(upload)
+
+    upload.sha256 = digest
+    upload.file.name = name
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['sha256', 'file', 'completed_at'])
+
+
+def discard(upload):
+    """
+    Deletes the partial file of the session.
+    """
+    with _hashers_lock:
+        _hashers.pop(upload.pk, None)
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
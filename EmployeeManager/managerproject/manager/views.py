@@ -1,19 +1,29 @@
 from rest_framework import permissions, viewsets, views, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
-from django.shortcuts import render
-from django.core.mail import send_mail
+from rest_framework.authentication import SessionAuthentication
+from django.shortcuts import render, get_object_or_404
+from django.http import Http404
+from django.core.files.storage import default_storage
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.models import Group
-from django.db.models import Q
 from django.db import transaction
+from django.utils import timezone
 
-from .models import Employee, Task, Project, Departament, Job, Client, LostPassword
+from .models import Employee, Task, Project, Departament, Job, Client, LostPassword, OutgoingEmail, ProjectHours,\
+    EmployeeHours, DepartmentHours, UploadSession, bulk_create_tasks, bulk_update_tasks
 from .serializers import SessionUserSerializer, EmployeeSerializer, TaskSerializer, ProjectSerializer, DepartmentSerializer, JobSerializer,\
-    ClientSerializer, EditEmployeeSerializer, ChangePasswordSerializer, ContactSerializer, DeviceTokenSerializer
-from .permissions import IsTaskOwnerOrReadOnly, IsStaffOrReadOnly
+    ClientSerializer, EditEmployeeSerializer, ChangePasswordSerializer, ContactSerializer, DeviceTokenSerializer,\
+    WorkingHoursSerializer, SearchResultSerializer, BulkTaskSerializer, BulkTaskStatusSerializer, UploadSessionSerializer,\
+    DashboardSerializer
+from .permissions import IsTaskOwnerOrReadOnly, IsStaffOrReadOnly, get_permission_context
+from .pagination import KeysetPagination
+from .caching import VersionedCacheMixin
+from .replicas import ReplicaReadMixin
+from .authentication import CachedTokenAuthentication
+from . import dashboard, hashing, media, search, sync, uploads
 
 
 # CustomObtainAuthToken (Login authentication)
@@ -37,12 +47,13 @@ class CustomObtainAuthToken(ObtainAuthToken):
 
 
 # ModelViewSet
-class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
+class EmployeeViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     This viewset (ReadOnlyModelViewSet) automatically provides 'list' and 'retrieve' actions.
     """
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
+    ordering = ('first_name', 'id')
 
     def get_queryset(self):
         """
@@ -59,26 +70,25 @@ class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     This viewset (ModelViewSet) automatically provides 'list', 'create', 'retrieve', 'update' and 'destroy' actions.
     """
+    replica_actions = ('list',)
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
+    # A non-numeric pk is a 404 (instead of a ValueError in the hours action's filter)
+    lookup_value_regex = r'\d+'
     permission_classes = (permissions.IsAuthenticated, IsStaffOrReadOnly)
+    ordering = ('title', 'id')
 
     def get_queryset(self):
         """
         Restricts the returned projects,
         by filtering against the user.
         """
-        queryset = Project.objects.all()
-        if self.request.user.is_staff:
-            # SELECT * from project WHERE tem__id = request.user.id OR team__manager = request.user
-            return queryset.filter(Q(team__id=self.request.user.id) | Q(team__manager=self.request.user)).distinct()
-            # return queryset.filter(team__manager=self.request.user).distinct()
-
-        return queryset.filter(team__id=self.request.user.id)
+        queryset = ProjectSerializer.setup_eager_loading(Project.objects.all())
+        return queryset.visible_to(self.request.user)
 
     def perform_create(self, serializer):
         if self.request.user.is_staff:
@@ -90,14 +100,28 @@ class ProjectViewSet(viewsets.ModelViewSet):
         else:
             serializer.save()
 
+    @action(detail=True)
+    def hours(self, request, pk=None):
+        """
+        Working hours and task count of the project, read from its rollup row.
+        """
+        rollup = ProjectHours.objects.filter(project__in=self.get_queryset().filter(pk=pk)).first()
+        if rollup is None:
+            # No tasks yet, or the project isn't visible to the user
+            get_object_or_404(self.get_queryset().order_by(), pk=pk)
+            rollup = ProjectHours()
+        return Response(WorkingHoursSerializer(rollup).data)
+
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     This viewset (ModelViewSet) automatically provides 'list', 'create', 'retrieve', 'update' and 'destroy' actions.
     """
+    replica_actions = ('list',)
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = (permissions.IsAuthenticated, IsTaskOwnerOrReadOnly,)
+    ordering = ('priority', 'due_date', 'id')
 
     def get_queryset(self):
         """
@@ -112,11 +136,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         #         # SELECT * from task WHERE employee = request.user OR employee__manager = request.user
         #         return queryset.filter(Q(employee=self.request.user) | Q(employee__manager=self.request.user))
 
-        if self.request.user.is_staff:
-            # SELECT * from task WHERE employee = request.user OR employee__manager = request.user
-            return queryset.filter(Q(employee=self.request.user) | Q(employee__manager=self.request.user))
-
-        return queryset.filter(employee=self.request.user)
+        return TaskSerializer.setup_eager_loading(queryset).visible_to(self.request.user)
 
     def perform_create(self, serializer):
         if self.request.user.category == 'Employee':
@@ -124,29 +144,184 @@ class TaskViewSet(viewsets.ModelViewSet):
         else:
             serializer.save()
 
+    # Bulk endpoints: the tasks are loaded with one scoped query and checked against the request's permission
+    # context, the valid items are written together (bulk_create/bulk_update) in one transaction and each item
+    # gets its own result.
+    BULK_MAX_ITEMS = 500
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        Creates (POST) or updates (PATCH, every item with its "id") a list of tasks.
+        Answers 201/200 when every item succeeded, 207 otherwise, with one result per item, in order.
+        """
+        items = request.data
+        if not isinstance(items, list) or not 0 < len(items) <= self.BULK_MAX_ITEMS or \
+                not all(isinstance(item, dict) for item in items):
+            return Response({'detail': 'Envie uma lista de 1 a {} tarefas.'.format(self.BULK_MAX_ITEMS)},
+                            status.HTTP_400_BAD_REQUEST)
+
+        context = self.get_serializer_context()
+        context['preloaded'] = self.preload_related(items)
+        if request.method == 'POST':
+            results, success_status = self.create_tasks(items, context), status.HTTP_201_CREATED
+        else:
+            results, success_status = self.update_tasks(items, context), status.HTTP_200_OK
+        failed = any(result['status'] >= 400 for result in results)
+        return Response({'results': results}, status.HTTP_207_MULTI_STATUS if failed else success_status)
+
+    @staticmethod
+    def preload_related(items):
+        """
+        Loads the projects and employees referenced by the items, one query each.
+        """
+        def ids(field):
+            return {int(item[field]) for item in items if str(item.get(field, '')).isdigit()}
+
+        return {
+            Project: Project.objects.only('id', 'title').in_bulk(ids('project_id')),
+            Employee: Employee.objects.only('id').in_bulk(ids('employee_id')),
+        }
+
+    def create_tasks(self, items, context):
+        results = []
+        tasks = []
+        for index, item in enumerate(items):
+            serializer = BulkTaskSerializer(data=item, context=context)
+            if not serializer.is_valid():
+                results.append({'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors})
+                continue
+            data = serializer.validated_data
+            if self.request.user.category == 'Employee':
+                data['employee'] = self.request.user
+            task = Task(**data)
+            tasks.append(task)
+            results.append({'index': index, 'status': status.HTTP_201_CREATED, 'task': task})
+
+        if tasks:
+            bulk_create_tasks(tasks)
+        for result in results:
+            if 'task' in result:
+                result['data'] = BulkTaskSerializer(result.pop('task'), context=context).data
+        return results
+
+    def update_tasks(self, items, context):
+        ids = {int(item['id']) for item in items if str(item.get('id', '')).isdigit()}
+        results = []
+        fields = set()
+        old_values = {}
+        permission_context = get_permission_context(self.request)
+        with transaction.atomic():
+            tasks = Task.objects.visible_to(self.request.user).filter(pk__in=ids).select_related('project')\
+                .select_for_update(of=('self',))
+            tasks = {task.pk: task for task in tasks}
+
+            for index, item in enumerate(items):
+                task = tasks.get(int(item['id'])) if str(item.get('id', '')).isdigit() else None
+                if task is None:
+                    results.append({'index': index, 'status': status.HTTP_404_NOT_FOUND,
+                                    'errors': {'detail': 'Não encontrado.'}})
+                    continue
+                if task.pk in old_values:
+                    results.append({'index': index, 'status': status.HTTP_400_BAD_REQUEST,
+                                    'errors': {'id': ['Tarefa repetida na lista.']}})
+                    continue
+                if not permission_context.can_update_task(task.employee_id):
+                    results.append({'index': index, 'status': status.HTTP_403_FORBIDDEN,
+                                    'errors': {'detail': 'Você não tem permissão para executar essa ação.'}})
+                    continue
+                serializer = BulkTaskSerializer(task, data=item, partial=True, context=context)
+                if not serializer.is_valid():
+                    results.append({'index': index, 'status': status.HTTP_400_BAD_REQUEST,
+                                    'errors': serializer.errors})
+                    continue
+                old_values[task.pk] = (task.project_id, task.employee_id, task.working_hours)
+                for attr, value in serializer.validated_data.items():
+                    setattr(task, attr, value)
+                    fields.add(attr)
+                results.append({'index': index, 'status': status.HTTP_200_OK, 'task': task})
+
+            updated = [tasks[pk] for pk in old_values]
+            if updated and fields:
+                bulk_update_tasks(updated, sorted(fields), old_values)
+
+        for result in results:
+            if 'task' in result:
+                result['data'] = BulkTaskSerializer(result.pop('task'), context=context).data
+        return results
+
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """
+        Moves a list of tasks ({"ids": [...], "status": "..."}) to the same status with one UPDATE.
+        Answers 200 when every task was updated, 207 otherwise, with one result per id.
+        """
+        serializer = BulkTaskStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        permission_context = get_permission_context(request)
+
+        with transaction.atomic():
+            rows = list(Task.objects.visible_to(request.user).filter(pk__in=ids).order_by().select_for_update(of=('self',))
+                        .values_list('id', 'employee_id'))
+            allowed = {pk for pk, employee_id in rows if permission_context.can_update_task(employee_id)}
+            found = {pk for pk, employee_id in rows}
+            Task.objects.filter(pk__in=allowed).update(status=serializer.validated_data['status'],
+                                                       updated_at=timezone.now())
+        dashboard.invalidate_dashboards(*(employee_id for pk, employee_id in rows if pk in allowed))
+
+        results = []
+        for pk in ids:
+            if pk in allowed:
+                results.append({'id': pk, 'status': status.HTTP_200_OK})
+            elif pk in found:
+                results.append({'id': pk, 'status': status.HTTP_403_FORBIDDEN,
+                                'errors': {'detail': 'Você não tem permissão para executar essa ação.'}})
+            else:
+                results.append({'id': pk, 'status': status.HTTP_404_NOT_FOUND,
+                                'errors': {'detail': 'Não encontrado.'}})
+        failed = any(result['status'] != status.HTTP_200_OK for result in results)
+        return Response({'results': results}, status.HTTP_207_MULTI_STATUS if failed else status.HTTP_200_OK)
+
 
-class DepartmentViewSet(viewsets.ReadOnlyModelViewSet):
+class DepartmentViewSet(ReplicaReadMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
        This viewset (ReadOnlyModelViewSet) automatically provides 'list' and 'retrieve' actions.
        """
     queryset = Departament.objects.all()
     serializer_class = DepartmentSerializer
+    ordering = ('title', 'id')
+    lookup_value_regex = r'\d+'
+
+    @action(detail=True)
+    def hours(self, request, pk=None):
+        """
+        Working hours and task count of the department's projects, read from its rollup row. Public to the
+        authenticated users, as the departments themselves: totals only, no project or employee.
+        """
+        rollup = DepartmentHours.objects.filter(department_id=pk).first()
+        if rollup is None:
+            get_object_or_404(Departament, pk=pk)
+            rollup = DepartmentHours()
+        return Response(WorkingHoursSerializer(rollup).data)
 
 
-class JobViewSet(viewsets.ReadOnlyModelViewSet):
+class JobViewSet(ReplicaReadMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
        This viewset (ReadOnlyModelViewSet) automatically provides 'list' and 'retrieve' actions.
        """
     queryset = Job.objects.all()
     serializer_class = JobSerializer
+    ordering = ('title', 'id')
 
 
-class ClientViewSet(viewsets.ReadOnlyModelViewSet):
+class ClientViewSet(ReplicaReadMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
        This viewset (ReadOnlyModelViewSet) automatically provides 'list' and 'retrieve' actions.
        """
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    ordering = ('name', 'id')
 
 
 class EmployeeListView(views.APIView):
@@ -155,15 +330,28 @@ class EmployeeListView(views.APIView):
     """
     serializer_class = EmployeeSerializer
     model = Employee
+    ordering = ('first_name', 'id')
 
     def get(self, request, format=None):
         employees = Employee.objects.all()
         manager_id = request.user.id
         # SELECT * from employee WHERE id = request.user.id OR manager = request.user
         # employees = employees.filter(Q(id=request.user.id) | Q(manager__id=manager_id))
-        employees = employees.filter(manager__id=manager_id)
-        serializer = EmployeeSerializer(employees, many=True)
-        return Response(serializer.data)
+        # ?depth=N also lists the employees managed by the user's reports, N levels down (depth=all: whole subtree)
+        depth = request.query_params.get('depth', '1')
+        if depth == '1':
+            employees = employees.filter(manager__id=manager_id)
+        elif depth == 'all':
+            employees = employees.subtree_of(request.user)
+        elif depth.isdigit() and int(depth) > 0:
+            employees = employees.subtree_of(request.user, depth=int(depth))
+        else:
+            return Response({'detail': 'Profundidade "{}" inválida.'.format(depth)}, status.HTTP_400_BAD_REQUEST)
+        employees = EmployeeSerializer.setup_eager_loading(employees)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(employees, request, view=self)
+        serializer = EmployeeSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         if request.user.category == 'Employee':
@@ -195,7 +383,7 @@ class EmployeeListView(views.APIView):
                 return Response(
                     {'detail': 'Cargo com id "{}" não encontrado.'.format(job_id)}, status.HTTP_400_BAD_REQUEST)
 
-            user.set_password(request.data['password'])
+            hashing.set_password(user, request.data['password'])
             user.save()
 
             group = Group.objects.get(name='Funcionários')
@@ -217,14 +405,14 @@ class EmployeeDetailView(views.APIView):
 
     def get_object(self, pk):
         try:
-            return Employee.objects.get(pk=pk)
+            return Employee.objects.select_related('department', 'job').get(pk=pk)
         except Employee.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
     def get(self, request, pk, format=None):
         employee = self.get_object(pk)
 
-        if employee == request.user or employee.manager == request.user:
+        if employee == request.user or employee.manager_id == request.user.id:
             serializer = EmployeeSerializer(employee)
             return Response(serializer.data)
 
@@ -248,6 +436,171 @@ class EmployeeDetailView(views.APIView):
         return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
 
+class EmployeeHoursView(views.APIView):
+    """
+    Retrieve the working hours and task count of a user (the user itself or its manager).
+    """
+
+    def get(self, request, pk, format=None):
+        rollup = EmployeeHours.objects.select_related('employee').filter(employee_id=pk).first()
+        employee = rollup.employee if rollup is not None else get_object_or_404(Employee, pk=pk)
+
+        if employee == request.user or employee.manager_id == request.user.id:
+            return Response(WorkingHoursSerializer(rollup or EmployeeHours()).data)
+
+        return Response({'detail': 'Você não tem permissão para executar essa ação.'}, status.HTTP_401_UNAUTHORIZED)
+
+
+# Search
+class SearchView(views.APIView):
+    """
+    An endpoint for ranked full-text search over tasks, projects and clients visible to the user.
+    Query parameters: q (text), type (e.g. "task,project"; all by default) and limit (default 20, max 100).
+    """
+
+    def get(self, request, format=None):
+        text = request.query_params.get('q', '')
+        names = request.query_params.get('type')
+        kinds = search.KINDS
+        if names:
+            try:
+                kinds = [search.KINDS_BY_NAME[name] for name in names.split(',')]
+            except KeyError as e:
+                return Response({'detail': 'Tipo "{}" inválido.'.format(e.args[0])}, status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({'detail': 'Limite inválido.'}, status.HTTP_400_BAD_REQUEST)
+
+        results = search.search(request.user, text, kinds, limit)
+        return Response({'results': SearchResultSerializer(results, many=True).data})
+
+
+# Dashboard
+class DashboardView(views.APIView):
+    """
+    The numbers of the app home screen for the user: task counts by status and priority, overdue tasks,
+    hours of this week's tasks and project counts by status.
+    """
+
+    def get(self, request, format=None):
+        return Response(DashboardSerializer(dashboard.get_dashboard(request.user)).data)
+
+
+# Sync
+class SyncView(views.APIView):
+    """
+    An endpoint for the mobile app to sync its tasks and projects: send the token of the previous response
+    as ?since=<token>. Without a token (or with an expired one) everything is returned, with "reset": true.
+    """
+
+    def get(self, request, format=None):
+        issued_at = timezone.now()
+        since = None
+        token = request.query_params.get('since')
+        if token:
+            try:
+                since = sync.read_token(request.user, token)
+            except sync.InvalidSyncToken:
+                return Response({'detail': 'Token de sincronização inválido.'}, status.HTTP_400_BAD_REQUEST)
+
+        tasks, projects, deleted = sync.changes_since(request.user, since)
+        context = {'request': request}
+        return Response({
+            'token': sync.make_token(request.user, issued_at),
+            'reset': since is None,
+            'tasks': TaskSerializer(tasks, many=True, context=context).data,
+            'projects': ProjectSerializer(projects, many=True, context=context).data,
+            'deleted': deleted,
+        })
+
+
+# Uploads
+class UploadSessionView(views.APIView):
+    """
+    An endpoint for starting a resumable upload of a project or task file: {"filename", "size"[, "sha256"]}.
+    """
+
+    def post(self, request, format=None):
+        serializer = UploadSessionSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save(employee=request.user)
+        return Response(serializer.data, status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(views.APIView):
+    """
+    An endpoint for an upload session of the user. GET returns it, with the offset to resume from ("received");
+    PUT appends a chunk, sent as the raw body with a "Content-Range: bytes <start>-<end>/<size>" header;
+    DELETE cancels the upload.
+    """
+
+    def get_object(self, pk, lock=False):
+        queryset = UploadSession.objects.filter(employee=self.request.user)
+        if lock:
+            queryset = queryset.select_for_update()
+        return get_object_or_404(queryset, pk=pk)
+
+    def get(self, request, pk, format=None):
+        return Response(UploadSessionSerializer(self.get_object(pk), context={'request': request}).data)
+
+    def put(self, request, pk, format=None):
+        with transaction.atomic():
+            upload = self.get_object(pk, lock=True)
+            if upload.is_complete:
+                return Response({'detail': 'Envio já concluído.'}, status.HTTP_409_CONFLICT)
+            try:
+                # The body is streamed to the partial file, never read into request.data
+                uploads.append_chunk(upload, request.META.get('HTTP_CONTENT_RANGE'), request.stream)
+            except uploads.UploadError as e:
+                return Response(e.data, e.status)
+        return Response(UploadSessionSerializer(upload, context={'request': request}).data)
+
+    def delete(self, request, pk, format=None):
+        upload = self.get_object(pk)
+        if not upload.is_complete:
+            uploads.discard(upload)
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(UploadSessionDetailView):
+    """
+    An endpoint for completing an upload session: the file is stored (once per content) and its "id" can be
+    sent as the "upload_id" of a project or task.
+    """
+    http_method_names = ['post', 'options']
+
+    def post(self, request, pk, format=None):
+        with transaction.atomic():
+            upload = self.get_object(pk, lock=True)
+            if not upload.is_complete:
+                try:
+                    uploads.complete(upload)
+                except uploads.UploadError as e:
+                    return Response(e.data, e.status)
+        return Response(UploadSessionSerializer(upload, context={'request': request}).data)
+
+
+# Media
+class MediaView(views.APIView):
+    """
+    An endpoint for the uploaded files (MEDIA_URL): a file is only sent to the users who can see a project,
+    task or employee that references it, by the front proxy when configured (see media.py).
+    """
+    # Session authentication too, for the files linked from the admin
+    authentication_classes = (CachedTokenAuthentication, SessionAuthentication)
+
+    def perform_content_negotiation(self, request, force=False):
+        # Files are sent whatever the Accept header (e.g. "image/*") says
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, name, format=None):
+        if not media.is_accessible(request.user, name) or not default_storage.exists(name):
+            raise Http404
+        return media.serve(request, default_storage, name)
+
+
 # Change password
 class ChangePasswordView(views.APIView):
     """
@@ -266,12 +619,13 @@ class ChangePasswordView(views.APIView):
         if serializer.is_valid(raise_exception=True):
             # Check old password
             old_password = serializer.data.get("old_password")
-            if not self.object.check_password(old_password):
+            if not hashing.check_password(self.object, old_password):
                 return Response({"old_password": ["Senha incorreta."]}, status.HTTP_400_BAD_REQUEST)
-            # set_password also hashes the password that the user will get
+            # set_password also hashes the password that the user will get (in the hashing pool)
             new_password = serializer.data.get("new_password")
-            self.object.set_password(new_password)
-            self.object.save()
+            hashing.set_password(self.object, new_password)
+            # request.user may come from the token cache: write only the password
+            self.object.save(update_fields=['password'])
 
             return Response({"Success": True}, status.HTTP_200_OK)
 
@@ -309,19 +663,14 @@ class RecoverPasswordView(views.APIView):
                                    email=user.email,
                                    link='http://localhost:8000/api/v1/reset-password/' + lost_password.hash)
                                    # link='https://empresatop10.com.br/api/v1/reset-password/' + lost_password.hash)
-            try:
-                send_mail(
-                    '{app_name} - Solicitação de alteração de senha'.format(app_name=app_name),
-                    '',
-                    '{app_server_email}'.format(app_server_email=app_server_email),
-                    [user.email],
-                    fail_silently=False,
-                    html_message=body_mail,
-                )
-
-            except Exception as e:
-                return Response({"email_sent": False, "message:": repr(e)},
-                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # Delivered by the send_queued_mail command, so the transaction doesn't wait for SMTP
+            OutgoingEmail.objects.queue(
+                '{app_name} - Solicitação de alteração de senha'.format(app_name=app_name),
+                '',
+                '{app_server_email}'.format(app_server_email=app_server_email),
+                [user.email],
+                html_message=body_mail,
+            )
 
         return Response({'detail': 'Verifique seu e-mail.'}, status.HTTP_200_OK)
 
@@ -341,7 +690,7 @@ def reset_password(request, hash, *args, **kwargs):
             if new_password and (new_password == confirm_new_password):
                 if len(new_password) >= 8:
                     try:
-                        lost_password.user.set_password(new_password)
+                        hashing.set_password(lost_password.user, new_password)
                         lost_password.user.save()
                         update_session_auth_hash(request, lost_password.user)
                         success = True
@@ -385,7 +734,8 @@ class PushNotificationDeviceTokenView(views.APIView):
         if serializer.is_valid(raise_exception=True):
             device_token = serializer.data.get('token')
             self.object.device_token = device_token
-            self.object.save()
+            # request.user may come from the token cache: write only the device token
+            self.object.save(update_fields=['device_token'])
 
             return Response({'detail': 'Token enviado com sucesso'}, status.HTTP_200_OK)
 
@@ -424,18 +774,13 @@ class ContactView(views.APIView):
                                        sender_email=user.email,
                                        subject=subject,
                                        message=message)
-            try:
-                send_mail(
-                    '{app_name} - Mensagem do usuário'.format(app_name=app_name),
-                    '',
-                    '{app_server_email}'.format(app_server_email=app_server_email),
-                    ['{app_contact_email}'.format(app_contact_email=app_contact_email)],
-                    fail_silently=False,
-                    html_message=body_mail,
-                )
-
-            except Exception as e:
-                return Response({"email_sent": False, "message:": repr(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            OutgoingEmail.objects.queue(
+                '{app_name} - Mensagem do usuário'.format(app_name=app_name),
+                '',
+                '{app_server_email}'.format(app_server_email=app_server_email),
+                ['{app_contact_email}'.format(app_contact_email=app_contact_email)],
+                html_message=body_mail,
+            )
 
             return Response({'detail': 'Mensagem enviada com sucesso'}, status.HTTP_200_OK)
 
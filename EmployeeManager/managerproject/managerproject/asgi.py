@@ -0,0 +1,30 @@
+"""
+ASGI config for managerproject project.
+
+It exposes the ASGI callable as a module-level variable named ``application``, served alongside the WSGI
+one (e.g. `uvicorn managerproject.asgi:application`): the server's event loop holds the idle and slow
+client connections, so a process serves many concurrent mobile clients.
+
+Django 2.2 has neither an ASGI handler nor async views or ORM (they come with Django 3.0, 3.1 and 4.1).
+The hot read endpoints (task, project and employee lists) have async variants (manager.async_views),
+whose views run in parallel on the threads of the event loop's default executor; the rest of the Django
+application runs behind asgiref's WsgiToAsgi adapter, one request at a time. The benchmark_asgi command
+compares both modes.
+Requires asgiref 3.3+: pip install "asgiref>=3.3"
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "managerproject.settings")
+
+wsgi_application = get_wsgi_application()
+
+try:
+    from manager.async_views import AsyncReadHandler
+except ImportError:
+    raise ImproperlyConfigured("The ASGI application requires asgiref 3.3+: pip install \"asgiref>=3.3\"")
+
+application = AsyncReadHandler(wsgi_application)
@@ -12,8 +12,19 @@ DATABASES = {
         'PASSWORD': 'MyApp123456',
         'HOST': '127.0.0.1',
         'PORT': '',
-    }
+    },
+    # Streaming replica of "default"
+    'replica': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': 'myappmanagerproduction',
+        'USER': 'myappmanager',
+        'PASSWORD': 'MyApp123456',
+        'HOST': '127.0.0.1',
+        'PORT': '5433',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_REPLICAS = ['replica']
 
 # MEDIA_ROOT = '/storage/'
 # MEDIA_URL = 'http://127.0.0.1:8000/'
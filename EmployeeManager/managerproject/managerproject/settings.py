@@ -48,11 +48,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it also counts the queries of the other middleware (sessions, authentication)
+    'manager.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'manager.replicas.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,9 +90,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # The same file, to try the replica router locally (add it to DATABASE_REPLICAS); a separate database in tests
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
 }
 
+# Read replicas (manager.replicas): aliases the read-only API actions read from, and how long a user
+# reads from "default" after writing something
+DATABASE_ROUTERS = ['manager.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5  # more than the replication lag
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -109,6 +123,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing in a process pool (manager.hashing); size it with the benchmark_hashers command
+AUTHENTICATION_BACKENDS = ['manager.hashing.PooledModelBackend']
+PASSWORD_HASH_WORKERS = 2  # processes per app process; 0 hashes inline
+PASSWORD_HASH_MAX_PENDING = 8  # hashes queued or running per app process before answering 503
+PASSWORD_HASH_TIMEOUT = 10  # seconds
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.0/topics/i18n/
@@ -140,15 +160,48 @@ AUTH_USER_MODEL = "manager.Employee"
 # http://www.django-rest-framework.org
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'manager.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    # 'PAGE_SIZE': 10
+    'DEFAULT_PAGINATION_CLASS': 'manager.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
+# Token authentication cache (manager.authentication.TokenCache)
+TOKEN_CACHE_MAX_SIZE = 1024  # tokens kept in each process' LRU
+TOKEN_CACHE_LOCAL_TIMEOUT = 10  # seconds; bounds how long other processes may serve an invalidated token
+TOKEN_CACHE_TIMEOUT = 300  # seconds in the shared Django cache
+
+# Managed employee ids of each user, for the permission checks (manager.permissions.PermissionContext)
+PERMISSION_CACHE_TIMEOUT = 300  # seconds; also invalidated when an employee's manager changes
+
+# Personal dashboard of each user (manager.dashboard)
+DASHBOARD_CACHE_TIMEOUT = 300  # seconds; also invalidated when the user's tasks change
+
+# Query instrumentation (manager.middleware.QueryInstrumentationMiddleware); budgets are in manager/urls.py
+DUPLICATE_QUERY_THRESHOLD = 3  # a query run this many times in one request is logged as a probable N+1
+# Raise instead of logging the requests over budget; the test runner turns it on, so the tests fail on them
+QUERY_BUDGET_STRICT = False
+TEST_RUNNER = 'manager.runner.QueryBudgetTestRunner'
+
+# Profile photo variants (manager.thumbnails), generated in a background thread pool
+PROFILE_PHOTO_SIZES = (64, 128, 512)  # square sizes, in pixels, each saved as WebP and JPEG
+THUMBNAIL_WORKERS = 2  # threads per process; Pillow releases the GIL while resizing and encoding
+
+# Resumable uploads of project and task files (manager.uploads)
+UPLOAD_SESSION_DIR = os.path.join(BASE_DIR, 'uploads')  # partial files; must be shared by every app server
+UPLOAD_MAX_SIZE = 1024 ** 3  # bytes per file
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 ** 2  # bytes per PUT
+UPLOAD_SESSION_HOURS = 24  # prune_upload_sessions deletes older sessions
+
+# Media delivery (manager.media): files are sent after the permission checks by the front proxy,
+# 'x-accel-redirect' (nginx: an "internal" location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or
+# 'x-sendfile' (Apache mod_xsendfile); None streams them from Python, with Range and conditional requests.
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 # E-mail
 # https://docs.djangoproject.com/en/2.0/topics/email/
 
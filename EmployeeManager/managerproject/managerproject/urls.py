@@ -16,10 +16,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from django.conf import settings
-from django.conf.urls.static import static
-
+# MEDIA_URL is served by manager.views.MediaView, which checks the user's permissions
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('manager.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]